@@ -0,0 +1,298 @@
+"""
+配信結果の列指向キャッシュ（レポート・成果管理用）
+
+campaign_results をプロセス内に pandas の型付きカラム（プラットフォーム・カテゴリー・
+台本タイトルなどはカテゴリー型）で保持し、絞り込み・集計・グラフ用の集計をメモリ上で行います。
+
+- 追加分だけを読み込む: data_versions の増分が新しい行数と一致すれば追加のみとみなし、
+  最大ID（rowid）より後の行だけを読み込む。更新・削除があれば全体を読み直す。
+- 集計結果もデータのバージョンをキーにして保持し、メモリ使用量の上限を超えたら
+  最も長く使われていないものから破棄する（LRU）。
+"""
+import sys
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+RESULT_COLUMNS = [
+    'id', 'script_id', 'script_type', 'category_id', 'platform',
+    'ctr', 'cpc', 'mcvr', 'mcpa', 'cvr', 'cpa', 'spend_amount',
+    'impressions', 'clicks', 'conversions', 'campaign_period_start', 'campaign_period_end',
+    'is_good_performance', 'performance_score', 'created_at',
+]
+
+RESULT_QUERY = '''
+    SELECT cr.id, cr.script_id, cr.script_type, cr.category_id, cr.platform,
+           cr.ctr, cr.cpc, cr.mcvr, cr.mcpa, cr.cvr, cr.cpa, cr.spend_amount,
+           cr.impressions, cr.clicks, cr.conversions, cr.campaign_period_start, cr.campaign_period_end,
+           cr.is_good_performance, cr.performance_score, cr.created_at,
+           CASE
+               WHEN cr.script_type = 'effective' THEN es.title
+               WHEN cr.script_type = 'generated' THEN gs.title
+               ELSE 'タイトル不明'
+           END AS script_title
+    FROM campaign_results cr
+    LEFT JOIN effective_scripts es ON cr.script_id = es.id AND cr.script_type = 'effective'
+    LEFT JOIN generated_scripts gs ON cr.script_id = gs.id AND cr.script_type = 'generated'
+    WHERE cr.id > ?
+    ORDER BY cr.id
+'''
+
+DTYPES = {
+    'id': 'int64',
+    'script_id': 'Int64',
+    'script_type': 'category',
+    'category_id': 'category',
+    'platform': 'category',
+    'ctr': 'float64', 'cpc': 'float64', 'mcvr': 'float64',
+    'mcpa': 'float64', 'cvr': 'float64', 'cpa': 'float64',
+    'spend_amount': 'float64',
+    'impressions': 'Int64', 'clicks': 'Int64', 'conversions': 'Int64',
+    'is_good_performance': 'boolean',
+    'performance_score': 'float64',
+}
+
+# 値の種類が少ない文字列・IDのカラム（カテゴリー型で保持）
+CATEGORY_COLUMNS = ('script_type', 'category_id', 'platform', 'script_title',
+                    'campaign_period_start', 'campaign_period_end')
+
+# 再読み込みの判定に使うテーブル（タイトルは効果的台本の編集で変わる）
+VERSION_TABLES = ['campaign_results', 'effective_scripts']
+
+
+def _typed(frame):
+    """読み込んだ行を型付きカラムに変換"""
+    frame = frame.astype({column: dtype for column, dtype in DTYPES.items() if dtype != 'category'})
+    for column in CATEGORY_COLUMNS:
+        frame[column] = frame[column].astype('category')
+    frame['created_at'] = pd.to_datetime(frame['created_at'], errors='coerce')
+    return frame
+
+
+def _concat(base, new_rows):
+    """カテゴリー型を保ったまま追加行を結合（カテゴリーの種類は和集合にする）"""
+    if base is None or base.empty:
+        return new_rows
+    if new_rows.empty:
+        return base
+    base = base.copy()
+    new_rows = new_rows.copy()
+    for column in CATEGORY_COLUMNS:
+        union = base[column].cat.categories.union(new_rows[column].cat.categories)
+        base[column] = base[column].cat.set_categories(union)
+        new_rows[column] = new_rows[column].cat.set_categories(union)
+    return pd.concat([base, new_rows], ignore_index=True)
+
+
+def _size_of(value):
+    """キャッシュする値のおおよそのメモリ使用量（バイト）"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    return sys.getsizeof(value)
+
+
+class AnalyticsCache:
+    """配信結果の列指向キャッシュと集計結果のLRUキャッシュ（メモリ上限つき）"""
+
+    def __init__(self, memory_budget=128 * 1024 * 1024):
+        self.memory_budget = memory_budget
+        self.entries = OrderedDict()  # キー -> (値, バイト数)
+        self.bytes = 0
+        self.states = {}  # db_path -> {'versions', 'max_id'}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.appends = 0
+
+    # --- LRU ---
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, value):
+        self._pop(key)
+        size = _size_of(value)
+        self.entries[key] = (value, size)
+        self.bytes += size
+        self._evict(keep=key)
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+            if key[0] == 'results':
+                # 配信結果そのものを破棄した場合は次回に全体を読み直す
+                self.states.pop(key[1], None)
+
+    def _evict(self, keep=None):
+        """上限を超えている間、最も長く使われていないものから破棄（keep は残す）"""
+        for key in list(self.entries):
+            if self.bytes <= self.memory_budget:
+                break
+            if key != keep:
+                self._pop(key)
+
+    def _drop_stale_queries(self, db_path):
+        """データが変わった db_path の集計結果を破棄"""
+        for key in [key for key in self.entries if key[0] == 'query' and key[1] == db_path]:
+            self._pop(key)
+
+    def memory_usage(self):
+        return self.bytes
+
+    # --- 配信結果 ---
+    def results(self, db):
+        """最新の配信結果（型付きカラム）を取得。変更があれば追加分または全体を読み込む"""
+        key = ('results', db.db_path)
+        versions = db.get_data_versions(None, VERSION_TABLES)
+        state = self.states.get(db.db_path)
+        frame = self._get(key)
+
+        if frame is not None and state is not None and state['versions'] == versions:
+            return frame
+
+        conn = db.get_connection()
+        try:
+            appended_only = (
+                frame is not None and state is not None
+                and versions['effective_scripts'] == state['versions']['effective_scripts']
+            )
+            if appended_only:
+                new_rows = pd.read_sql_query(RESULT_QUERY, conn, params=(state['max_id'],))
+                # 変更回数と追加行数が一致する場合だけ追加のみとみなす（更新・削除があれば読み直す）
+                appended_only = versions['campaign_results'] - state['versions']['campaign_results'] == len(new_rows)
+            if appended_only:
+                frame = _concat(frame, _typed(new_rows))
+                self.appends += 1
+            else:
+                frame = _typed(pd.read_sql_query(RESULT_QUERY, conn, params=(0,)))
+                self.reloads += 1
+        finally:
+            conn.close()
+
+        self._drop_stale_queries(db.db_path)
+        self._put(key, frame)
+        max_id = int(frame['id'].max()) if not frame.empty else 0
+        self.states[db.db_path] = {'versions': versions, 'max_id': max_id}
+        return frame
+
+    def query(self, db, name, func, *args):
+        """
+        配信結果に対する集計 func(frame, *args) をバージョンごとに保持して返す
+        name と args はキャッシュのキーになる（ハッシュ可能な値）
+        """
+        frame = self.results(db)
+        key = ('query', db.db_path, name, args, tuple(self.states[db.db_path]['versions'].values()))
+        value = self._get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = func(frame, *args)
+        self._put(key, value)
+        return value
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.memory_usage(),
+            'budget': self.memory_budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'appends': self.appends,
+        }
+
+
+# --- 集計（AnalyticsCache.query に渡す関数） ---
+def filter_results(frame, category_id=None, platform=None, performance=None, category_ids=None):
+    """
+    配信結果の絞り込み（作成日時の新しい順）
+    performance: 'good'（良好のみ）/ 'poor'（要改善のみ）/ None
+    category_ids: 登録済みカテゴリーのID（それ以外のカテゴリーの結果は除く）
+    """
+    mask = pd.Series(True, index=frame.index)
+    if category_ids is not None:
+        mask &= frame['category_id'].isin(category_ids)
+    if category_id:
+        mask &= frame['category_id'] == category_id
+    if platform:
+        mask &= frame['platform'] == platform
+    if performance == 'good':
+        mask &= frame['is_good_performance'].fillna(False)
+    elif performance == 'poor':
+        mask &= ~frame['is_good_performance'].fillna(True)
+    return frame[mask].sort_values('created_at', ascending=False, kind='stable')
+
+
+def result_summary(frame, category_id=None):
+    """配信結果数・良好な結果数・良好率"""
+    if category_id:
+        frame = frame[frame['category_id'] == category_id]
+    total = len(frame)
+    good = int(frame['is_good_performance'].fillna(False).sum())
+    return {'total': total, 'good': good, 'good_rate': good / total * 100 if total else 0.0}
+
+
+def daily_performance(frame, category_id):
+    """日別の平均スコアと件数（グラフ用）"""
+    frame = frame[frame['category_id'] == category_id]
+    daily = (
+        frame.groupby(frame['created_at'].dt.normalize(), sort=True)
+        .agg(平均スコア=('performance_score', 'mean'), 件数=('id', 'size'))
+        .reset_index()
+        .rename(columns={'created_at': '日付'})
+    )
+    return daily
+
+
+if __name__ == "__main__":
+    # 簡易チェック: 追加・更新・削除でキャッシュが正しく更新されるか
+    import os
+    import tempfile
+
+    from database import DatabaseManager
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'check.db'))
+        category_id = db.add_product_category('チェック用', None)
+        cache = AnalyticsCache()
+
+        def add_result(score, good):
+            conn = db.get_connection()
+            conn.execute('''
+                INSERT INTO campaign_results (script_id, script_type, category_id, platform,
+                                              spend_amount, is_good_performance, performance_score)
+                VALUES (1, 'generated', ?, 'TikTok', 100000, ?, ?)
+            ''', (category_id, good, score))
+            conn.commit()
+            conn.close()
+
+        for i in range(5):
+            add_result(i * 0.5, i % 2 == 0)
+        assert len(cache.results(db)) == 5 and cache.reloads == 1
+
+        add_result(2.0, True)
+        assert len(cache.results(db)) == 6 and cache.appends == 1
+
+        conn = db.get_connection()
+        conn.execute('UPDATE campaign_results SET performance_score = 9.0 WHERE id = 1')
+        conn.execute('DELETE FROM campaign_results WHERE id = 2')
+        conn.commit()
+        conn.close()
+        frame = cache.results(db)
+        assert len(frame) == 5 and cache.reloads == 2 and frame['performance_score'].max() == 9.0
+
+        summary = cache.query(db, 'summary', result_summary, category_id)
+        assert cache.query(db, 'summary', result_summary, category_id) == summary and cache.hits == 1
+        assert len(cache.query(db, 'filter', filter_results, category_id, 'TikTok', 'good')) == summary['good']
+
+        started = time.perf_counter()
+        cache.query(db, 'daily', daily_performance, category_id)
+        print(f"✅ 列指向キャッシュのチェックが完了しました: {cache.stats()}（集計 {(time.perf_counter() - started) * 1000:.1f}ms）")
@@ -0,0 +1,272 @@
+"""
+データベースのオンラインバックアップ
+
+SQLiteのバックアップAPI（sqlite3.Connection.backup）で、アプリを止めずにデータベースを複製します。
+1ステップごとに決まったページ数だけ複製し、ステップの間は待機してロックを手放すため、
+営業時間中に実行してもアプリの書き込みをほとんど待たせません。
+（複製中に別の接続から書き込みがあると、SQLiteはバックアップを最初からやり直します）
+
+- 複製は一時ファイル（.partial）に書き込み、整合性チェック（PRAGMA quick_check）の後に名前を変える
+- 世代管理: 新しい順に --keep 件を残し、それより古いバックアップを削除する
+- 定期実行: --every 分ごとにバックアップを取り続ける
+- 復元: 現在のデータベースを退避したうえで、バックアップAPIでバックアップの内容を書き戻す
+- 所要時間・サイズ・ページ数を backup_log テーブルに記録する
+
+使用例:
+    python backup.py backup --backup-dir backups --keep 14
+    python backup.py backup --backup-dir backups --every 60
+    python backup.py list --backup-dir backups
+    python backup.py restore backups/ad_script_database-20260101-120000.db
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_PAGES_PER_STEP = 256  # 1ステップで複製するページ数（4KBページで約1MB）
+DEFAULT_STEP_SLEEP = 0.05  # ステップ間の待機（秒）
+BUSY_TIMEOUT = 5  # ロックを待つ最大秒数
+MAX_RESTARTS = 3  # 書き込みによるやり直しをこの回数まで許す
+
+
+def backup_name(db_path, when=None):
+    """バックアップファイル名（データベース名-日時.db）"""
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    return f"{base}-{(when or datetime.now()).strftime('%Y%m%d-%H%M%S')}.db"
+
+
+def list_backups(db_path, backup_dir):
+    """バックアップの一覧（新しい順）"""
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    paths = glob.glob(os.path.join(backup_dir, f'{base}-*.db'))
+    # 同じ秒の番号つき（-1.db など）が後になるよう、拡張子を除いた名前で並べる
+    return sorted(paths, key=lambda path: os.path.splitext(os.path.basename(path))[0], reverse=True)
+
+
+class _Restarted(Exception):
+    """複製中の書き込みでバックアップが最初からやり直しになった"""
+
+
+def _copy(source, target, pages, step_sleep, max_restarts=MAX_RESTARTS):
+    """
+    source の内容を target に少しずつ複製し、{'pages', 'steps', 'restarts', 'single_step'} を返す
+
+    WALモードでは読み込みトランザクションを開いたまま複製する（書き込みを止めずに同じ時点の内容を複製でき、やり直しも起きない）。
+    それ以外では書き込みのたびにやり直しになるため、max_restarts 回を超えたら残りを1ステップでまとめて複製する。
+    """
+    progress = {'pages': 0, 'steps': 0, 'restarts': 0, 'single_step': False}
+    last_remaining = [None]
+
+    def on_progress(status, remaining, total):
+        progress['steps'] += 1
+        progress['pages'] = total
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            progress['restarts'] += 1
+            if progress['restarts'] > max_restarts:
+                raise _Restarted()
+        last_remaining[0] = remaining
+        if remaining and step_sleep:
+            # ステップの間はロックを持たないため、ここで待つ間にアプリが書き込める
+            time.sleep(step_sleep)
+
+    wal = source.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+    if wal:
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+    try:
+        # sleep はロック中（BUSY/LOCKED）で再試行するまでの待機
+        source.backup(target, pages=pages, progress=on_progress, sleep=max(step_sleep, 0.01))
+    except _Restarted:
+        progress['single_step'] = True
+        source.backup(target, pages=-1)
+        progress['steps'] += 1
+    finally:
+        if wal:
+            source.execute('COMMIT')
+    return progress
+
+
+def _check_integrity(path):
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"バックアップが見つかりません: {path}")
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f"整合性チェックに失敗しました: {result}")
+
+
+def _progress_message(progress):
+    if progress['single_step']:
+        return f"書き込みが続いたため、{progress['restarts']}回のやり直しの後に残りを一括で複製しました"
+    if progress['restarts']:
+        return f"書き込みにより{progress['restarts']}回やり直しました"
+    return None
+
+
+def record(db_path, operation, status, backup_path=None, duration=None, size=None,
+           pages=None, steps=None, message=None):
+    """バックアップ・復元の結果を backup_log に記録（記録できなくても処理は続ける）"""
+    try:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+        conn.execute('''
+            INSERT INTO backup_log (operation, backup_path, status, duration_seconds, size_bytes, pages, steps, message)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (operation, backup_path, status, duration, size, pages, steps, message))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"⚠️ バックアップの記録に失敗しました: {str(e)}")
+
+
+def create_backup(db_path, backup_dir, pages=DEFAULT_PAGES_PER_STEP, step_sleep=DEFAULT_STEP_SLEEP):
+    """
+    オンラインバックアップを作成
+    戻り値: {'path', 'seconds', 'size', 'pages', 'steps', 'restarts', 'single_step'}
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, backup_name(db_path))
+    suffix = 1
+    while os.path.exists(path):
+        # 同じ秒に取ったバックアップは番号をつけて残す
+        path = os.path.join(backup_dir, f"{os.path.splitext(backup_name(db_path))[0]}-{suffix}.db")
+        suffix += 1
+    partial_path = path + '.partial'
+    started = time.perf_counter()
+
+    try:
+        source = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, timeout=BUSY_TIMEOUT, isolation_level=None)
+        target = sqlite3.connect(partial_path)
+        try:
+            progress = _copy(source, target, pages, step_sleep)
+            # WALモードの内容を複製しても、バックアップは1ファイルで完結させる
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+            source.close()
+        _check_integrity(partial_path)
+        os.replace(partial_path, path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        record(db_path, 'backup', 'failed', path, time.perf_counter() - started, message=str(e))
+        raise
+
+    summary = {
+        'path': path,
+        'seconds': time.perf_counter() - started,
+        'size': os.path.getsize(path),
+        **progress,
+    }
+    message = _progress_message(progress)
+    record(db_path, 'backup', 'ok', path, summary['seconds'], summary['size'], progress['pages'], progress['steps'], message)
+    print(f"✅ バックアップを作成しました: {path}"
+          f"（{summary['size'] / 1024 / 1024:.1f}MB、{progress['pages']}ページ、{progress['steps']}ステップ、{summary['seconds']:.2f}秒）")
+    if message:
+        print(f"⚠️ {message}")
+    return summary
+
+
+def prune_backups(db_path, backup_dir, keep):
+    """新しい順に keep 件を残して古いバックアップを削除し、削除したパスを返す"""
+    removed = list_backups(db_path, backup_dir)[max(keep, 1):]
+    for path in removed:
+        os.remove(path)
+    if removed:
+        print(f"🗑️ 古いバックアップを削除しました: {len(removed)}件")
+    return removed
+
+
+def restore_backup(backup_path, db_path, backup_dir=None, pages=DEFAULT_PAGES_PER_STEP, step_sleep=DEFAULT_STEP_SLEEP):
+    """
+    バックアップからデータベースを復元
+    ファイルを置き換えず、バックアップAPIで現在のデータベースに書き戻す（開いている接続もそのまま使える）
+    backup_dir を指定すると、復元前の状態をそこにバックアップしておく
+    """
+    _check_integrity(backup_path)
+    if backup_dir and os.path.exists(db_path):
+        create_backup(db_path, backup_dir, pages, step_sleep)
+
+    started = time.perf_counter()
+    source = sqlite3.connect(f'file:{backup_path}?mode=ro', uri=True, isolation_level=None)
+    target = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    try:
+        journal_mode = target.execute('PRAGMA journal_mode').fetchone()[0]
+        progress = _copy(source, target, pages, step_sleep)
+        # ジャーナルモードは復元前のデータベースに合わせる
+        target.execute(f'PRAGMA journal_mode = {journal_mode}')
+    finally:
+        target.close()
+        source.close()
+
+    elapsed = time.perf_counter() - started
+    record(db_path, 'restore', 'ok', backup_path, elapsed, os.path.getsize(db_path), progress['pages'], progress['steps'])
+    print(f"✅ バックアップから復元しました: {backup_path}（{progress['pages']}ページ、{elapsed:.2f}秒）")
+    return {'path': backup_path, 'seconds': elapsed, **progress}
+
+
+def run_scheduled(db_path, backup_dir, every_minutes, keep, pages, step_sleep, runs=None):
+    """every_minutes 分ごとにバックアップと世代管理を繰り返す（runs 回で終了、Noneなら止めるまで）"""
+    count = 0
+    while runs is None or count < runs:
+        started = time.monotonic()
+        try:
+            create_backup(db_path, backup_dir, pages, step_sleep)
+            prune_backups(db_path, backup_dir, keep)
+        except Exception as e:
+            # 一時的な失敗では止めず、次の予定時刻に再試行する
+            print(f"❌ バックアップに失敗しました: {str(e)}")
+        count += 1
+        if runs is not None and count >= runs:
+            break
+        time.sleep(max(0.0, every_minutes * 60 - (time.monotonic() - started)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLiteデータベースのオンラインバックアップ・復元')
+    parser.add_argument('--db-path', default='ad_script_database.db', help='データベースファイル')
+    parser.add_argument('--backup-dir', default='backups', help='バックアップの保存先')
+    parser.add_argument('--pages', type=int, default=DEFAULT_PAGES_PER_STEP, help='1ステップで複製するページ数')
+    parser.add_argument('--step-sleep', type=float, default=DEFAULT_STEP_SLEEP, help='ステップ間の待機（秒）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backup_parser = subparsers.add_parser('backup', help='バックアップを作成する')
+    backup_parser.add_argument('--keep', type=int, default=14, help='残すバックアップの件数')
+    backup_parser.add_argument('--every', type=float, help='指定した分ごとにバックアップを取り続ける')
+
+    subparsers.add_parser('list', help='バックアップの一覧を表示する')
+
+    restore_parser = subparsers.add_parser('restore', help='バックアップから復元する')
+    restore_parser.add_argument('backup_path', help='復元するバックアップファイル')
+    restore_parser.add_argument('--no-safety-backup', action='store_true', help='復元前の状態をバックアップしない')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'backup':
+            if args.every:
+                run_scheduled(args.db_path, args.backup_dir, args.every, args.keep, args.pages, args.step_sleep)
+            else:
+                create_backup(args.db_path, args.backup_dir, args.pages, args.step_sleep)
+                prune_backups(args.db_path, args.backup_dir, args.keep)
+        elif args.command == 'list':
+            backups = list_backups(args.db_path, args.backup_dir)
+            if not backups:
+                print("📭 バックアップはまだありません")
+            for path in backups:
+                print(f"- {os.path.basename(path)}（{os.path.getsize(path) / 1024 / 1024:.1f}MB）")
+        elif args.command == 'restore':
+            restore_backup(args.backup_path, args.db_path,
+                           None if args.no_safety_backup else args.backup_dir, args.pages, args.step_sleep)
+    except (sqlite3.Error, OSError) as e:
+        print(f"❌ {args.command} に失敗しました: {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
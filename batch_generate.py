@@ -0,0 +1,214 @@
+"""
+バッチ台本生成CLI
+
+CSV / JSONL のブリーフ（category, target_audience, platform, script_length）を読み込み、
+プロセスプールで並列に台本を生成して結果をJSONLへ逐次書き出します。
+出力JSONLがチェックポイントを兼ねるため、中断後に同じコマンドを再実行すると
+生成済みのブリーフはスキップされます。
+
+使用例:
+    python batch_generate.py briefs.csv --output results.jsonl --workers 4 --save-db
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from database import DatabaseManager
+from openai_integration import OpenAIIntegration
+
+BRIEF_FIELDS = ['category', 'target_audience', 'platform', 'script_length']
+
+# ワーカープロセスごとに1度だけ初期化するサービス
+_worker_db = None
+_worker_openai = None
+
+
+def load_briefs(path):
+    """CSVまたはJSONLからブリーフ一覧を読み込む"""
+    briefs = []
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    briefs.append(json.loads(line))
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            briefs = [dict(row) for row in csv.DictReader(f)]
+
+    # ブリーフキーを付与（同一内容のブリーフは出現順で区別する）
+    seen = Counter()
+    for brief in briefs:
+        if not brief.get('brief_id'):
+            base = json.dumps([str(brief.get(field, '')).strip() for field in BRIEF_FIELDS], ensure_ascii=False)
+            digest = hashlib.sha1(base.encode('utf-8')).hexdigest()[:16]
+            seen[digest] += 1
+            brief['brief_id'] = f"{digest}-{seen[digest]}"
+        brief['brief_id'] = str(brief['brief_id'])
+    return briefs
+
+
+def load_checkpoint(output_path):
+    """出力JSONLから生成済みブリーフのキーを取得"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断時に書きかけになった行は無視する
+                continue
+            if record.get('status') == 'ok':
+                completed.add(record['brief_id'])
+    return completed
+
+
+def resolve_category_ids(db, briefs):
+    """カテゴリー名をカテゴリーIDに変換"""
+    categories = db.get_product_categories()
+    by_name = {cat[1]: cat[0] for cat in categories}
+    by_id = {cat[0]: cat[1] for cat in categories}
+
+    for brief in briefs:
+        category = str(brief.get('category', '')).strip()
+        category_id = brief.get('category_id')
+        if category_id:
+            brief['category_id'] = int(category_id)
+            brief['category'] = by_id.get(brief['category_id'], category)
+        elif category in by_name:
+            brief['category_id'] = by_name[category]
+        else:
+            brief['category_id'] = None
+
+
+def _init_worker(db_path):
+    """ワーカープロセスの初期化"""
+    global _worker_db, _worker_openai
+    _worker_db = DatabaseManager(db_path)
+    _worker_openai = OpenAIIntegration(db_path)
+
+
+def _generate_one(brief, use_effective_scripts):
+    """1件のブリーフから台本を生成（ワーカープロセスで実行）"""
+    category_id = brief.get('category_id')
+    platform = brief.get('platform', '')
+
+    reference_scripts = []
+    if use_effective_scripts and category_id:
+        reference_scripts = _worker_db.get_effective_scripts(category_id, platform)
+
+    # generate_script はcategory_id指定時にNGワードのクリーンまで行う
+    script_data = _worker_openai.generate_script(
+        category=brief.get('category', ''),
+        target_audience=brief.get('target_audience', ''),
+        platform=platform,
+        script_length=brief.get('script_length', ''),
+        reference_scripts=reference_scripts,
+        category_id=category_id,
+        # 全ワーカーを1人の利用者として扱い、画面から生成する利用者の順番を妨げない
+        user_id='batch'
+    )
+    return script_data
+
+
+def run_batch(briefs_path, output_path, db_path='ad_script_database.db', workers=4,
+              save_db=False, use_effective_scripts=True):
+    """バッチ生成を実行"""
+    db = DatabaseManager(db_path)
+    briefs = load_briefs(briefs_path)
+    resolve_category_ids(db, briefs)
+
+    completed = load_checkpoint(output_path)
+    pending = [brief for brief in briefs if brief['brief_id'] not in completed]
+    print(f"📋 ブリーフ {len(briefs)}件（生成済み {len(briefs) - len(pending)}件、残り {len(pending)}件）")
+
+    if not pending:
+        return {'ok': 0, 'error': 0, 'skipped': len(briefs)}
+
+    stats = {'ok': 0, 'error': 0, 'skipped': len(briefs) - len(pending)}
+    max_in_flight = workers * 2
+
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_path,)) as executor:
+        queue = iter(pending)
+        in_flight = {}
+
+        def submit_next():
+            brief = next(queue, None)
+            if brief is None:
+                return False
+            future = executor.submit(_generate_one, brief, use_effective_scripts)
+            in_flight[future] = brief
+            return True
+
+        # 同時実行数を制限しながら投入する
+        for _ in range(max_in_flight):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                brief = in_flight.pop(future)
+                record = {
+                    'brief_id': brief['brief_id'],
+                    'brief': {field: brief.get(field) for field in BRIEF_FIELDS},
+                    'category_id': brief.get('category_id'),
+                    'generated_at': datetime.now().isoformat(timespec='seconds')
+                }
+                try:
+                    script_data = future.result()
+                    record['status'] = 'ok'
+                    record['script'] = script_data
+
+                    # DBへの書き込みはメインプロセスのみで行う
+                    if save_db and brief.get('category_id'):
+                        record['generated_script_id'] = db.add_generated_script(
+                            brief['category_id'], script_data, brief.get('platform', ''), 'バッチ生成'
+                        )
+                    stats['ok'] += 1
+                except Exception as e:
+                    record['status'] = 'error'
+                    record['error'] = str(e)
+                    stats['error'] += 1
+                    print(f"❌ ブリーフ {brief['brief_id']} の生成に失敗しました: {str(e)}")
+
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+                os.fsync(out.fileno())
+                submit_next()
+
+            print(f"⏳ 進捗: 成功 {stats['ok']}件 / 失敗 {stats['error']}件 / 残り {len(pending) - stats['ok'] - stats['error']}件")
+
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ブリーフ一覧から広告台本をバッチ生成します')
+    parser.add_argument('briefs', help='ブリーフファイル（.csv または .jsonl）')
+    parser.add_argument('--output', '-o', default='batch_results.jsonl', help='結果を書き出すJSONL（チェックポイントを兼ねる）')
+    parser.add_argument('--db-path', default='ad_script_database.db', help='データベースファイル')
+    parser.add_argument('--workers', '-w', type=int, default=4, help='並列実行するプロセス数')
+    parser.add_argument('--save-db', action='store_true', help='生成結果を generated_scripts にも保存する')
+    parser.add_argument('--no-reference', action='store_true', help='効果的台本を参考にしない')
+    args = parser.parse_args(argv)
+
+    stats = run_batch(
+        args.briefs, args.output, db_path=args.db_path, workers=max(1, args.workers),
+        save_db=args.save_db, use_effective_scripts=not args.no_reference
+    )
+    print(f"✅ バッチ生成が完了しました: 成功 {stats['ok']}件 / 失敗 {stats['error']}件 / スキップ {stats['skipped']}件")
+    return 0 if stats['error'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+保存済み台本のNGワードチェック（コンプライアンス再チェック）
+
+台本ごとに「どのNGワードまでチェック済みか」（NGワードIDの最大値）を compliance_index に記録し、
+NGワードが追加されたときは新しいワードだけを既存台本に対してチェックします。
+チェック自体はプロセスプールで並列に行い、結果の書き込みは呼び出し元（1プロセス）で行います。
+"""
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from ng_filter import match_ng_word
+
+# チェック対象のフィールド
+SCRIPT_FIELDS = ('title', 'hook', 'main_content', 'call_to_action')
+
+
+def find_violations(fields, ng_words):
+    """
+    1件の台本のNGワード違反を検出
+    fields: SCRIPT_FIELDS の順のテキスト
+    ng_words: (ng_word_id, word, word_type) のリスト
+    戻り値: (ng_word_id, word, field) のリスト
+    """
+    violations = []
+    for ng_word_id, word, word_type in ng_words:
+        for field, text in zip(SCRIPT_FIELDS, fields):
+            if text and match_ng_word(text, word, word_type):
+                violations.append((ng_word_id, word, field))
+                break  # 1つのワードにつき最初に見つかったフィールドだけ記録
+    return violations
+
+
+def scan_chunk(scripts, ng_words):
+    """
+    台本のまとまりをチェック（ワーカープロセスで実行）
+    scripts: (script_id, title, hook, main_content, call_to_action) のリスト
+    戻り値: (script_id, ng_word_id, word, field) のリスト
+    """
+    return [
+        (script[0],) + violation
+        for script in scripts
+        for violation in find_violations(script[1:], ng_words)
+    ]
+
+
+def scan_in_parallel(tasks, workers=4):
+    """
+    チェックを並列実行し、完了したものから (key, 違反リスト) を返す
+    tasks: (key, scripts, ng_words) のイテレータ（必要になった分だけ読み込む）
+    """
+    tasks = iter(tasks)
+
+    if workers <= 1:
+        for key, scripts, ng_words in tasks:
+            yield key, scan_chunk(scripts, ng_words)
+        return
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+
+        def submit_next():
+            task = next(tasks, None)
+            if task is None:
+                return False
+            key, scripts, ng_words = task
+            in_flight[executor.submit(scan_chunk, scripts, ng_words)] = key
+            return True
+
+        # 同時実行数を制限しながら投入する
+        for _ in range(max_in_flight):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                yield key, future.result()
+                submit_next()
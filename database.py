@@ -1,22 +1,154 @@
 import sqlite3
 import os
+import functools
+import hashlib
+import unicodedata
+from concurrent.futures import Future
 from datetime import datetime
 import json
-import re
+import pandas as pd
+from scoring import score_results, TARGET_COLUMNS
+from text_features import DEFAULT_FEATURE_DICTIONARY, load_feature_extractor
+from compliance import SCRIPT_FIELDS, find_violations, scan_in_parallel
+from ng_filter import benchmark_pattern, match_ng_word, static_check, validate_regex
+from shared_cache import get_shared_cache
+from storage import SQLiteStorage
+from write_queue import get_write_queue
+from learning_decay import DEFAULT_HALF_LIVES, HALF_LIVES_SETTING, apply_result, normalize_rows, parse_half_lives
+from retention import RETENTION_SETTINGS
+from script_text import decode_script_content, encode_script_content, render_template, save_bodies
+
+# 件数を数えるテーブルと、内訳に使うカラム（カテゴリー, プラットフォーム）。Noneは内訳なし
+COUNTED_TABLES = {
+    'product_categories': (None, None),
+    'effective_scripts': ('category_id', 'platform'),
+    'generated_scripts': ('category_id', 'platform'),
+    'campaign_results': ('category_id', 'platform'),
+}
+
+# 台本一覧で返すカラム（script_content は保存形式から戻した本文）
+EFFECTIVE_SCRIPT_COLUMNS = ', '.join(f'es.{column}' for column in [
+    'id', 'category_id', 'title', 'hook', 'main_content', 'call_to_action', 'script_content', 'platform',
+    'effectiveness_reason', 'created_at', 'updated_at'])
+GENERATED_SCRIPT_COLUMNS = ', '.join(f'gs.{column}' for column in [
+    'id', 'category_id', 'title', 'hook', 'main_content', 'call_to_action', 'script_content', 'platform',
+    'generation_source', 'created_at'])
+
+# 変更バージョンを記録するテーブルと、カテゴリーごとのバージョンに使うカラム（Noneはテーブル全体のみ）
+VERSIONED_TABLES = {
+    'product_categories': 'id',
+    'effective_scripts': 'category_id',
+    'generated_scripts': 'category_id',
+    'campaign_results': 'category_id',
+    'learning_patterns': 'category_id',
+    'learning_pattern_decay': 'category_id',
+    'ng_words': 'category_id',
+    'compliance_violations': 'category_id',
+    'platforms': None,
+    'system_settings': None,
+    'feature_dictionary': None,
+}
+
+
+def read_data_versions(cursor, category_id=None, tables=None):
+    """
+    テーブルごとの変更バージョンを取得（キャッシュの鮮度確認用）
+    category_id を指定すると、カテゴリーを持つテーブルはそのカテゴリーのバージョンを返す
+    戻り値: {テーブル名: バージョン}（一度も変更されていないテーブルは0）
+    """
+    tables = list(tables) if tables is not None else list(VERSIONED_TABLES)
+    cursor.execute('''
+        SELECT table_name, category_id, version FROM data_versions
+        WHERE category_id IN (0, ?)
+    ''', (category_id or 0,))
+    found = {(table, row_category): version for table, row_category, version in cursor.fetchall()}
+    
+    versions = {}
+    for table in tables:
+        if category_id and VERSIONED_TABLES.get(table):
+            versions[table] = found.get((table, category_id), 0)
+        else:
+            versions[table] = found.get((table, 0), 0)
+    return versions
+
+
+def script_signature(script_data):
+    """
+    台本の重複判定用の署名
+    各フィールドを NFKC 正規化し、空白を除いてからハッシュする（表記ゆれ・改行の違いは同じ台本とみなす）
+    """
+    normalized = []
+    for field in SCRIPT_FIELDS:
+        text = unicodedata.normalize('NFKC', script_data.get(field) or '')
+        normalized.append(''.join(text.split()).lower())
+    return hashlib.sha1('\x1f'.join(normalized).encode('utf-8')).hexdigest()
+
+
+def cached_read(*tables, by_category=False, ttl=None):
+    """
+    読み込みメソッドの結果を共有キャッシュに保存するデコレーター
+    tables の変更バージョンが変わると読み込み直す（by_category=True なら最初の引数のカテゴリーのバージョン）
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            category_id = (args[0] if args else kwargs.get('category_id')) if by_category else None
+            versions = self.get_data_versions(category_id, tables)
+            return self.cache.get_or_compute(
+                f'{self.cache_namespace}:{method.__name__}', (args, sorted(kwargs.items())),
+                tuple(versions.values()), lambda: method(self, *args, **kwargs), ttl
+            )
+        return wrapper
+    return decorator
 
 class DatabaseManager:
-    def __init__(self, db_path='ad_script_database.db'):
+    def __init__(self, db_path='ad_script_database.db', use_write_queue=True):
         self.db_path = db_path
+        self.storage = SQLiteStorage(db_path)
         self.init_database()
+        self.feature_extractor = load_feature_extractor(db_path)
+        # 書き込みはプロセス内で1本のライタースレッドにまとめる（Falseなら呼び出しごとに接続してコミット）
+        self.write_queue = get_write_queue(db_path) if use_write_queue else None
+        # 読み込み結果のキャッシュ（プロセス内 + 共有ストア、データベースファイルごとに区別）
+        self.cache = get_shared_cache()
+        self.cache_namespace = os.path.abspath(db_path)
     
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        return self.storage.connect()
+    
+    def write_async(self, func, *args):
+        """書き込み処理 func(cursor, *args) を実行し、結果を受け取る Future を返す"""
+        if self.write_queue is not None:
+            return self.write_queue.submit(func, *args)
+        
+        future = Future()
+        conn = self.get_connection()
+        try:
+            result = func(conn.cursor(), *args)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            conn.close()
+        return future
+    
+    def _write(self, func, *args):
+        """書き込み処理 func(cursor, *args) を実行して結果を返す（完了まで待つ）"""
+        return self.write_async(func, *args).result()
     
     def init_database(self):
         """データベースとテーブルを初期化"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        # 削除で空いた領域を少しずつ返せるようにする（新規作成時のみ有効。既存のデータベースは retention.py で切り替え）
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # 複数のプロセス（バッチのワーカーなど）が同時に初期化しても、順番に待って1つずつ実行する
+        cursor.execute('BEGIN IMMEDIATE')
+        
         # 1. 商材カテゴリー管理テーブル
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS product_categories (
@@ -47,6 +179,8 @@ class DatabaseManager:
                 effectiveness_reason TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                script_content_codec TEXT, -- 本文の保存形式（script_text.py、NULLは script_content のまま）
+                script_content_hash TEXT, -- 圧縮した本文のキー（script_bodies）
                 FOREIGN KEY (category_id) REFERENCES product_categories(id)
             )
         ''')
@@ -64,6 +198,9 @@ class DatabaseManager:
                 platform TEXT,
                 generation_source TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                content_signature TEXT, -- 重複判定用の署名（script_signature）
+                script_content_codec TEXT, -- 本文の保存形式（script_text.py、NULLは script_content のまま）
+                script_content_hash TEXT, -- 圧縮した本文のキー（script_bodies）
                 FOREIGN KEY (category_id) REFERENCES product_categories(id)
             )
         ''')
@@ -101,7 +238,7 @@ class DatabaseManager:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 category_id INTEGER,
                 platform TEXT,
-                pattern_type TEXT, -- 'numerical', 'keyword', 'structure', 'cta_pattern'
+                pattern_type TEXT, -- 'numerical', 'keyword', 'structure', 'cta_pattern', 'phrase'
                 pattern_content TEXT,
                 effectiveness_score REAL,
                 frequency_count INTEGER,
@@ -132,6 +269,7 @@ class DatabaseManager:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_usage_log_date ON api_usage_log (date)')
         
         # 8. NGワード管理テーブル（新規追加）
         cursor.execute('''
@@ -161,6 +299,213 @@ class DatabaseManager:
             )
         ''')
         
+        # 10. レスポンスJSON解析結果ログ
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS json_parse_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date DATE,
+                request_type TEXT,
+                outcome TEXT, -- 'ok', 'repaired', 'truncated', 'continued', 'failed'
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 11. 台本ごとの抽出パターン（保存・編集時に作成）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS script_patterns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                script_type TEXT NOT NULL, -- 'effective' or 'generated'
+                script_id INTEGER NOT NULL,
+                pattern_type TEXT NOT NULL,
+                pattern_content TEXT NOT NULL,
+                occurrence_count INTEGER DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_script_patterns_script
+            ON script_patterns (script_type, script_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_script_patterns_pattern
+            ON script_patterns (pattern_type, pattern_content)
+        ''')
+        
+        # 12. 特徴抽出キーワード辞書
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS feature_dictionary (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                feature_group TEXT NOT NULL, -- 'learning_keyword', 'authority', 'urgency', 'cta_marker' など
+                keyword TEXT NOT NULL,
+                label TEXT NOT NULL,
+                scope TEXT DEFAULT 'all', -- 'all', 'hook', 'cta'
+                weight INTEGER DEFAULT 1, -- 品質スコアでの加点
+                sort_order INTEGER DEFAULT 0,
+                is_active BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(feature_group, keyword)
+            )
+        ''')
+        
+        # 13. 台本ごとのNGワードチェック状況（どのNGワードIDまでチェック済みか）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS compliance_index (
+                script_type TEXT NOT NULL, -- 'effective' or 'generated'
+                script_id INTEGER NOT NULL,
+                category_id INTEGER,
+                checked_version INTEGER DEFAULT 0, -- チェック済みのNGワードIDの最大値
+                checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (script_type, script_id)
+            )
+        ''')
+        
+        # 14. 保存済み台本のNGワード違反
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS compliance_violations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                script_type TEXT NOT NULL,
+                script_id INTEGER NOT NULL,
+                category_id INTEGER,
+                ng_word_id INTEGER NOT NULL,
+                word TEXT,
+                field TEXT, -- 'title', 'hook', 'main_content', 'call_to_action'
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(script_type, script_id, ng_word_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_compliance_violations_category
+            ON compliance_violations (category_id, script_type)
+        ''')
+        
+        # 15. テーブルごとの変更バージョン（トリガーで更新）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                table_name TEXT NOT NULL,
+                category_id INTEGER NOT NULL, -- 0: テーブル全体、それ以外: カテゴリーごと
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (table_name, category_id)
+            )
+        ''')
+        
+        # 16. 学習パターンの時間減衰スコア（半減期ごと）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS learning_pattern_decay (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                half_life_days REAL NOT NULL,
+                category_id INTEGER,
+                platform TEXT,
+                pattern_type TEXT,
+                pattern_content TEXT,
+                decayed_sum REAL NOT NULL, -- last_update 時点まで減衰させたスコア合計
+                decayed_weight REAL NOT NULL, -- last_update 時点まで減衰させた件数
+                last_update REAL NOT NULL, -- 最後に反映した配信結果の日時（ユリウス日）
+                decayed_score REAL NOT NULL, -- decayed_sum / decayed_weight（並べ替え用）
+                UNIQUE(half_life_days, category_id, platform, pattern_type, pattern_content)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_learning_pattern_decay_rank
+            ON learning_pattern_decay (half_life_days, category_id, platform, decayed_score)
+        ''')
+        
+        # 17. バックアップ・復元の記録（backup.py）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS backup_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                operation TEXT NOT NULL, -- 'backup', 'restore'
+                backup_path TEXT,
+                status TEXT NOT NULL, -- 'ok', 'failed'
+                duration_seconds REAL,
+                size_bytes INTEGER,
+                pages INTEGER,
+                steps INTEGER,
+                message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 18. API使用ログの日別集計（保持期間を過ぎたログをまとめる、retention.py）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS api_usage_daily (
+                date DATE NOT NULL,
+                request_type TEXT NOT NULL,
+                request_count INTEGER DEFAULT 0,
+                tokens_used INTEGER DEFAULT 0,
+                cost_jpy REAL DEFAULT 0,
+                PRIMARY KEY (date, request_type)
+            )
+        ''')
+        
+        # 19. 配信結果の日別集計（アーカイブに移した配信結果をまとめる、retention.py）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS campaign_results_daily (
+                result_date DATE NOT NULL,
+                category_id INTEGER NOT NULL, -- カテゴリーなしは0
+                platform TEXT NOT NULL,
+                script_type TEXT NOT NULL,
+                result_count INTEGER DEFAULT 0,
+                good_count INTEGER DEFAULT 0,
+                spend_amount REAL DEFAULT 0,
+                impressions INTEGER DEFAULT 0,
+                clicks INTEGER DEFAULT 0,
+                conversions INTEGER DEFAULT 0,
+                score_sum REAL DEFAULT 0,
+                PRIMARY KEY (result_date, category_id, platform, script_type)
+            )
+        ''')
+        
+        # 20. 圧縮した台本本文（同じ本文は1件だけ、script_text.py）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS script_bodies (
+                content_hash TEXT PRIMARY KEY,
+                codec TEXT NOT NULL, -- 'zlib'
+                body BLOB NOT NULL,
+                raw_bytes INTEGER, -- 圧縮前のバイト数
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 21. テーブルの件数（カテゴリー・プラットフォーム別、トリガーで更新）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS table_counters (
+                table_name TEXT NOT NULL,
+                category_id INTEGER NOT NULL, -- カテゴリーなし・内訳なしは0
+                platform TEXT NOT NULL, -- プラットフォームなし・内訳なしは''
+                row_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (table_name, category_id, platform)
+            )
+        ''')
+        
+        # 既存テーブルへのカラム追加
+        self._migrate_columns(cursor)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_generated_scripts_signature
+            ON generated_scripts (category_id, content_signature)
+        ''')
+        
+        # 変更バージョンを更新するトリガー
+        self._create_version_triggers(cursor)
+        self._create_counter_triggers(cursor)
+        
+        # 初期キーワード辞書の挿入
+        cursor.executemany('''
+            INSERT OR IGNORE INTO feature_dictionary (feature_group, keyword, label, scope, weight, sort_order)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [entry + (order,) for order, entry in enumerate(DEFAULT_FEATURE_DICTIONARY)])
+        
+        # 初期設定の挿入
+        cursor.execute('''
+            INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description)
+            VALUES (?, ?, ?)
+        ''', (HALF_LIVES_SETTING, ','.join(str(days) for days in DEFAULT_HALF_LIVES),
+              '学習パターンの時間減衰スコアを保持する半減期（日、カンマ区切り）'))
+        cursor.executemany('''
+            INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description)
+            VALUES (?, ?, ?)
+        ''', [(key, default, description) for key, (default, description) in RETENTION_SETTINGS.items()])
+        
         # 初期プラットフォームデータの挿入
         cursor.execute('''
             INSERT OR IGNORE INTO platforms (platform_name, platform_code, description, sort_order)
@@ -175,7 +520,203 @@ class DatabaseManager:
         conn.close()
         print("✅ データベースが正常に初期化されました")
     
+    def _migrate_columns(self, cursor):
+        """作成済みのテーブルに不足しているカラムを追加"""
+        added_columns = {
+            'ng_words': [
+                ('regex_status', "TEXT"),  # 正規表現の検証結果: 'ok', 'rejected'（未検証はNULL）
+                ('regex_note', "TEXT"),  # 拒否の理由
+            ],
+            'effective_scripts': [
+                ('script_content_codec', "TEXT"),  # 本文の保存形式（script_text.py）
+                ('script_content_hash', "TEXT"),  # 圧縮した本文のキー（script_bodies）
+            ],
+            'generated_scripts': [
+                ('content_signature', "TEXT"),  # 重複判定用の署名（script_signature）
+                ('script_content_codec', "TEXT"),
+                ('script_content_hash', "TEXT"),
+            ],
+        }
+        for table, columns in added_columns.items():
+            cursor.execute(f'PRAGMA table_info({table})')
+            existing = {row[1] for row in cursor.fetchall()}
+            for column, column_type in columns:
+                if column not in existing:
+                    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+        
+        # 署名のない生成済み台本（カラム追加前の台本）に署名を付ける
+        cursor.execute(f'''
+            SELECT id, {', '.join(SCRIPT_FIELDS)} FROM generated_scripts WHERE content_signature IS NULL
+        ''')
+        cursor.executemany('UPDATE generated_scripts SET content_signature = ? WHERE id = ?', [
+            (script_signature(dict(zip(SCRIPT_FIELDS, row[1:]))), row[0]) for row in cursor.fetchall()
+        ])
+    
+    def _create_version_triggers(self, cursor):
+        """VERSIONED_TABLES の挿入・更新・削除で data_versions を進めるトリガーを作成"""
+        def bump(table, category_expr='0', condition=None):
+            where = f' WHERE {condition}' if condition else ''
+            return f'''
+                INSERT INTO data_versions (table_name, category_id, version)
+                SELECT '{table}', {category_expr}, 1{where}
+                ON CONFLICT(table_name, category_id)
+                DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;'''
+
+        for table, category_column in VERSIONED_TABLES.items():
+            statements = {
+                'INSERT': [bump(table)],
+                'UPDATE': [bump(table)],
+                'DELETE': [bump(table)],
+            }
+            if category_column:
+                new_category = f'NEW.{category_column}'
+                old_category = f'OLD.{category_column}'
+                # カテゴリーがNULLの行はテーブル全体のバージョンだけ進める
+                statements['INSERT'].append(bump(table, new_category, f'{new_category} IS NOT NULL'))
+                statements['UPDATE'].append(bump(table, new_category, f'{new_category} IS NOT NULL'))
+                # カテゴリーが変わった場合は移動元のカテゴリーも進める
+                statements['UPDATE'].append(bump(table, old_category,
+                                                 f'{old_category} IS NOT NULL AND {old_category} IS NOT {new_category}'))
+                statements['DELETE'].append(bump(table, old_category, f'{old_category} IS NOT NULL'))
+            for event, bodies in statements.items():
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                    AFTER {event} ON {table}
+                    BEGIN{''.join(bodies)}
+                    END
+                ''')
+    
+    def _create_counter_triggers(self, cursor):
+        """COUNTED_TABLES の挿入・削除（内訳のカラムの更新）で table_counters を増減するトリガーを作成"""
+        def keys(table, row):
+            category_column, platform_column = COUNTED_TABLES[table]
+            category = f'IFNULL({row}.{category_column}, 0)' if category_column else '0'
+            platform = f"IFNULL({row}.{platform_column}, '')" if platform_column else "''"
+            return category, platform
+
+        def change(table, row, delta):
+            category, platform = keys(table, row)
+            return f'''
+                INSERT INTO table_counters (table_name, category_id, platform, row_count)
+                VALUES ('{table}', {category}, {platform}, {delta})
+                ON CONFLICT(table_name, category_id, platform) DO UPDATE SET row_count = row_count + {delta};'''
+
+        for table, (category_column, platform_column) in COUNTED_TABLES.items():
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                           (f'trg_{table}_count_insert',))
+            created = cursor.fetchone() is None
+
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert
+                AFTER INSERT ON {table}
+                BEGIN{change(table, 'NEW', 1)}
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete
+                AFTER DELETE ON {table}
+                BEGIN{change(table, 'OLD', -1)}
+                END
+            ''')
+            if category_column:
+                # カテゴリー・プラットフォームが変わった行は移動元から移動先に数え直す
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_count_update
+                    AFTER UPDATE OF {category_column}, {platform_column} ON {table}
+                    WHEN OLD.{category_column} IS NOT NEW.{category_column} OR OLD.{platform_column} IS NOT NEW.{platform_column}
+                    BEGIN{change(table, 'OLD', -1)}{change(table, 'NEW', 1)}
+                    END
+                ''')
+            if created:
+                # トリガーを作る前からある行を数えておく
+                self._recount_table(cursor, table)
+    
+    def _recount_table(self, cursor, table):
+        """table の件数を数え直して table_counters を置き換える"""
+        category, platform = (f'IFNULL({column}, {default})' if column else default
+                              for column, default in zip(COUNTED_TABLES[table], ('0', "''")))
+        cursor.execute('DELETE FROM table_counters WHERE table_name = ?', (table,))
+        cursor.execute(f'''
+            INSERT INTO table_counters (table_name, category_id, platform, row_count)
+            SELECT ?, {category}, {platform}, COUNT(*) FROM {table} GROUP BY 2, 3
+        ''', (table,))
+    
+    def rebuild_table_counters(self):
+        """table_counters をすべて数え直す（トリガーを通さずにテーブルを書き換えた後の修復用）"""
+        def write(cursor):
+            for table in COUNTED_TABLES:
+                self._recount_table(cursor, table)
+        
+        self._write(write)
+        print("✅ テーブルの件数を数え直しました")
+    
+    def get_dashboard_stats(self):
+        """
+        ホーム画面・設定画面の件数をまとめて取得（table_counters を1回読み込むだけ）
+        戻り値: {
+            'counts': {'effective', 'categories', 'generated', 'results'}: 件数,
+            'by_platform': {テーブル名: [(プラットフォーム, 件数), ...]}（件数の多い順）,
+            'by_category': {テーブル名: {カテゴリーID: 件数}},
+        }
+        """
+        rows = self.storage.fetch_all(
+            'SELECT table_name, category_id, platform, row_count FROM table_counters WHERE row_count != 0'
+        )
+        totals = dict.fromkeys(COUNTED_TABLES, 0)
+        by_platform = {table: {} for table, (_, platform_column) in COUNTED_TABLES.items() if platform_column}
+        by_category = {table: {} for table, (category_column, _) in COUNTED_TABLES.items() if category_column}
+        for table, category_id, platform, count in rows:
+            if table not in totals:
+                continue
+            totals[table] += count
+            if table in by_platform:
+                platform = platform or None  # GROUP BY platform と同じく、未設定はNone
+                by_platform[table][platform] = by_platform[table].get(platform, 0) + count
+            if table in by_category and category_id:
+                by_category[table][category_id] = by_category[table].get(category_id, 0) + count
+        
+        return {
+            'counts': {
+                'effective': totals['effective_scripts'],
+                'categories': totals['product_categories'],
+                'generated': totals['generated_scripts'],
+                'results': totals['campaign_results'],
+            },
+            'by_platform': {
+                table: sorted(counts.items(), key=lambda item: -item[1]) for table, counts in by_platform.items()
+            },
+            'by_category': by_category,
+        }
+    
+    def touch_data_version(self, cursor, table_name):
+        """
+        トリガーを通さずに書き換えたテーブル（テーブルの入れ替えなど）のバージョンを進める
+        呼び出し元のトランザクション内で実行する
+        """
+        cursor.execute('''
+            UPDATE data_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE table_name = ?
+        ''', (table_name,))
+        cursor.execute('''
+            INSERT OR IGNORE INTO data_versions (table_name, category_id, version) VALUES (?, 0, 1)
+        ''', (table_name,))
+        category_column = VERSIONED_TABLES.get(table_name)
+        if category_column:
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO data_versions (table_name, category_id, version)
+                SELECT DISTINCT ?, {category_column}, 1 FROM {table_name} WHERE {category_column} IS NOT NULL
+            ''', (table_name,))
+    
+    def get_data_versions(self, category_id=None, tables=None):
+        """テーブルごとの変更バージョンを取得（read_data_versions を参照）"""
+        conn = self.get_connection()
+        try:
+            return read_data_versions(conn.cursor(), category_id, tables)
+        finally:
+            conn.close()
+    
     # プラットフォーム管理メソッド（新規追加）
+    @cached_read('platforms')
     def get_active_platforms(self):
         """アクティブなプラットフォーム一覧を取得"""
         conn = self.get_connection()
@@ -190,6 +731,7 @@ class DatabaseManager:
         conn.close()
         return platforms
     
+    @cached_read('platforms')
     def get_all_platforms(self):
         """全てのプラットフォーム一覧を取得"""
         conn = self.get_connection()
@@ -204,48 +746,38 @@ class DatabaseManager:
     
     def add_platform(self, platform_name, platform_code, description=None):
         """新しいプラットフォームを追加"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
+        def write(cursor):
             cursor.execute('''
                 INSERT INTO platforms (platform_name, platform_code, description)
                 VALUES (?, ?, ?)
             ''', (platform_name, platform_code, description))
-            conn.commit()
             return cursor.lastrowid
+        
+        try:
+            return self._write(write)
         except sqlite3.IntegrityError:
             return None
-        finally:
-            conn.close()
     
     def update_platform(self, platform_id, platform_name, platform_code, description=None, is_active=True):
         """プラットフォームを更新"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE platforms SET
-            platform_name = ?, platform_code = ?, description = ?, is_active = ?,
-            updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (platform_name, platform_code, description, is_active, platform_id))
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.execute('''
+                UPDATE platforms SET
+                platform_name = ?, platform_code = ?, description = ?, is_active = ?,
+                updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (platform_name, platform_code, description, is_active, platform_id))
+        
+        self._write(write)
     
     def delete_platform(self, platform_id):
         """プラットフォームを削除（論理削除）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE platforms SET is_active = FALSE WHERE id = ?', (platform_id,))
-        conn.commit()
-        conn.close()
+        self._write(lambda cursor: cursor.execute('UPDATE platforms SET is_active = FALSE WHERE id = ?', (platform_id,)))
     
     # 商材カテゴリー管理
     def add_product_category(self, category_name, targets=None):
         """商材カテゴリーを追加"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        def write(cursor):
             if targets:
                 cursor.execute('''
                     INSERT INTO product_categories 
@@ -256,15 +788,14 @@ class DatabaseManager:
                      targets.get('cvr', 0), targets.get('cpa', 0)))
             else:
                 cursor.execute('INSERT INTO product_categories (category_name) VALUES (?)', (category_name,))
-            
-            conn.commit()
-            category_id = cursor.lastrowid
-            return category_id
+            return cursor.lastrowid
+        
+        try:
+            return self._write(write)
         except sqlite3.IntegrityError:
             return None  # 既に存在する場合
-        finally:
-            conn.close()
     
+    @cached_read('product_categories')
     def get_product_categories(self):
         """商材カテゴリー一覧を取得"""
         conn = self.get_connection()
@@ -274,49 +805,91 @@ class DatabaseManager:
         conn.close()
         return categories
     
-    def update_category_targets(self, category_id, targets):
-        """商材の目標値を更新"""
+    def update_category_targets(self, category_id, targets, rescore=True):
+        """商材の目標値を更新（既存の配信結果も新しい目標値で再評価）"""
+        def write(cursor):
+            cursor.execute('''
+                UPDATE product_categories SET
+                target_ctr = ?, target_cpc = ?, target_mcvr = ?, 
+                target_mcpa = ?, target_cvr = ?, target_cpa = ?,
+                updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (targets['ctr'], targets['cpc'], targets['mcvr'], 
+                  targets['mcpa'], targets['cvr'], targets['cpa'], category_id))
+        
+        self._write(write)
+        
+        if rescore:
+            self.rescore_category_results(category_id)
+    
+    def rescore_category_results(self, category_id=None):
+        """配信結果の良し悪し判定とスコアを現在の目標値で一括再計算"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE product_categories SET
-            target_ctr = ?, target_cpc = ?, target_mcvr = ?, 
-            target_mcpa = ?, target_cvr = ?, target_cpa = ?,
-            updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (targets['ctr'], targets['cpc'], targets['mcvr'], 
-              targets['mcpa'], targets['cvr'], targets['cpa'], category_id))
-        conn.commit()
-        conn.close()
+        
+        try:
+            query = 'SELECT id, category_id, ctr, cpc, mcvr, mcpa, cvr, cpa FROM campaign_results'
+            params = []
+            if category_id:
+                query += ' WHERE category_id = ?'
+                params.append(category_id)
+            
+            results = pd.read_sql_query(query, conn, params=params)
+            if results.empty:
+                return 0
+            
+            targets = pd.read_sql_query(
+                f'SELECT id, {", ".join(TARGET_COLUMNS)} FROM product_categories', conn
+            ).set_index('id')
+            
+            scored = score_results(results, targets)
+            
+            # 目標値が見つからない結果はスカラー版と同様に「要改善・0点」とする
+            has_category = results['category_id'].isin(targets.index).to_numpy()
+            is_good = scored['is_good_performance'].to_numpy() & has_category
+            scores = scored['performance_score'].where(has_category, 0.0).to_numpy()
+            
+            conn.executemany(
+                'UPDATE campaign_results SET is_good_performance = ?, performance_score = ? WHERE id = ?',
+                zip(is_good.tolist(), scores.tolist(), results['id'].tolist())
+            )
+            conn.commit()
+            print(f"✅ 配信結果を再評価しました: {len(results)}件")
+            return len(results)
+        finally:
+            conn.close()
     
     # 効果的台本管理
     def add_effective_script(self, category_id, title, hook, main_content, cta, platform, reason):
         """効果的台本を追加"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        script_content = render_template('sections', hook, main_content, cta)
         
-        script_content = f"【フック】\n{hook}\n\n【メイン】\n{main_content}\n\n【CTA】\n{cta}"
-        
-        cursor.execute('''
-            INSERT INTO effective_scripts 
-            (category_id, title, hook, main_content, call_to_action, script_content, platform, effectiveness_reason)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (category_id, title, hook, main_content, cta, script_content, platform, reason))
+        def write(cursor):
+            stored = self._store_script_content(cursor, script_content, hook, main_content, cta)
+            cursor.execute('''
+                INSERT INTO effective_scripts 
+                (category_id, title, hook, main_content, call_to_action, script_content, platform, effectiveness_reason,
+                 script_content_codec, script_content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (category_id, title, hook, main_content, cta, stored[0], platform, reason, stored[1], stored[2]))
+            
+            script_id = cursor.lastrowid
+            self._save_script_patterns(cursor, 'effective', script_id, hook, main_content, cta)
+            self._check_script_compliance(cursor, 'effective', script_id, category_id, (title, hook, main_content, cta))
+            return script_id
         
-        conn.commit()
-        script_id = cursor.lastrowid
-        conn.close()
-        return script_id
+        return self._write(write)
     
+    @cached_read('effective_scripts', 'product_categories', by_category=True)
     def get_effective_scripts(self, category_id=None, platform=None):
         """効果的台本を取得"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        query = '''
-            SELECT es.*, pc.category_name 
+        query = f'''
+            SELECT {EFFECTIVE_SCRIPT_COLUMNS}, pc.category_name, es.script_content_codec, sb.body
             FROM effective_scripts es
             JOIN product_categories pc ON es.category_id = pc.id
+            LEFT JOIN script_bodies sb ON sb.content_hash = es.script_content_hash
             WHERE 1=1
         '''
         params = []
@@ -332,7 +905,7 @@ class DatabaseManager:
         query += ' ORDER BY es.created_at DESC'
         
         cursor.execute(query, params)
-        scripts = cursor.fetchall()
+        scripts = self._decode_script_rows(cursor.fetchall())
         conn.close()
         return scripts
     
@@ -342,72 +915,296 @@ class DatabaseManager:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT es.*, pc.category_name 
+        cursor.execute(f'''
+            SELECT {EFFECTIVE_SCRIPT_COLUMNS}, pc.category_name, es.script_content_codec, sb.body
             FROM effective_scripts es
             JOIN product_categories pc ON es.category_id = pc.id
+            LEFT JOIN script_bodies sb ON sb.content_hash = es.script_content_hash
             WHERE es.id = ?
         ''', (script_id,))
         
-        script = cursor.fetchone()
+        scripts = self._decode_script_rows(cursor.fetchall())
         conn.close()
-        return script
+        return scripts[0] if scripts else None
     
     # 新規追加：効果的台本の更新
     def update_effective_script(self, script_id, title, hook, main_content, cta, platform, reason):
         """効果的台本を更新"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        script_content = f"【フック】\n{hook}\n\n【メイン】\n{main_content}\n\n【CTA】\n{cta}"
+        script_content = render_template('sections', hook, main_content, cta)
         
-        cursor.execute('''
-            UPDATE effective_scripts SET
-            title = ?, hook = ?, main_content = ?, call_to_action = ?, 
-            script_content = ?, platform = ?, effectiveness_reason = ?,
-            updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (title, hook, main_content, cta, script_content, platform, reason, script_id))
+        def write(cursor):
+            stored = self._store_script_content(cursor, script_content, hook, main_content, cta)
+            cursor.execute('''
+                UPDATE effective_scripts SET
+                title = ?, hook = ?, main_content = ?, call_to_action = ?, 
+                script_content = ?, platform = ?, effectiveness_reason = ?,
+                script_content_codec = ?, script_content_hash = ?,
+                updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (title, hook, main_content, cta, stored[0], platform, reason, stored[1], stored[2], script_id))
+            
+            self._save_script_patterns(cursor, 'effective', script_id, hook, main_content, cta)
+            cursor.execute('SELECT category_id FROM effective_scripts WHERE id = ?', (script_id,))
+            row = cursor.fetchone()
+            if row:
+                self._check_script_compliance(cursor, 'effective', script_id, row[0], (title, hook, main_content, cta))
         
-        conn.commit()
-        conn.close()
+        self._write(write)
+
+    # 自動生成台本管理
+    def add_generated_script(self, category_id, script_data, platform, generation_source='統合AI生成'):
+        """自動生成台本を保存"""
+        return self.save_generated_scripts(category_id, [script_data], platform, generation_source,
+                                           skip_duplicates=False)[0]
+
+    def save_generated_scripts(self, category_id, scripts, platform, generation_source='統合AI生成',
+                               skip_duplicates=True):
+        """
+        自動生成台本をまとめて保存（1トランザクション）
+        パターン抽出・NGワードチェック・重複判定用の署名も同じトランザクションで保存する
+        skip_duplicates=True の場合、同じカテゴリーに同じ内容（署名が同じ）の台本があれば保存せず、その台本のIDを返す
+        戻り値: scripts と同じ順の台本ID
+        """
+        scripts = list(scripts)
+        if not scripts:
+            return []
+        signatures = [script_signature(script_data) for script_data in scripts]
+        # 本文の保存形式（作り直せる本文は保存しない・それ以外は圧縮）も書き込みキューの外で決めておく
+        contents = [encode_script_content(script_data.get('script_content', ''), script_data.get('hook', ''),
+                                          script_data.get('main_content', ''), script_data.get('call_to_action', ''))
+                    for script_data in scripts]
+        # パターン抽出は書き込みキューの外で済ませておく
+        patterns = [self._extract_patterns(script_data.get('hook', ''), script_data.get('main_content', ''),
+                                           script_data.get('call_to_action', '')) for script_data in scripts]
+
+        def write(cursor):
+            script_ids = [None] * len(scripts)
+            pending = list(range(len(scripts)))
+            existing = {}
+            if skip_duplicates:
+                cursor.execute(f'''
+                    SELECT content_signature, MIN(id) FROM generated_scripts
+                    WHERE category_id IS ? AND content_signature IN ({', '.join('?' * len(set(signatures)))})
+                    GROUP BY content_signature
+                ''', (category_id, *set(signatures)))
+                existing = dict(cursor.fetchall())
+                pending = []
+                for i, signature in enumerate(signatures):
+                    if signature not in existing:
+                        existing[signature] = None  # 同じ一覧内の重複は最初の1件だけ保存する
+                        pending.append(i)
+
+            # AUTOINCREMENT のため、追加した行のIDは追加前の最大IDより大きい（書き込み中は他の追加はない）
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM generated_scripts')
+            last_id = cursor.fetchone()[0]
+            save_bodies(cursor, [(contents[i][2], contents[i][3], len(scripts[i]['script_content'].encode('utf-8')))
+                                 for i in pending if contents[i][3] is not None])
+            cursor.executemany('''
+                INSERT INTO generated_scripts
+                (category_id, title, hook, main_content, call_to_action, script_content, platform,
+                 generation_source, content_signature, script_content_codec, script_content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(category_id, scripts[i].get('title', ''), scripts[i].get('hook', ''),
+                   scripts[i].get('main_content', ''), scripts[i].get('call_to_action', ''),
+                   contents[i][0], platform, generation_source, signatures[i], contents[i][1], contents[i][2])
+                  for i in pending])
+            cursor.execute('SELECT id FROM generated_scripts WHERE id > ? ORDER BY id', (last_id,))
+            for i, (script_id,) in zip(pending, cursor.fetchall()):
+                script_ids[i] = script_id
+
+            cursor.executemany('''
+                INSERT INTO script_patterns (script_type, script_id, pattern_type, pattern_content, occurrence_count)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [row for i in pending for row in self._pattern_rows('generated', script_ids[i], patterns[i])])
+
+            # 新しい台本を現在のNGワードでチェック（NGワードの取得は1回だけ）
+            ng_words = self._get_ng_word_versions(cursor, category_id) if category_id else []
+            version = ng_words[-1][0] if ng_words else 0
+            violations = [
+                (script_ids[i],) + violation
+                for i in pending
+                for violation in find_violations(tuple(scripts[i].get(field, '') for field in SCRIPT_FIELDS), ng_words)
+            ]
+            self._save_compliance_results(cursor, 'generated', category_id,
+                                          [script_ids[i] for i in pending], violations, version)
+
+            # 保存しなかった重複は既存（または同じ一覧内で先に保存した）台本のIDを返す
+            saved = {signatures[i]: script_ids[i] for i in pending}
+            return [script_id if script_id is not None else (existing.get(signature) or saved[signature])
+                    for script_id, signature in zip(script_ids, signatures)]
+
+        return self._write(write)
+
+    @cached_read('generated_scripts', 'product_categories', by_category=True)
+    def get_generated_scripts(self, category_id=None):
+        """生成済み台本を新しい順に取得（台本ライブラリ用）"""
+        query = f'''
+            SELECT {GENERATED_SCRIPT_COLUMNS}, pc.category_name, gs.script_content_codec, sb.body
+            FROM generated_scripts gs
+            JOIN product_categories pc ON gs.category_id = pc.id
+            LEFT JOIN script_bodies sb ON sb.content_hash = gs.script_content_hash
+        '''
+        params = []
+        if category_id:
+            query += ' WHERE gs.category_id = ?'
+            params.append(category_id)
+        query += ' ORDER BY gs.created_at DESC'
+        return self._decode_script_rows(self.storage.fetch_all(query, params))
     
-    # 配信結果管理
-    def add_campaign_result(self, script_id, script_type, category_id, platform, results):
-        """配信結果を追加"""
+    def _store_script_content(self, cursor, script_content, hook, main_content, cta):
+        """本文の保存形式を決め、圧縮した本文を保存して (script_content, 形式, ハッシュ) を返す"""
+        stored, codec, digest, body = encode_script_content(script_content, hook, main_content, cta)
+        if body is not None:
+            save_bodies(cursor, [(digest, body, len(script_content.encode('utf-8')))])
+        return stored, codec, digest
+    
+    def _decode_script_rows(self, rows):
+        """
+        台本の行の script_content（7列目）を元の本文に戻す
+        行の末尾2列は (保存形式, 圧縮済み本文) で、戻した行からは取り除く
+        """
+        return [
+            row[:6] + (decode_script_content(row[6], row[-2], row[-1], row[3], row[4], row[5]),) + row[7:-2]
+            for row in rows
+        ]
+    
+    def _save_script_patterns(self, cursor, script_type, script_id, hook, main_content, cta):
+        """台本から抽出したパターンを script_patterns に保存（既存分は置き換え）"""
+        patterns = self._extract_patterns(hook, main_content, cta)
+        cursor.execute('DELETE FROM script_patterns WHERE script_type = ? AND script_id = ?', (script_type, script_id))
+        cursor.executemany('''
+            INSERT INTO script_patterns (script_type, script_id, pattern_type, pattern_content, occurrence_count)
+            VALUES (?, ?, ?, ?, ?)
+        ''', self._pattern_rows(script_type, script_id, patterns))
+        return patterns
+
+    def _pattern_rows(self, script_type, script_id, patterns):
+        """抽出したパターンを script_patterns の行（出現回数つき）にまとめる"""
+        counts = {}
+        for pattern in patterns:
+            counts[pattern] = counts.get(pattern, 0) + 1
+        return [(script_type, script_id, pattern_type, pattern_content, count)
+                for (pattern_type, pattern_content), count in counts.items()]
+
+    def _get_script_patterns(self, cursor, script_type, script_id):
+        """保存済みの台本パターンを取得（未保存の台本はその場で抽出して保存）"""
+        cursor.execute('''
+            SELECT pattern_type, pattern_content, occurrence_count
+            FROM script_patterns
+            WHERE script_type = ? AND script_id = ?
+        ''', (script_type, script_id))
+        rows = cursor.fetchall()
+        if rows:
+            return [(pattern_type, pattern_content)
+                    for pattern_type, pattern_content, count in rows for _ in range(count)]
+
+        table = 'effective_scripts' if script_type == 'effective' else 'generated_scripts'
+        cursor.execute(f'SELECT hook, main_content, call_to_action FROM {table} WHERE id = ?', (script_id,))
+        script_data = cursor.fetchone()
+        if not script_data:
+            return None
+        return self._save_script_patterns(cursor, script_type, script_id, *script_data)
+
+    def refresh_script_patterns(self, batch_size=1000):
+        """全台本のパターンを抽出し直して script_patterns を作り直す（抽出ルール変更時用）"""
+        conn = self.get_connection()
+        read_cursor = conn.cursor()
+        write_cursor = conn.cursor()
+        total = 0
+
+        try:
+            write_cursor.execute('DELETE FROM script_patterns')
+            for script_type, table in [('effective', 'effective_scripts'), ('generated', 'generated_scripts')]:
+                read_cursor.execute(f'SELECT id, hook, main_content, call_to_action FROM {table}')
+                while True:
+                    scripts = read_cursor.fetchmany(batch_size)
+                    if not scripts:
+                        break
+                    rows = []
+                    for script_id, hook, main_content, cta in scripts:
+                        counts = {}
+                        for pattern in self._extract_patterns(hook, main_content, cta):
+                            counts[pattern] = counts.get(pattern, 0) + 1
+                        rows.extend((script_type, script_id, pattern_type, pattern_content, count)
+                                    for (pattern_type, pattern_content), count in counts.items())
+                    write_cursor.executemany('''
+                        INSERT INTO script_patterns (script_type, script_id, pattern_type, pattern_content, occurrence_count)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', rows)
+                    total += len(scripts)
+            conn.commit()
+            print(f"✅ 台本パターンを更新しました: {total}件")
+            return total
+        finally:
+            conn.close()
+
+    def find_scripts_by_pattern(self, pattern_type, pattern_content, category_id=None):
+        """指定パターンを含む台本を取得（script_type, script_id, title, platform, occurrence_count）"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        # 目標値を取得
-        cursor.execute('SELECT * FROM product_categories WHERE id = ?', (category_id,))
-        targets = cursor.fetchone()
-        
-        if targets:
-            # 良し悪し判定
-            is_good = self._evaluate_performance(results, targets)
-            performance_score = self._calculate_performance_score(results, targets)
-        else:
-            is_good = False
-            performance_score = 0.0
-        
-        cursor.execute('''
-            INSERT INTO campaign_results 
-            (script_id, script_type, category_id, platform, ctr, cpc, mcvr, mcpa, cvr, cpa,
-             spend_amount, impressions, clicks, conversions, campaign_period_start, 
-             campaign_period_end, is_good_performance, performance_score)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (script_id, script_type, category_id, platform, 
-              results['ctr'], results['cpc'], results['mcvr'], results['mcpa'], 
-              results['cvr'], results['cpa'], results['spend_amount'],
-              results['impressions'], results['clicks'], results['conversions'],
-              results['start_date'], results['end_date'], is_good, performance_score))
-        
-        conn.commit()
+
+        query = '''
+            SELECT sp.script_type, sp.script_id,
+                   COALESCE(es.title, gs.title) AS title,
+                   COALESCE(es.platform, gs.platform) AS platform,
+                   sp.occurrence_count
+            FROM script_patterns sp
+            LEFT JOIN effective_scripts es ON sp.script_type = 'effective' AND sp.script_id = es.id
+            LEFT JOIN generated_scripts gs ON sp.script_type = 'generated' AND sp.script_id = gs.id
+            WHERE sp.pattern_type = ? AND sp.pattern_content = ?
+        '''
+        params = [pattern_type, pattern_content]
+
+        if category_id:
+            query += ' AND COALESCE(es.category_id, gs.category_id) = ?'
+            params.append(category_id)
+
+        query += ' ORDER BY sp.script_type, sp.script_id'
+
+        cursor.execute(query, params)
+        scripts = cursor.fetchall()
         conn.close()
-        
-        # 学習パターン更新
-        if is_good:
-            self._update_learning_patterns(script_id, script_type, category_id, platform)
+        return scripts
+
+    # 配信結果管理
+    def add_campaign_result(self, script_id, script_type, category_id, platform, results):
+        """配信結果を追加（学習パターンの更新も同じトランザクションで行う）"""
+        def write(cursor):
+            # 目標値を取得
+            cursor.execute('SELECT * FROM product_categories WHERE id = ?', (category_id,))
+            targets = cursor.fetchone()
+            
+            if targets:
+                # 良し悪し判定
+                is_good = self._evaluate_performance(results, targets)
+                performance_score = self._calculate_performance_score(results, targets)
+            else:
+                is_good = False
+                performance_score = 0.0
+            
+            cursor.execute('''
+                INSERT INTO campaign_results 
+                (script_id, script_type, category_id, platform, ctr, cpc, mcvr, mcpa, cvr, cpa,
+                 spend_amount, impressions, clicks, conversions, campaign_period_start, 
+                 campaign_period_end, is_good_performance, performance_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (script_id, script_type, category_id, platform, 
+                  results['ctr'], results['cpc'], results['mcvr'], results['mcpa'], 
+                  results['cvr'], results['cpa'], results['spend_amount'],
+                  results['impressions'], results['clicks'], results['conversions'],
+                  results['start_date'], results['end_date'], is_good, performance_score))
+            
+            # 学習パターン更新（判定・スコア・消化金額はそのまま渡し、追加した行を読み直さない）
+            if not is_good:
+                return 0
+            cursor.execute('SELECT julianday(created_at) FROM campaign_results WHERE id = ?', (cursor.lastrowid,))
+            result_day = cursor.fetchone()[0]
+            return self._update_learning_patterns(cursor, script_id, script_type, category_id, platform,
+                                                  is_good, performance_score, results['spend_amount'], result_day)
+        
+        updated = self._write(write)
+        if updated:
+            print(f"✅ 学習パターンを更新しました: {updated}件")
     
     def _evaluate_performance(self, results, targets):
         """配信結果の良し悪しを判定"""
@@ -546,126 +1343,211 @@ class DatabaseManager:
         # 平均スコアを計算（スコアがない場合は0.0）
         return sum(scores) / len(scores) if scores else 0.0
     
-    def _update_learning_patterns(self, script_id, script_type, category_id, platform):
-        """学習パターンを更新（強化学習の核心機能）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # 台本データを取得
-            if script_type == 'effective':
-                cursor.execute('SELECT hook, main_content, call_to_action FROM effective_scripts WHERE id = ?', (script_id,))
-            else:
-                cursor.execute('SELECT hook, main_content, call_to_action FROM generated_scripts WHERE id = ?', (script_id,))
-            
-            script_data = cursor.fetchone()
-            if not script_data:
-                return
-            
-            hook, main_content, cta = script_data
-            
-            # 配信結果を取得
+    def _update_learning_patterns(self, cursor, script_id, script_type, category_id, platform,
+                                  is_good, score, spend_amount, result_day):
+        """
+        学習パターンを更新（強化学習の核心機能）
+        配信結果を追加したトランザクション内で、判定・スコア・消化金額・日時（ユリウス日）を受け取って反映する
+        戻り値: 更新したパターン数
+        """
+        if spend_amount is None:
+            return 0
+        
+        # 台本の保存済みパターンを取得
+        patterns = self._get_script_patterns(cursor, script_type, script_id)
+        if patterns is None:
+            return 0
+        half_lives = self._get_half_lives(cursor)
+        
+        # 重み付けスコア計算（消化金額による重み付け）
+        weight = min(spend_amount / 100000, 10.0)  # 10万円で1.0、最大10.0
+        weighted_score = score * weight * (1.0 if is_good else -0.5)
+        
+        # パターン更新
+        for pattern_type, pattern_content in patterns:
+            # 既存のパターンを検索
             cursor.execute('''
-                SELECT is_good_performance, performance_score, spend_amount 
-                FROM campaign_results 
-                WHERE script_id = ? AND script_type = ?
-                ORDER BY created_at DESC LIMIT 1
-            ''', (script_id, script_type))
-            
-            result = cursor.fetchone()
-            if not result:
-                return
-            
-            is_good, score, spend_amount = result
+                SELECT id, effectiveness_score, frequency_count 
+                FROM learning_patterns 
+                WHERE category_id = ? AND platform = ? AND pattern_type = ? AND pattern_content = ?
+            ''', (category_id, platform, pattern_type, pattern_content))
+        
+            existing = cursor.fetchone()
+        
+            if existing:
+                # 既存パターンを更新
+                pattern_id, current_score, current_count = existing
+                new_score = (current_score * current_count + weighted_score) / (current_count + 1)
+                new_count = current_count + 1
             
-            # 重み付けスコア計算（消化金額による重み付け）
-            weight = min(spend_amount / 100000, 10.0)  # 10万円で1.0、最大10.0
-            weighted_score = score * weight * (1.0 if is_good else -0.5)
-            
-            # パターン抽出と更新
-            patterns = self._extract_patterns(hook, main_content, cta)
-            
-            for pattern_type, pattern_content in patterns:
-                # 既存のパターンを検索
                 cursor.execute('''
-                    SELECT id, effectiveness_score, frequency_count 
-                    FROM learning_patterns 
-                    WHERE category_id = ? AND platform = ? AND pattern_type = ? AND pattern_content = ?
-                ''', (category_id, platform, pattern_type, pattern_content))
-                
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # 既存パターンを更新
-                    pattern_id, current_score, current_count = existing
-                    new_score = (current_score * current_count + weighted_score) / (current_count + 1)
-                    new_count = current_count + 1
-                    
-                    cursor.execute('''
-                        UPDATE learning_patterns 
-                        SET effectiveness_score = ?, frequency_count = ?, last_updated = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    ''', (new_score, new_count, pattern_id))
-                else:
-                    # 新規パターンを追加
-                    cursor.execute('''
-                        INSERT INTO learning_patterns 
-                        (category_id, platform, pattern_type, pattern_content, effectiveness_score, frequency_count)
-                        VALUES (?, ?, ?, ?, ?, 1)
-                    ''', (category_id, platform, pattern_type, pattern_content, weighted_score))
-            
-            conn.commit()
-            print(f"✅ 学習パターンを更新しました: {len(patterns)}件")
-            
-        except Exception as e:
-            print(f"❌ 学習パターンの更新に失敗しました: {str(e)}")
+                    UPDATE learning_patterns 
+                    SET effectiveness_score = ?, frequency_count = ?, last_updated = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (new_score, new_count, pattern_id))
+            else:
+                # 新規パターンを追加
+                cursor.execute('''
+                    INSERT INTO learning_patterns 
+                    (category_id, platform, pattern_type, pattern_content, effectiveness_score, frequency_count)
+                    VALUES (?, ?, ?, ?, ?, 1)
+                ''', (category_id, platform, pattern_type, pattern_content, weighted_score))
+        
+            # 時間減衰スコアを更新（半減期ごとに1行）
+            for half_life in half_lives:
+                self._update_decayed_pattern(cursor, half_life, category_id, platform,
+                                             pattern_type, pattern_content, weighted_score, result_day)
+        
+        return len(patterns)
+    
+    def _update_decayed_pattern(self, cursor, half_life, category_id, platform, pattern_type, pattern_content, value, day):
+        """1パターンの減衰スコアに配信結果を反映（O(1)）"""
+        key = (half_life, category_id, platform, pattern_type, pattern_content)
+        cursor.execute('''
+            SELECT decayed_sum, decayed_weight, last_update
+            FROM learning_pattern_decay
+            WHERE half_life_days = ? AND category_id = ? AND platform = ? AND pattern_type = ? AND pattern_content = ?
+        ''', key)
+        decayed_sum, decayed_weight, last_update = apply_result(cursor.fetchone(), value, day, half_life)
+        cursor.execute('''
+            INSERT INTO learning_pattern_decay
+            (half_life_days, category_id, platform, pattern_type, pattern_content,
+             decayed_sum, decayed_weight, last_update, decayed_score)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(half_life_days, category_id, platform, pattern_type, pattern_content) DO UPDATE SET
+                decayed_sum = excluded.decayed_sum,
+                decayed_weight = excluded.decayed_weight,
+                last_update = excluded.last_update,
+                decayed_score = excluded.decayed_score
+        ''', key + (decayed_sum, decayed_weight, last_update, decayed_sum / decayed_weight))
+    
+    def _get_half_lives(self, cursor):
+        """時間減衰スコアを保持する半減期（日）の一覧"""
+        cursor.execute('SELECT setting_value FROM system_settings WHERE setting_key = ?', (HALF_LIVES_SETTING,))
+        row = cursor.fetchone()
+        return parse_half_lives(row[0] if row else None)
+    
+    def get_learning_half_lives(self):
+        """時間減衰スコアを保持する半減期（日）の一覧を取得"""
+        conn = self.get_connection()
+        try:
+            return self._get_half_lives(conn.cursor())
         finally:
             conn.close()
     
     def _extract_patterns(self, hook, main_content, cta):
         """台本からパターンを抽出"""
-        patterns = []
-        
-        # 数値パターンの抽出
-        all_text = f"{hook or ''} {main_content or ''} {cta or ''}"
-        numbers = re.findall(r'\d+[,\d]*[円％%万億千百十日時間秒分]', all_text)
-        for num in numbers:
-            patterns.append(('numerical', num))
-        
-        # キーワードパターンの抽出
-        keywords = ['限定', '今なら', '今だけ', '無料', '特別', '初回', '送料無料', '返金保証', 
-                   'プロデュース', '認定', '承認', '研究', '効果', '実証', '業界', '最安値']
-        for keyword in keywords:
-            if keyword in all_text:
-                patterns.append(('keyword', keyword))
-        
-        # 文章構造パターンの抽出
-        if hook:
-            if '？' in hook or '?' in hook:
-                patterns.append(('structure', 'question_hook'))
-            
-            if '！' in hook or '!' in hook:
-                patterns.append(('structure', 'exclamation_hook'))
-            
-            # 数字で始まるフック
-            if re.match(r'^\d+', hook):
-                patterns.append(('structure', 'number_start_hook'))
-        
-        # CTAパターンの抽出
-        if cta:
-            if '今すぐ' in cta:
-                patterns.append(('cta_pattern', 'immediate_action'))
-            
-            if 'チェック' in cta:
-                patterns.append(('cta_pattern', 'check_action'))
-            
-            if '試し' in cta:
-                patterns.append(('cta_pattern', 'trial_action'))
+        features = self.feature_extractor.extract(hook, main_content, cta)
+        keywords = features['keywords']
+        
+        # 数値パターン
+        patterns = [('numerical', num) for num in features['numbers']]
+        
+        # キーワードパターン
+        patterns.extend(('keyword', keyword) for keyword in keywords.get('learning_keyword', []))
+        
+        # 文章構造パターン（疑問・感嘆・数字で始まるフック）
+        patterns.extend(('structure', label) for label in keywords.get('hook_structure', []))
+        if features['hook_starts_with_number']:
+            patterns.append(('structure', 'number_start_hook'))
+        
+        # CTAパターン
+        patterns.extend(('cta_pattern', label) for label in keywords.get('learning_cta', []))
+        
+        # 頻出フレーズ（phrase_mining.py で抽出・登録したもの）
+        patterns.extend(('phrase', label) for label in keywords.get('learning_phrase', []))
         
         return patterns
     
-    def get_learning_patterns(self, category_id=None, platform=None, min_effectiveness=0.0):
-        """学習パターンを取得"""
+    # 特徴抽出キーワード辞書の管理メソッド
+    def get_feature_dictionary(self, feature_group=None):
+        """特徴抽出キーワード辞書を取得"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        if feature_group:
+            cursor.execute('''
+                SELECT id, feature_group, keyword, label, scope, weight, sort_order, is_active
+                FROM feature_dictionary WHERE feature_group = ?
+                ORDER BY sort_order, id
+            ''', (feature_group,))
+        else:
+            cursor.execute('''
+                SELECT id, feature_group, keyword, label, scope, weight, sort_order, is_active
+                FROM feature_dictionary ORDER BY sort_order, id
+            ''')
+        
+        entries = cursor.fetchall()
+        conn.close()
+        return entries
+    
+    def add_feature_keyword(self, feature_group, keyword, label=None, scope='all', weight=1):
+        """特徴抽出キーワードを追加"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('SELECT COALESCE(MAX(sort_order), 0) + 1 FROM feature_dictionary')
+            sort_order = cursor.fetchone()[0]
+            cursor.execute('''
+                INSERT INTO feature_dictionary (feature_group, keyword, label, scope, weight, sort_order)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (feature_group, keyword, label or keyword, scope, weight, sort_order))
+            conn.commit()
+            entry_id = cursor.lastrowid
+        except sqlite3.IntegrityError:
+            return None  # 既に登録済みの場合
+        finally:
+            conn.close()
+        
+        self.reload_feature_extractor()
+        return entry_id
+    
+    def delete_feature_keyword(self, entry_id):
+        """特徴抽出キーワードを削除（初期辞書が再登録されないよう無効化する）"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('UPDATE feature_dictionary SET is_active = 0 WHERE id = ?', (entry_id,))
+        conn.commit()
+        conn.close()
+        self.reload_feature_extractor()
+    
+    def replace_feature_group(self, feature_group, keywords, scope='all'):
+        """グループのキーワードを入れ替える（含まれないキーワードは無効化）"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('UPDATE feature_dictionary SET is_active = 0 WHERE feature_group = ?', (feature_group,))
+            cursor.execute('SELECT COALESCE(MAX(sort_order), 0) + 1 FROM feature_dictionary')
+            start = cursor.fetchone()[0]
+            cursor.executemany('''
+                INSERT INTO feature_dictionary (feature_group, keyword, label, scope, sort_order)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(feature_group, keyword) DO UPDATE SET
+                    label = excluded.label, scope = excluded.scope,
+                    sort_order = excluded.sort_order, is_active = 1
+            ''', [(feature_group, keyword, keyword, scope, start + i) for i, keyword in enumerate(keywords)])
+            conn.commit()
+        finally:
+            conn.close()
+        
+        self.reload_feature_extractor()
+    
+    def reload_feature_extractor(self):
+        """辞書の変更を特徴抽出器に反映（保存済みの台本パターンは refresh_script_patterns で作り直す）"""
+        self.feature_extractor = load_feature_extractor(self.db_path)
+    
+    # 減衰スコアの件数は現在時刻まで減衰させるため、一定時間で読み込み直す
+    @cached_read('learning_patterns', 'learning_pattern_decay', 'system_settings', by_category=True, ttl=300)
+    def get_learning_patterns(self, category_id=None, platform=None, min_effectiveness=0.0, half_life=None):
+        """
+        学習パターンを取得
+        half_life（日）を指定すると時間減衰スコアで評価・並べ替えし、件数は現在まで減衰させた重みになる
+        """
+        if half_life is not None:
+            return self._get_decayed_patterns(category_id, platform, min_effectiveness, half_life)
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -691,6 +1573,40 @@ class DatabaseManager:
         conn.close()
         return patterns
     
+    def _get_decayed_patterns(self, category_id, platform, min_effectiveness, half_life):
+        """時間減衰スコアで学習パターンを取得"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            half_lives = self._get_half_lives(cursor)
+            if half_life not in half_lives:
+                raise ValueError(f"半減期 {half_life}日 の減衰スコアは保持していません（設定: {', '.join(map(str, half_lives))}）")
+            
+            query = '''
+                SELECT pattern_type, pattern_content, decayed_score, decayed_weight, last_update
+                FROM learning_pattern_decay
+                WHERE half_life_days = ? AND decayed_score >= ?
+            '''
+            params = [half_life, min_effectiveness]
+            
+            if category_id:
+                query += ' AND category_id = ?'
+                params.append(category_id)
+            
+            if platform:
+                query += ' AND platform = ?'
+                params.append(platform)
+            
+            query += ' ORDER BY decayed_score DESC'
+            
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        return normalize_rows(rows, half_life)
+    
+    @cached_read('learning_patterns', by_category=True)
     def get_learning_statistics(self, category_id=None):
         """学習統計情報を取得"""
         conn = self.get_connection()
@@ -717,24 +1633,38 @@ class DatabaseManager:
         return stats
     
     # NGワード管理メソッド（新規追加）
-    def add_ng_word(self, category_id, word, word_type='exact', reason=None):
-        """NGワードを追加"""
+    def add_ng_word(self, category_id, word, word_type='exact', reason=None, rescan=True):
+        """
+        NGワードを追加（rescan=True の場合は保存済み台本も再チェック）
+        正規表現は構文・計算量・攻撃的な入力での実行時間を検証し、危険なパターンは ValueError
+        """
+        regex_status = None
+        if word_type == 'regex':
+            validate_regex(word)
+            regex_status = 'ok'
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
-                INSERT INTO ng_words (category_id, word, word_type, reason)
-                VALUES (?, ?, ?, ?)
-            ''', (category_id, word, word_type, reason))
+                INSERT INTO ng_words (category_id, word, word_type, reason, regex_status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (category_id, word, word_type, reason, regex_status))
             
             conn.commit()
-            return cursor.lastrowid
+            word_id = cursor.lastrowid
         except sqlite3.IntegrityError:
             return None
         finally:
             conn.close()
+        
+        # 保存済み台本を新しいワードで再チェック
+        if rescan:
+            self.rescan_compliance(category_id)
+        return word_id
     
+    @cached_read('ng_words', 'product_categories', by_category=True)
     def get_ng_words(self, category_id=None):
         """NGワードを取得"""
         conn = self.get_connection()
@@ -760,14 +1690,48 @@ class DatabaseManager:
         conn.close()
         return words
 
-    def delete_ng_word(self, word_id):
-        """NGワードを削除"""
+    def audit_regex_ng_words(self, category_id=None, recheck=False):
+        """
+        登録済みの正規表現NGワードを検証して状態を記録（検証前に登録されたワード用）
+        戻り値: 拒否されたワードの (id, word, 理由) のリスト
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('DELETE FROM ng_words WHERE id = ?', (word_id,))
+        query = "SELECT id, word FROM ng_words WHERE word_type = 'regex'"
+        params = []
+        if not recheck:
+            query += ' AND regex_status IS NULL'
+        if category_id:
+            query += ' AND category_id = ?'
+            params.append(category_id)
+        cursor.execute(query, params)
+        
+        rejected = []
+        for word_id, word in cursor.fetchall():
+            note = static_check(word) or benchmark_pattern(word)
+            cursor.execute('''
+                UPDATE ng_words SET regex_status = ?, regex_note = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', ('rejected' if note else 'ok', note, word_id))
+            if note:
+                rejected.append((word_id, word, note))
+                # 拒否したワードによる違反記録は削除
+                cursor.execute('DELETE FROM compliance_violations WHERE ng_word_id = ?', (word_id,))
+        
         conn.commit()
         conn.close()
+        if rejected:
+            print(f"⚠️ 危険な正規表現のNGワードを無効化しました: {len(rejected)}件")
+        return rejected
+    
+    def delete_ng_word(self, word_id):
+        """NGワードを削除"""
+        def write(cursor):
+            cursor.execute('DELETE FROM ng_words WHERE id = ?', (word_id,))
+            cursor.execute('DELETE FROM compliance_violations WHERE ng_word_id = ?', (word_id,))
+        
+        self._write(write)
     
     def check_ng_words(self, text, category_id):
         """テキストにNGワードが含まれているかチェック"""
@@ -785,12 +1749,168 @@ class DatabaseManager:
                 if word.lower() in text.lower():
                     violations.append(word)
             elif word_type == 'regex':
-                import re
-                if re.search(word, text):
+                if word_data[7] != 'rejected' and match_ng_word(text, word, word_type):
                     violations.append(word)
         
         return violations
 
+    # 保存済み台本のNGワードチェック
+    def _get_ng_word_versions(self, cursor, category_id):
+        """カテゴリーのNGワード（ID順）を (ng_word_id, word, word_type) で取得（拒否された正規表現は除く）"""
+        cursor.execute('''
+            SELECT id, word, word_type FROM ng_words
+            WHERE category_id = ? AND COALESCE(regex_status, 'ok') != 'rejected'
+            ORDER BY id
+        ''', (category_id,))
+        return cursor.fetchall()
+    
+    def _save_compliance_results(self, cursor, script_type, category_id, script_ids, violations, version):
+        """チェック結果（違反とチェック済みバージョン）を保存"""
+        cursor.executemany('''
+            INSERT OR IGNORE INTO compliance_violations
+            (script_type, script_id, category_id, ng_word_id, word, field)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(script_type, script_id, category_id, ng_word_id, word, field)
+              for script_id, ng_word_id, word, field in violations])
+        cursor.executemany('''
+            INSERT INTO compliance_index (script_type, script_id, category_id, checked_version, checked_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(script_type, script_id) DO UPDATE SET
+                category_id = excluded.category_id,
+                checked_version = excluded.checked_version,
+                checked_at = excluded.checked_at
+        ''', [(script_type, script_id, category_id, version) for script_id in script_ids])
+    
+    def _check_script_compliance(self, cursor, script_type, script_id, category_id, fields):
+        """保存・編集した台本を現在のNGワードすべてでチェックし直す"""
+        cursor.execute('DELETE FROM compliance_violations WHERE script_type = ? AND script_id = ?',
+                       (script_type, script_id))
+        ng_words = self._get_ng_word_versions(cursor, category_id) if category_id else []
+        version = ng_words[-1][0] if ng_words else 0
+        violations = [(script_id,) + violation for violation in find_violations(fields, ng_words)]
+        self._save_compliance_results(cursor, script_type, category_id, [script_id], violations, version)
+    
+    def rescan_compliance(self, category_id=None, workers=None, chunk_size=500):
+        """
+        保存済み台本をNGワードで再チェック（各台本は未チェックのワードだけをチェック）
+        戻り値: {'scripts': チェックした台本数, 'violations': 新たに見つかった違反数}
+        """
+        workers = workers or min(4, os.cpu_count() or 1)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        summary = {'scripts': 0, 'violations': 0}
+        
+        try:
+            if category_id:
+                category_ids = [category_id]
+            else:
+                cursor.execute('SELECT id FROM product_categories')
+                category_ids = [row[0] for row in cursor.fetchall()]
+            
+            for cat_id in category_ids:
+                ng_words = self._get_ng_word_versions(cursor, cat_id)
+                if not ng_words:
+                    continue
+                version = ng_words[-1][0]
+                
+                for script_type, table in [('effective', 'effective_scripts'), ('generated', 'generated_scripts')]:
+                    # チェック済みバージョンが古い台本を取得
+                    cursor.execute(f'''
+                        SELECT s.id, COALESCE(ci.checked_version, 0)
+                        FROM {table} s
+                        LEFT JOIN compliance_index ci ON ci.script_type = ? AND ci.script_id = s.id
+                        WHERE s.category_id = ? AND COALESCE(ci.checked_version, 0) < ?
+                        ORDER BY 2, s.id
+                    ''', (script_type, cat_id, version))
+                    pending = cursor.fetchall()
+                    if not pending:
+                        continue
+                    
+                    # 同じバージョンの台本ごとにまとめ、未チェックのワードだけを渡す
+                    chunks = []
+                    for checked_version in sorted(set(row[1] for row in pending)):
+                        ids = [row[0] for row in pending if row[1] == checked_version]
+                        new_words = [word for word in ng_words if word[0] > checked_version]
+                        chunks.extend((ids[i:i + chunk_size], new_words) for i in range(0, len(ids), chunk_size))
+                    
+                    def tasks():
+                        read_cursor = conn.cursor()
+                        for index, (ids, new_words) in enumerate(chunks):
+                            placeholders = ','.join('?' * len(ids))
+                            read_cursor.execute(f'''
+                                SELECT id, title, hook, main_content, call_to_action
+                                FROM {table} WHERE id IN ({placeholders})
+                            ''', ids)
+                            yield index, read_cursor.fetchall(), new_words
+                    
+                    for index, violations in scan_in_parallel(tasks(), min(workers, len(chunks))):
+                        self._save_compliance_results(cursor, script_type, cat_id, chunks[index][0], violations, version)
+                        conn.commit()
+                        summary['scripts'] += len(chunks[index][0])
+                        summary['violations'] += len(violations)
+            
+            print(f"✅ 保存済み台本を再チェックしました: {summary['scripts']}件（違反 {summary['violations']}件）")
+            return summary
+        finally:
+            conn.close()
+    
+    def get_compliance_violations(self, category_id=None, script_type=None):
+        """保存済み台本のNGワード違反を取得（script_type, script_id, word, field, created_at）"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        query = '''
+            SELECT script_type, script_id, word, field, created_at
+            FROM compliance_violations
+            WHERE 1=1
+        '''
+        params = []
+        
+        if category_id:
+            query += ' AND category_id = ?'
+            params.append(category_id)
+        
+        if script_type:
+            query += ' AND script_type = ?'
+            params.append(script_type)
+        
+        query += ' ORDER BY script_type, script_id, ng_word_id'
+        
+        cursor.execute(query, params)
+        violations = cursor.fetchall()
+        conn.close()
+        return violations
+    
+    def get_compliance_summary(self, category_id):
+        """カテゴリーのチェック状況（台本数、未チェック台本数、違反台本数）"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        ng_words = self._get_ng_word_versions(cursor, category_id)
+        version = ng_words[-1][0] if ng_words else 0
+        summary = {'scripts': 0, 'unchecked': 0, 'violating': 0}
+        
+        for script_type, table in [('effective', 'effective_scripts'), ('generated', 'generated_scripts')]:
+            cursor.execute(f'''
+                SELECT COUNT(*),
+                       SUM(CASE WHEN COALESCE(ci.checked_version, 0) < ? THEN 1 ELSE 0 END)
+                FROM {table} s
+                LEFT JOIN compliance_index ci ON ci.script_type = ? AND ci.script_id = s.id
+                WHERE s.category_id = ?
+            ''', (version, script_type, category_id))
+            total, unchecked = cursor.fetchone()
+            summary['scripts'] += total or 0
+            summary['unchecked'] += unchecked or 0
+        
+        cursor.execute('''
+            SELECT COUNT(DISTINCT script_type || ':' || script_id)
+            FROM compliance_violations WHERE category_id = ?
+        ''', (category_id,))
+        summary['violating'] = cursor.fetchone()[0]
+        
+        conn.close()
+        return summary
+
 # データベース初期化とテスト
 if __name__ == "__main__":
     print("=== 統合版DatabaseManagerテスト開始 ===")
@@ -878,6 +1998,17 @@ if __name__ == "__main__":
     print(f"  評価結果: {evaluation3} ({'良い' if evaluation3 else '悪い'})")
     print(f"  スコア: {score3:.2f}")
     
+    # テスト4: 一括スコアリングとスカラー版の一致
+    print("\nテスト4（一括スコアリング）:")
+    test_frame = pd.DataFrame([test_results1, test_results2, test_results3])
+    batch_scores = score_results(test_frame, test_targets)
+    for i, test_results in enumerate([test_results1, test_results2, test_results3]):
+        same = (
+            bool(batch_scores['is_good_performance'].iloc[i]) == db._evaluate_performance(test_results, test_targets)
+            and batch_scores['performance_score'].iloc[i] == db._calculate_performance_score(test_results, test_targets)
+        )
+        print(f"  結果{i + 1}: {'一致' if same else '不一致'}")
+    
     print("\n✅ 空白値処理のテストが完了しました！")
     print("エラーが発生しなければ修正成功です🎉")
     
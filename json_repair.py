@@ -0,0 +1,133 @@
+"""
+LLMレスポンスのJSON修復ユーティリティ
+
+コードフェンス、末尾カンマ、スマートクォート、max_tokensでの途中切れなど
+よくある崩れを手元で修復してから json.loads します。
+"""
+import json
+import re
+
+# 台本JSONのスキーマ（Structured Outputs用）
+SCRIPT_FIELDS = ['title', 'hook', 'main_content', 'call_to_action', 'script_content']
+
+SCRIPT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {field: {"type": "string"} for field in SCRIPT_FIELDS},
+    "required": SCRIPT_FIELDS,
+    "additionalProperties": False
+}
+
+_CODE_FENCE_PATTERN = re.compile(r'```(?:json|JSON)?')
+_DECODER = json.JSONDecoder()
+_SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '„': '"', '＂': '"'})
+
+
+def _strip_to_object(text):
+    """コードフェンスを除去し、最初の { 以降を返す"""
+    text = _CODE_FENCE_PATTERN.sub('', text)
+    start_idx = text.find('{')
+    if start_idx == -1:
+        return None
+    return text[start_idx:]
+
+
+def _remove_trailing_commas(text):
+    """文字列リテラルの外にある末尾カンマを除去"""
+    result = []
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ',':
+            rest = text[i + 1:].lstrip()
+            if rest[:1] in ('}', ']'):
+                continue
+        result.append(ch)
+    return ''.join(result)
+
+
+def _close_truncated(text):
+    """途中で切れたJSONを閉じる（開いた文字列・配列・オブジェクトを補完）"""
+    stack = []
+    in_string = False
+    escape = False
+    last_safe = 0  # 直前の値が完結した位置
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[:i + 1]
+        elif ch == ',':
+            last_safe = i
+
+    if not stack:
+        return text
+
+    repaired = text
+    if in_string:
+        if escape:
+            repaired = repaired[:-1]
+        repaired += '"'
+
+    # 「"key":」や「"key"」で終わっている場合は、その不完全なペアを落とす
+    stripped = repaired.rstrip()
+    tail = stripped[last_safe + 1:].strip() if last_safe else ''
+    if stripped.endswith(':') or (tail.startswith('"') and ':' not in tail):
+        repaired = stripped[:last_safe] if last_safe else stripped
+
+    return repaired.rstrip().rstrip(',') + ''.join(reversed(stack))
+
+
+def repair_json(text):
+    """
+    崩れたJSONテキストを修復して解析する
+    戻り値: (データ, 結果) 結果は 'ok' / 'repaired' / 'truncated'
+    修復できない場合は ValueError
+    """
+    candidate = _strip_to_object(text or '')
+    if candidate is None:
+        raise ValueError("JSON形式が見つかりません")
+
+    # 1. そのまま（後ろに余計なテキストがあっても最初のオブジェクトだけを読む）
+    try:
+        return _DECODER.raw_decode(candidate)[0], 'ok'
+    except json.JSONDecodeError:
+        pass
+
+    # 2. 末尾カンマ・スマートクォートの修復
+    attempts = [_remove_trailing_commas(candidate)]
+    attempts.append(_remove_trailing_commas(candidate.translate(_SMART_QUOTES)))
+    for attempt in attempts:
+        try:
+            return _DECODER.raw_decode(attempt)[0], 'repaired'
+        except json.JSONDecodeError:
+            pass
+
+    # 3. 途中切れの補完
+    for attempt in attempts:
+        try:
+            return json.loads(_remove_trailing_commas(_close_truncated(attempt))), 'truncated'
+        except json.JSONDecodeError:
+            continue
+
+    raise ValueError("JSONを修復できませんでした")
@@ -0,0 +1,350 @@
+"""
+学習エンジンのリプレイベンチマーク
+
+配信結果の列（合成データ、または既存データベースに記録された結果）を、一時データベースに対して
+実際のコード（DatabaseManager.add_campaign_result → 良し悪し判定 → 学習パターン更新）で順に処理し、
+1秒あたりの処理件数、1件あたりのレイテンシ（p50 / p99）、処理後のテーブルの行数を表示します。
+learning_patterns が増えるにつれて遅くなっていないかを見るため、区間ごとの p50 も表示します。
+
+--compare に別の実装（過去のコミットをチェックアウトしたディレクトリなど）を指定すると、
+同じ結果の列を両方の実装で処理し、速度と処理後の学習状態（learning_patterns / learning_pattern_decay）が
+一致するかを比較します。各実装は別プロセスで実行します。
+
+使用例:
+    python learning_benchmark.py --results 5000
+    python learning_benchmark.py --source-db ad_script_database.db --limit 10000
+    git worktree add /tmp/baseline HEAD~1
+    python learning_benchmark.py --results 3000 --compare /tmp/baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+PLATFORMS = ['TikTok', 'Instagram Reels', 'YouTube Shorts']
+HOOK_WORDS = ['今だけ', '限定', '無料', '初回', '特別', '今なら', '送料無料', '返金保証']
+MAIN_WORDS = ['効果', '実証', '研究', '認定', '業界', '最安値', 'プロデュース', '承認']
+CTA_WORDS = ['今すぐ', 'チェック', '試し']
+TARGETS = {'ctr': 1.5, 'cpc': 80.0, 'mcvr': 2.0, 'mcpa': 3000.0, 'cvr': 1.0, 'cpa': 8000.0}
+
+# 学習状態の比較で許容する相対誤差（時間減衰の値は実行時刻の差でわずかに変わる）
+STATE_TOLERANCE = 1e-6
+
+
+def generate_workload(results=5000, categories=3, scripts_per_category=40, seed=1):
+    """合成の配信結果の列（台本の語句・数値・成果指標は乱数、seed が同じなら同じ列）"""
+    rng = random.Random(seed)
+    workload = {'categories': [], 'scripts': [], 'results': []}
+    for c in range(categories):
+        workload['categories'].append({'name': f'ベンチマーク商材{c + 1}', 'targets': TARGETS})
+        for s in range(scripts_per_category):
+            number = rng.choice([3, 5, 7, 10, 30, 50, 90, 100, rng.randint(1, 999)])
+            hook = f"{number}日で{rng.choice(HOOK_WORDS)}{rng.choice(['！', '？', ''])}"
+            main = '、'.join(rng.sample(MAIN_WORDS, 2)) + f"で{rng.randint(1, 99)}%の実感"
+            cta = f"{rng.choice(CTA_WORDS)}してください"
+            workload['scripts'].append({
+                'category': c,
+                'script_type': 'generated',
+                'platform': rng.choice(PLATFORMS),
+                'script': {'title': f'台本{c + 1}-{s + 1}', 'hook': hook, 'main_content': main,
+                           'call_to_action': cta, 'script_content': f'{hook}\n{main}\n{cta}'},
+            })
+
+    for _ in range(results):
+        index = rng.randrange(len(workload['scripts']))
+        quality = rng.lognormvariate(0, 0.4)  # 1.0 で目標値ちょうど
+        impressions = rng.randint(1000, 200000)
+        clicks = max(1, int(impressions * TARGETS['ctr'] / 100 * quality))
+        conversions = max(0, int(clicks * TARGETS['cvr'] / 100 * quality))
+        spend = round(clicks * TARGETS['cpc'] / quality, 0)
+        workload['results'].append({
+            'script': index,
+            'results': {
+                'ctr': clicks / impressions * 100, 'cpc': spend / clicks,
+                'mcvr': TARGETS['mcvr'] * quality, 'mcpa': TARGETS['mcpa'] / quality,
+                'cvr': conversions / clicks * 100,
+                'cpa': spend / conversions if conversions else spend,
+                'spend_amount': spend, 'impressions': impressions, 'clicks': clicks,
+                'conversions': conversions, 'start_date': '2026-01-01', 'end_date': '2026-01-31',
+            },
+        })
+    return workload
+
+
+def load_workload(source_db, limit=None):
+    """記録済みのデータベースから配信結果の列（ID順）を読み込む"""
+    from script_text import decode_script_content
+
+    conn = sqlite3.connect(source_db)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, category_name, target_ctr, target_cpc, target_mcvr, target_mcpa, target_cvr, target_cpa
+        FROM product_categories ORDER BY id
+    ''')
+    categories = {}
+    workload = {'categories': [], 'scripts': [], 'results': []}
+    for row in cursor.fetchall():
+        categories[row[0]] = len(workload['categories'])
+        workload['categories'].append({'name': row[1], 'targets': dict(zip(TARGETS, row[2:]))})
+
+    cursor.execute(f'''
+        SELECT script_id, script_type, category_id, platform, ctr, cpc, mcvr, mcpa, cvr, cpa,
+               spend_amount, impressions, clicks, conversions, campaign_period_start, campaign_period_end
+        FROM campaign_results ORDER BY id {'LIMIT ?' if limit else ''}
+    ''', (limit,) if limit else ())
+    rows = cursor.fetchall()
+
+    # 台本本文の保存形式（script_text.py）に対応したデータベースなら、保存形式から本文を戻す
+    cursor.execute('PRAGMA table_info(generated_scripts)')
+    compact = 'script_content_codec' in {column[1] for column in cursor.fetchall()}
+    scripts = {}
+    for row in rows:
+        script_id, script_type, category_id = row[0], row[1], row[2]
+        if category_id not in categories:
+            continue
+        key = (script_type, script_id)
+        if key not in scripts:
+            table = 'effective_scripts' if script_type == 'effective' else 'generated_scripts'
+            if compact:
+                cursor.execute(f'''
+                    SELECT t.title, t.hook, t.main_content, t.call_to_action, t.script_content, t.platform,
+                           t.script_content_codec, sb.body
+                    FROM {table} t LEFT JOIN script_bodies sb ON sb.content_hash = t.script_content_hash
+                    WHERE t.id = ?
+                ''', (script_id,))
+            else:
+                cursor.execute(f'''
+                    SELECT title, hook, main_content, call_to_action, script_content, platform
+                    FROM {table} WHERE id = ?
+                ''', (script_id,))
+            script = cursor.fetchone()
+            if script is None:
+                continue
+            if compact:
+                script = script[:4] + (decode_script_content(script[4], script[6], script[7], *script[1:4]), script[5])
+            scripts[key] = len(workload['scripts'])
+            workload['scripts'].append({
+                'category': categories[category_id],
+                'script_type': 'effective' if script_type == 'effective' else 'generated',
+                'platform': script[5],
+                'script': dict(zip(['title', 'hook', 'main_content', 'call_to_action', 'script_content'], script[:5])),
+            })
+        workload['results'].append({
+            'script': scripts[key],
+            'platform': row[3],
+            'results': dict(zip(['ctr', 'cpc', 'mcvr', 'mcpa', 'cvr', 'cpa', 'spend_amount', 'impressions',
+                                 'clicks', 'conversions', 'start_date', 'end_date'], row[4:])),
+        })
+    conn.close()
+    return workload
+
+
+def percentile(values, q):
+    """q（0〜100）パーセンタイル（最近傍）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def table_sizes(db_path):
+    conn = sqlite3.connect(db_path)
+    sizes = {}
+    for table in ['campaign_results', 'learning_patterns', 'learning_pattern_decay', 'script_patterns']:
+        try:
+            sizes[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        except sqlite3.OperationalError:
+            sizes[table] = None  # このテーブルがない実装
+    conn.close()
+    return sizes
+
+
+def learning_state(db_path):
+    """比較用の学習状態（カテゴリー名で対応づけ、並べ替えた行）"""
+    conn = sqlite3.connect(db_path)
+    state = {}
+    state['learning_patterns'] = sorted(conn.execute('''
+        SELECT pc.category_name, lp.platform, lp.pattern_type, lp.pattern_content,
+               lp.effectiveness_score, lp.frequency_count
+        FROM learning_patterns lp JOIN product_categories pc ON pc.id = lp.category_id
+    ''').fetchall())
+    try:
+        state['learning_pattern_decay'] = sorted(conn.execute('''
+            SELECT lpd.half_life_days, pc.category_name, lpd.platform, lpd.pattern_type, lpd.pattern_content,
+                   lpd.decayed_score, lpd.decayed_weight
+            FROM learning_pattern_decay lpd JOIN product_categories pc ON pc.id = lpd.category_id
+        ''').fetchall())
+    except sqlite3.OperationalError:
+        state['learning_pattern_decay'] = None
+    conn.close()
+    return state
+
+
+def compare_states(first, second, tolerance=STATE_TOLERANCE):
+    """学習状態の差分（なければ空のリスト）"""
+    differences = []
+    for table in first:
+        rows_a, rows_b = first[table], second.get(table)
+        if rows_a is None or rows_b is None:
+            if rows_a != rows_b:
+                differences.append(f"{table}: 一方の実装にのみ存在します")
+            continue
+        if len(rows_a) != len(rows_b):
+            differences.append(f"{table}: 行数が異なります（{len(rows_a)} / {len(rows_b)}）")
+            continue
+        for row_a, row_b in zip(rows_a, rows_b):
+            for value_a, value_b in zip(row_a, row_b):
+                if isinstance(value_a, float) or isinstance(value_b, float):
+                    same = math.isclose(value_a, value_b, rel_tol=tolerance, abs_tol=tolerance)
+                else:
+                    same = value_a == value_b
+                if not same:
+                    differences.append(f"{table}: {row_a} != {row_b}")
+                    break
+            if len(differences) >= 10:
+                return differences
+    return differences
+
+
+def replay(workload, db_path, buckets=5):
+    """配信結果の列を現在の sys.path の DatabaseManager で処理し、計測結果を返す"""
+    from database import DatabaseManager
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = DatabaseManager(db_path)
+        category_ids = [db.add_product_category(category['name'], category['targets'])
+                        for category in workload['categories']]
+        script_ids = []
+        for entry in workload['scripts']:
+            script, category_id = entry['script'], category_ids[entry['category']]
+            if entry['script_type'] == 'effective':
+                script_ids.append(db.add_effective_script(category_id, script['title'], script['hook'],
+                                                          script['main_content'], script['call_to_action'],
+                                                          entry['platform'], ''))
+            else:
+                script_ids.append(db.add_generated_script(category_id, script, entry['platform']))
+
+    latencies = []
+    bucket_size = max(1, math.ceil(len(workload['results']) / buckets))
+    growth = []
+    started = time.perf_counter()
+    for i, entry in enumerate(workload['results']):
+        script = workload['scripts'][entry['script']]
+        platform = entry.get('platform') or script['platform']
+        call_started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.add_campaign_result(script_ids[entry['script']], script['script_type'],
+                                   category_ids[script['category']], platform, entry['results'])
+        latencies.append(time.perf_counter() - call_started)
+
+        if (i + 1) % bucket_size == 0 or i + 1 == len(workload['results']):
+            # 区間ごとの p50 と、その時点の learning_patterns の行数（計測時間には含めない）
+            bucket = latencies[-((i % bucket_size) + 1):]
+            growth.append({'results': i + 1, 'p50_ms': percentile(bucket, 50) * 1000,
+                           'learning_patterns': table_sizes(db_path)['learning_patterns']})
+    elapsed = time.perf_counter() - started
+
+    write_queue = getattr(db, 'write_queue', None)
+    if write_queue is not None:
+        write_queue.close()
+    return {
+        'results': len(latencies),
+        'seconds': elapsed,
+        'results_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'growth': growth,
+        'tables': table_sizes(db_path),
+    }
+
+
+def run_implementation(code_dir, workload_path, output_path, buckets):
+    """別プロセスで code_dir の実装を使ってリプレイする"""
+    command = [sys.executable, os.path.abspath(__file__), '--worker', workload_path, output_path,
+               '--code-dir', code_dir, '--buckets', str(buckets)]
+    completed = subprocess.run(command, cwd=code_dir, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{code_dir} の実行に失敗しました:\n{completed.stderr[-2000:]}")
+    with open(output_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def print_report(label, report):
+    print(f"📊 {label}: {report['results']}件 / {report['seconds']:.2f}秒"
+          f"（{report['results_per_second']:.0f}件/秒、p50 {report['p50_ms']:.2f}ms、p99 {report['p99_ms']:.2f}ms）")
+    for point in report['growth']:
+        print(f"   〜{point['results']}件: p50 {point['p50_ms']:.2f}ms（learning_patterns {point['learning_patterns']}行）")
+    print("   テーブル: " + '、'.join(f"{table} {count}行" for table, count in report['tables'].items()
+                                   if count is not None))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='学習エンジン（配信結果の追加と学習パターン更新）のリプレイベンチマーク')
+    parser.add_argument('--results', type=int, default=5000, help='合成する配信結果の件数')
+    parser.add_argument('--categories', type=int, default=3, help='合成する商材カテゴリー数')
+    parser.add_argument('--scripts', type=int, default=40, help='カテゴリーごとの合成台本数')
+    parser.add_argument('--seed', type=int, default=1, help='合成データの乱数シード')
+    parser.add_argument('--source-db', help='記録済みの配信結果を読み込むデータベース（指定時は合成しない）')
+    parser.add_argument('--limit', type=int, help='--source-db から読み込む配信結果の最大件数')
+    parser.add_argument('--buckets', type=int, default=5, help='レイテンシの推移を表示する区間数')
+    parser.add_argument('--compare', metavar='CODE_DIR', help='比較する別の実装のディレクトリ')
+    parser.add_argument('--worker', nargs=2, metavar=('WORKLOAD', 'OUTPUT'), help=argparse.SUPPRESS)
+    parser.add_argument('--code-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        # 子プロセス: 指定された実装を読み込んでリプレイし、計測結果と学習状態を書き出す
+        sys.path.insert(0, os.path.abspath(args.code_dir))
+        with open(args.worker[0], encoding='utf-8') as f:
+            workload = json.load(f)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'replay.db')
+            report = replay(workload, db_path, args.buckets)
+            report['state'] = learning_state(db_path)
+        with open(args.worker[1], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+        return 0
+
+    if args.source_db:
+        workload = load_workload(args.source_db, args.limit)
+    else:
+        workload = generate_workload(args.results, args.categories, args.scripts, args.seed)
+    print(f"🔁 配信結果 {len(workload['results'])}件（台本 {len(workload['scripts'])}件）をリプレイします")
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        workload_path = os.path.join(tmp, 'workload.json')
+        with open(workload_path, 'w', encoding='utf-8') as f:
+            json.dump(workload, f, ensure_ascii=False)
+
+        current = run_implementation(current_dir, workload_path, os.path.join(tmp, 'current.json'), args.buckets)
+        print_report('現在の実装', current)
+        if not args.compare:
+            return 0
+
+        other = run_implementation(os.path.abspath(args.compare), workload_path,
+                                   os.path.join(tmp, 'other.json'), args.buckets)
+        print_report(f'比較対象（{args.compare}）', other)
+
+    speedup = current['results_per_second'] / other['results_per_second'] if other['results_per_second'] else 0.0
+    print(f"⚡ 処理速度: 比較対象の {speedup:.2f}倍")
+    differences = compare_states(current['state'], other['state'])
+    if differences:
+        print("❌ 学習状態が一致しません:")
+        for difference in differences:
+            print(f"   {difference}")
+        return 1
+    print("✅ 学習状態は一致しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+学習パターンの時間減衰スコア
+
+配信結果ごとの重み付けスコアを、半減期に応じて指数的に減衰させながら平均します。
+パターンごとに (減衰済みスコア合計, 減衰済み重み, 最終更新) だけを保存し、
+配信結果1件につき O(1) で更新します（履歴の再走査は不要）。
+
+- 減衰平均（decayed_sum / decayed_weight）は合計と重みが同じ割合で減衰するため、
+  保存した値がそのまま「現在」の値になり、インデックスで並べ替えられます。
+- 減衰済み重み（実質的な件数）は読み込み時に現在の時刻まで減衰させます。
+"""
+import time
+
+# 半減期（日）の初期設定（system_settings の learning_half_lives で変更可能）
+DEFAULT_HALF_LIVES = (30, 90, 365)
+HALF_LIVES_SETTING = 'learning_half_lives'
+
+
+def julian_day(timestamp=None):
+    """UNIX時刻をユリウス日に変換（SQLiteの julianday() と同じ単位、省略時は現在）"""
+    if timestamp is None:
+        timestamp = time.time()
+    return timestamp / 86400.0 + 2440587.5
+
+
+def decay_factor(elapsed_days, half_life_days):
+    """経過日数分の減衰率"""
+    return 0.5 ** (max(elapsed_days, 0.0) / half_life_days)
+
+
+def apply_result(state, value, day, half_life_days):
+    """
+    減衰状態に配信結果を1件反映
+    state: (decayed_sum, decayed_weight, last_update) またはNone
+    day: 配信結果の日時（ユリウス日）
+    戻り値: 新しい (decayed_sum, decayed_weight, last_update)
+    """
+    if state is None:
+        return value, 1.0, day
+    decayed_sum, decayed_weight, last_update = state
+    # 古い日時の結果が後から入力された場合は、その結果の方を減衰させる
+    latest = max(last_update, day)
+    old_factor = decay_factor(latest - last_update, half_life_days)
+    new_factor = decay_factor(latest - day, half_life_days)
+    return (decayed_sum * old_factor + value * new_factor,
+            decayed_weight * old_factor + new_factor,
+            latest)
+
+
+def parse_half_lives(value):
+    """設定値（カンマ区切りの日数）を半減期のタプルに変換"""
+    if not value:
+        return DEFAULT_HALF_LIVES
+    half_lives = []
+    for item in str(value).split(','):
+        item = item.strip()
+        if not item:
+            continue
+        half_life = float(item)
+        if half_life <= 0:
+            raise ValueError(f"半減期は正の日数で指定してください: {item}")
+        half_lives.append(int(half_life) if half_life.is_integer() else half_life)
+    return tuple(sorted(set(half_lives))) or DEFAULT_HALF_LIVES
+
+
+def normalize_rows(rows, half_life_days, now=None):
+    """
+    (pattern_type, pattern_content, decayed_score, decayed_weight, last_update) の行を
+    get_learning_patterns と同じ (pattern_type, pattern_content, スコア, 件数) の形にする
+    件数は現在まで減衰させた重み
+    """
+    now = julian_day() if now is None else now
+    return [
+        (pattern_type, pattern_content, score, weight * decay_factor(now - last_update, half_life_days))
+        for pattern_type, pattern_content, score, weight, last_update in rows
+    ]
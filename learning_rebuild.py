@@ -0,0 +1,244 @@
+"""
+学習パターンの一括再構築ジョブ
+
+台本パターン（script_patterns）を抽出し直したうえで、campaign_results と結合しながら
+少しずつ読み込み、消化金額重み付きスコアの集計を pandas の groupby でまとめて行い、
+新しい learning_patterns テーブルに置き換えます。
+時間減衰スコア（learning_pattern_decay）も同じ読み込みで半減期ごとに集計し、同時に置き換えます。
+目標値・キーワード・重み付けを変更したあとに既存データへ反映するために使います。
+
+使用例:
+    python learning_rebuild.py --db-path ad_script_database.db --rescore
+"""
+import argparse
+import sys
+import time
+
+import pandas as pd
+
+from database import DatabaseManager
+from retention import attach_archive
+
+# アーカイブに移した配信結果も含める（retention.py）
+RESULT_COLUMNS = 'id, script_id, script_type, category_id, platform, is_good_performance, performance_score, spend_amount, created_at'
+ARCHIVED_RESULTS = f'''(
+    SELECT {RESULT_COLUMNS} FROM main.campaign_results
+    UNION ALL
+    SELECT {RESULT_COLUMNS} FROM archive.campaign_results
+)'''
+
+RESULT_QUERY = '''
+    SELECT cr.category_id, cr.platform, cr.is_good_performance, cr.performance_score,
+           cr.spend_amount, cr.created_at, julianday(cr.created_at) AS result_day,
+           sp.pattern_type, sp.pattern_content, sp.occurrence_count
+    FROM {results} cr
+    JOIN script_patterns sp
+      ON sp.script_type = CASE WHEN cr.script_type = 'effective' THEN 'effective' ELSE 'generated' END
+     AND sp.script_id = cr.script_id
+    WHERE cr.is_good_performance = 1
+      AND cr.spend_amount IS NOT NULL
+    ORDER BY cr.id
+'''
+
+GROUP_KEYS = ['category_id', 'platform', 'pattern_type', 'pattern_content']
+DECAY_KEYS = ['half_life_days'] + GROUP_KEYS
+DECAY_COLUMNS = DECAY_KEYS + ['decayed_sum', 'decayed_weight', 'last_update', 'decayed_score']
+
+
+def weighted_scores(frame):
+    """消化金額による重み付けスコア（_update_learning_patterns と同じ式）"""
+    weight = (frame['spend_amount'] / 100000).clip(upper=10.0)  # 10万円で1.0、最大10.0
+    sign = frame['is_good_performance'].map(lambda good: 1.0 if good else -0.5)
+    return frame['performance_score'] * weight * sign
+
+
+def _decay_partial(chunk, half_life):
+    """1チャンク分の減衰スコアを集計（各パターンの最終日時まで減衰させた合計と重み）"""
+    last_update = chunk.groupby(GROUP_KEYS, sort=False, dropna=False)['result_day'].transform('max')
+    factor = 0.5 ** ((last_update - chunk['result_day']) / half_life)
+    frame = chunk[GROUP_KEYS].copy()
+    frame['half_life_days'] = half_life
+    frame['decayed_sum'] = chunk['score_sum'] * factor
+    frame['decayed_weight'] = chunk['occurrence_count'] * factor
+    frame['last_update'] = last_update
+    return (
+        frame.groupby(DECAY_KEYS, sort=False, dropna=False)
+        .agg(decayed_sum=('decayed_sum', 'sum'),
+             decayed_weight=('decayed_weight', 'sum'),
+             last_update=('last_update', 'max'))
+        .reset_index()
+    )
+
+
+def _combine_decay(partials):
+    """減衰スコアの部分集計を、パターンごとの最終日時にそろえて合算"""
+    frame = pd.concat(partials, ignore_index=True)
+    last_update = frame.groupby(DECAY_KEYS, sort=False, dropna=False)['last_update'].transform('max')
+    factor = 0.5 ** ((last_update - frame['last_update']) / frame['half_life_days'])
+    frame['decayed_sum'] = frame['decayed_sum'] * factor
+    frame['decayed_weight'] = frame['decayed_weight'] * factor
+    frame['last_update'] = last_update
+    return (
+        frame.groupby(DECAY_KEYS, sort=False, dropna=False)
+        .agg(decayed_sum=('decayed_sum', 'sum'),
+             decayed_weight=('decayed_weight', 'sum'),
+             last_update=('last_update', 'max'))
+        .reset_index()
+    )
+
+
+def aggregate_learning_patterns(db, chunk_size=5000, half_lives=()):
+    """
+    配信結果を少しずつ読み込み、パターンごとの（スコア合計, 件数, 最終更新）を集計
+    half_lives を指定すると、半減期ごとの減衰スコアも同じ読み込みで集計する
+    戻り値: (パターン, 減衰スコア, 配信結果数)
+    """
+    conn = db.get_connection()
+    partials = []
+    decay_partials = []
+
+    try:
+        archived = attach_archive(conn, db.db_path) and _has_archived_results(conn)
+        results = ARCHIVED_RESULTS if archived else 'campaign_results'
+        # 結果×台本パターンの行を少しずつ読み込む（パターン抽出は script_patterns に保存済み）
+        for chunk in pd.read_sql_query(RESULT_QUERY.format(results=results), conn, chunksize=chunk_size):
+            # 同じパターンが台本内に複数回あれば、その回数分だけ学習に反映される
+            chunk['score_sum'] = weighted_scores(chunk) * chunk['occurrence_count']
+            partials.append(
+                chunk.groupby(GROUP_KEYS, sort=False, dropna=False)
+                .agg(score_sum=('score_sum', 'sum'),
+                     frequency_count=('occurrence_count', 'sum'),
+                     last_updated=('created_at', 'max'))
+                .reset_index()
+            )
+            decay_partials.extend(_decay_partial(chunk, half_life) for half_life in half_lives)
+
+            # 部分集計が増えすぎないように途中でまとめる
+            if len(partials) >= 20:
+                partials = [_combine(partials)]
+                if decay_partials:
+                    decay_partials = [_combine_decay(decay_partials)]
+
+        total_results = conn.execute(f'''
+            SELECT COUNT(*) FROM {results}
+            WHERE is_good_performance = 1 AND spend_amount IS NOT NULL
+        ''').fetchone()[0]
+    finally:
+        conn.close()
+
+    if not partials:
+        return (pd.DataFrame(columns=GROUP_KEYS + ['effectiveness_score', 'frequency_count', 'last_updated']),
+                pd.DataFrame(columns=DECAY_COLUMNS), total_results)
+
+    combined = _combine(partials)
+    combined['effectiveness_score'] = combined['score_sum'] / combined['frequency_count']
+
+    decayed = _combine_decay(decay_partials) if decay_partials else pd.DataFrame(columns=DECAY_COLUMNS)
+    decayed['decayed_score'] = decayed['decayed_sum'] / decayed['decayed_weight']
+    return combined.drop(columns=['score_sum']), decayed[DECAY_COLUMNS], total_results
+
+
+def _has_archived_results(conn):
+    """アーカイブに配信結果のテーブルがあるか"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM archive.sqlite_master WHERE type = 'table' AND name = 'campaign_results'"
+    ).fetchone()[0] > 0
+
+
+def _combine(partials):
+    """部分集計を結合して再集計"""
+    return (
+        pd.concat(partials, ignore_index=True)
+        .groupby(GROUP_KEYS, sort=False, dropna=False)
+        .agg(score_sum=('score_sum', 'sum'),
+             frequency_count=('frequency_count', 'sum'),
+             last_updated=('last_updated', 'max'))
+        .reset_index()
+    )
+
+
+def _swap_table(db, cursor, table, columns, rows):
+    """
+    同じ定義の新しいテーブルに rows を書き込み、既存テーブルと入れ替える
+    呼び出し元のトランザクション内で実行する（インデックス・トリガーは作り直す）
+    """
+    rebuild_table = f'{table}_rebuild'
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    table_sql = cursor.fetchone()[0]
+    # テーブルに付随するインデックス・トリガーは入れ替え後に作り直す
+    cursor.execute('''
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    ''', (table,))
+    dependent_sql = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute(f'DROP TABLE IF EXISTS {rebuild_table}')
+    cursor.execute(table_sql.replace(table, rebuild_table, 1))
+
+    rows = rows[columns].astype(object)
+    cursor.executemany(f'''
+        INSERT INTO {rebuild_table} ({', '.join(columns)})
+        VALUES ({', '.join('?' * len(columns))})
+    ''', rows.where(rows.notna(), None).itertuples(index=False, name=None))
+
+    cursor.execute(f'DROP TABLE {table}')
+    cursor.execute(f'ALTER TABLE {rebuild_table} RENAME TO {table}')
+    for sql in dependent_sql:
+        cursor.execute(sql)
+    # 入れ替えたテーブルにはトリガーが働かないため、変更バージョンを直接進める
+    db.touch_data_version(cursor, table)
+
+
+def swap_learning_patterns(db, patterns, decayed=None):
+    """新しい learning_patterns（と learning_pattern_decay）を作成し、1トランザクションで既存テーブルと入れ替える"""
+    conn = db.get_connection()
+    conn.isolation_level = None  # トランザクションを明示的に制御する
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        _swap_table(db, cursor, 'learning_patterns',
+                    GROUP_KEYS + ['effectiveness_score', 'frequency_count', 'last_updated'], patterns)
+        if decayed is not None:
+            _swap_table(db, cursor, 'learning_pattern_decay', DECAY_COLUMNS, decayed)
+        cursor.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def rebuild_learning_patterns(db, rescore=False, chunk_size=5000):
+    """学習パターンを配信結果の全履歴から再構築"""
+    started = time.perf_counter()
+
+    if rescore:
+        # 現在の目標値で良し悪し判定・スコアを付け直してから集計する
+        db.rescore_category_results()
+
+    # 抽出ルールの変更を反映するため、台本パターンを作り直してから集計する
+    db.refresh_script_patterns()
+    patterns, decayed, total_results = aggregate_learning_patterns(db, chunk_size, db.get_learning_half_lives())
+    swap_learning_patterns(db, patterns, decayed)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ 学習パターンを再構築しました: 配信結果 {total_results}件 → パターン {len(patterns)}件（{elapsed:.1f}秒）")
+    return {'results': total_results, 'patterns': len(patterns), 'seconds': elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='配信結果の全履歴から learning_patterns を再構築します')
+    parser.add_argument('--db-path', default='ad_script_database.db', help='データベースファイル')
+    parser.add_argument('--rescore', action='store_true', help='現在の目標値で配信結果を再評価してから再構築する')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='1度に読み込む配信結果の件数')
+    args = parser.parse_args(argv)
+
+    db = DatabaseManager(args.db_path)
+    rebuild_learning_patterns(db, rescore=args.rescore, chunk_size=args.chunk_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,12 +5,16 @@ from datetime import datetime, date
 import json
 import sys
 import os
+import uuid
 
 # 現在のディレクトリをパスに追加
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database import DatabaseManager
 from openai_integration import OpenAIIntegration
+from learning_rebuild import rebuild_learning_patterns
+from phrase_mining import mine_phrases
+from analytics_cache import AnalyticsCache, daily_performance, filter_results, result_summary
 
 # ページ設定
 st.set_page_config(
@@ -29,8 +33,32 @@ def init_services():
 
 db, openai_service = init_services()
 
+# データの変更バージョン（データベースのトリガーで更新され、どのプロセスからの書き込みでも進む）
+def data_version(*tables, category_id=None):
+    """テーブルの変更バージョン（読み込み用キャッシュのキー）"""
+    versions = db.get_data_versions(category_id, tables)
+    return tuple(versions[table] for table in tables)
+
+# 配信結果の列指向キャッシュ（プロセス内で共有）
+@st.cache_resource
+def get_analytics_cache():
+    return AnalyticsCache()
+
+# 読み込み用キャッシュ（DatabaseManager の読み込みメソッドが共有キャッシュを使い、
+# データの変更バージョンが変わると再取得する。複数プロセスの間でも共有される）
+def get_product_categories():
+    """商材カテゴリー一覧を取得（キャッシュ）"""
+    return db.get_product_categories()
+
+def get_ng_words(category_id):
+    """NGワード一覧を取得（キャッシュ）"""
+    return db.get_ng_words(category_id)
+
+def get_all_platforms():
+    """全プラットフォーム一覧を取得（キャッシュ）"""
+    return db.get_all_platforms()
+
 # プラットフォーム選択肢を取得する関数（新規追加）
-@st.cache_data
 def get_platform_options():
     """プラットフォーム選択肢を取得"""
     platforms = db.get_active_platforms()
@@ -48,12 +76,274 @@ def clear_form_inputs():
     for key in keys_to_clear:
         del st.session_state[key]
 
+# 台本・設定の各項目（フラグメント：ボタン操作では項目の部分だけを再実行する）
+@st.fragment
+def generated_script_item(i, script, category_id, platform):
+    """生成された台本1件の表示と保存"""
+    with st.expander(f"📝 生成台本 {i}: {script.get('title', 'タイトル未設定')}"):
+        st.markdown(f"**🎣 フック:**\n{script.get('hook', '')}")
+        st.markdown(f"**💬 メインコンテンツ:**\n{script.get('main_content', '')}")
+        st.markdown(f"**📢 CTA:**\n{script.get('call_to_action', '')}")
+        
+        # 保存状態の確認
+        if i in st.session_state.saved_scripts:
+            st.success(f"✅ 台本{i}は既に保存済みです")
+        else:
+            # まとめて保存する台本の選択
+            st.checkbox("☑️ まとめて保存する", key=f"select_script_{i}")
+            
+            # 台本保存ボタン
+            if st.button(f"💾 台本{i}を保存", key=f"save_{i}"):
+                try:
+                    db.save_generated_scripts(category_id, [script], platform, '統合AI生成')
+
+                    # 保存状態を更新
+                    st.session_state.saved_scripts.add(i)
+                    st.success(f"✅ 台本{i}を保存しました！")
+                    st.rerun(scope="fragment")
+                    
+                except Exception as e:
+                    st.error(f"❌ 保存中にエラーが発生しました: {str(e)}")
+
+@st.fragment
+def effective_script_item(script, violations):
+    """効果的台本1件の表示と編集"""
+    # この項目で更新した場合は更新後の内容を表示
+    updated = st.session_state.get(f"updated_effective_{script[0]}")
+    if updated and updated[0] == data_version('effective_scripts'):
+        script = updated[1]
+    
+    # データ構造を安全に取得
+    script_id = script[0] if len(script) > 0 else "不明"
+    script_title = script[2] if len(script) > 2 else "タイトル不明"
+    script_hook = script[3] if len(script) > 3 else ""
+    script_main = script[4] if len(script) > 4 else ""
+    script_cta = script[5] if len(script) > 5 else ""
+    script_platform = script[7] if len(script) > 7 else "プラットフォーム不明"
+    script_reason = script[8] if len(script) > 8 else ""
+    script_created = script[9] if len(script) > 9 else "作成日不明"
+    script_category = script[11] if len(script) > 11 else "カテゴリー不明"
+    
+    violation_mark = " 🚫" if violations else ""
+    with st.expander(f"📝 {script_title} ({script_platform} - {script_category}){violation_mark}"):
+        if violations:
+            st.warning(f"🚫 NGワード違反: {', '.join(violations)}")
+        if script_hook:
+            st.markdown(f"**🎣 フック:**\n{script_hook}")
+        if script_main:
+            st.markdown(f"**💬 メインコンテンツ:**\n{script_main}")
+        if script_cta:
+            st.markdown(f"**📢 CTA:**\n{script_cta}")
+        if script_reason:
+            st.markdown(f"**✨ 効果的な理由:**\n{script_reason}")
+        st.caption(f"作成日: {script_created}")
+        
+        # 新規追加：編集ボタン
+        if st.button(f"✏️ 編集", key=f"edit_effective_{script_id}"):
+            st.session_state[f"edit_effective_{script_id}"] = True
+            st.rerun(scope="fragment")
+        
+        # 新規追加：編集フォーム
+        if st.session_state.get(f"edit_effective_{script_id}", False):
+            with st.form(f"edit_effective_form_{script_id}"):
+                st.subheader(f"✏️ 台本編集: {script_title}")
+                
+                edit_title = st.text_input("📋 台本タイトル", value=script_title, key=f"edit_title_{script_id}")
+                platform_options = get_platform_options()
+                platform_index = 0
+                if script_platform in platform_options:
+                    platform_index = platform_options.index(script_platform)
+                edit_platform = st.selectbox("📱 プラットフォーム", platform_options, index=platform_index, key=f"edit_platform_{script_id}")
+                edit_hook = st.text_area("🎣 フック", value=script_hook, key=f"edit_hook_{script_id}")
+                edit_main = st.text_area("💬 メインコンテンツ", value=script_main, key=f"edit_main_{script_id}")
+                edit_cta = st.text_area("📢 CTA", value=script_cta, key=f"edit_cta_{script_id}")
+                edit_reason = st.text_area("✨ 効果的な理由", value=script_reason, key=f"edit_reason_{script_id}")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.form_submit_button("💾 更新"):
+                        try:
+                            db.update_effective_script(script_id, edit_title, edit_hook, edit_main, edit_cta, edit_platform, edit_reason)
+                            st.session_state[f"updated_effective_{script_id}"] = (data_version('effective_scripts'), db.get_effective_script_by_id(script_id))
+                            st.success("✅ 効果的台本を更新しました！")
+                            st.session_state[f"edit_effective_{script_id}"] = False
+                            st.rerun(scope="fragment")
+                        except Exception as e:
+                            st.error(f"❌ 更新中にエラーが発生しました: {str(e)}")
+                
+                with col2:
+                    if st.form_submit_button("❌ キャンセル"):
+                        st.session_state[f"edit_effective_{script_id}"] = False
+                        st.rerun(scope="fragment")
+
+@st.fragment
+def library_generated_script_item(script, violations):
+    """生成済み台本1件の表示と配信結果の入力"""
+    # データ構造を安全に取得
+    script_id = script[0] if len(script) > 0 else "不明"
+    script_title = script[2] if len(script) > 2 else "タイトル不明"
+    script_hook = script[3] if len(script) > 3 else ""
+    script_main = script[4] if len(script) > 4 else ""
+    script_cta = script[5] if len(script) > 5 else ""
+    script_platform = script[7] if len(script) > 7 else "プラットフォーム不明"
+    script_created = script[9] if len(script) > 9 else "作成日不明"
+    script_category = script[10] if len(script) > 10 else "カテゴリー不明"
+    
+    violation_mark = " 🚫" if violations else ""
+    with st.expander(f"🤖 {script_title} ({script_platform} - {script_category}){violation_mark}"):
+        if violations:
+            st.warning(f"🚫 NGワード違反: {', '.join(violations)}")
+        if script_hook:
+            st.markdown(f"**🎣 フック:**\n{script_hook}")
+        if script_main:
+            st.markdown(f"**💬 メインコンテンツ:**\n{script_main}")
+        if script_cta:
+            st.markdown(f"**📢 CTA:**\n{script_cta}")
+        st.caption(f"作成日: {script_created}")
+        
+        if st.session_state.pop(f"result_saved_{script_id}", False):
+            st.success("✅ 配信結果を保存しました！学習データが更新されました。")
+        
+        # 配信結果入力ボタン
+        if st.button(f"📊 配信結果を入力", key=f"result_{script_id}"):
+            st.session_state[f"show_result_form_{script_id}"] = True
+        
+        # 配信結果入力フォーム
+        if st.session_state.get(f"show_result_form_{script_id}", False):
+            with st.form(f"result_form_{script_id}"):
+                st.write("📊 配信結果を入力してください")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    ctr = st.number_input("CTR (%)", min_value=0.0, step=0.01, key=f"ctr_{script_id}")
+                    cpc = st.number_input("CPC (円)", min_value=0.0, step=1.0, key=f"cpc_{script_id}")
+                    mcvr = st.number_input("mCVR (%)", min_value=0.0, step=0.01, key=f"mcvr_{script_id}")
+                
+                with col2:
+                    mcpa = st.number_input("mCPA (円)", min_value=0.0, step=1.0, key=f"mcpa_{script_id}")
+                    cvr = st.number_input("CVR (%)", min_value=0.0, step=0.01, key=f"cvr_{script_id}")
+                    cpa = st.number_input("CPA (円)", min_value=0.0, step=1.0, key=f"cpa_{script_id}")
+                
+                spend_amount = st.number_input("消化金額 (円)", min_value=0.0, step=1000.0, key=f"spend_{script_id}")
+                impressions = st.number_input("インプレッション数", min_value=0, step=1000, key=f"imp_{script_id}")
+                clicks = st.number_input("クリック数", min_value=0, step=100, key=f"click_{script_id}")
+                conversions = st.number_input("コンバージョン数", min_value=0, step=10, key=f"conv_{script_id}")
+                
+                col3, col4 = st.columns(2)
+                with col3:
+                    start_date = st.date_input("配信開始日", key=f"start_{script_id}")
+                with col4:
+                    end_date = st.date_input("配信終了日", key=f"end_{script_id}")
+                
+                if st.form_submit_button("📊 配信結果を保存"):
+                    try:
+                        results = {
+                            'ctr': ctr,
+                            'cpc': cpc,
+                            'mcvr': mcvr,
+                            'mcpa': mcpa,
+                            'cvr': cvr,
+                            'cpa': cpa,
+                            'spend_amount': spend_amount,
+                            'impressions': impressions,
+                            'clicks': clicks,
+                            'conversions': conversions,
+                            'start_date': start_date,
+                            'end_date': end_date
+                        }
+                        
+                        db.add_campaign_result(script_id, 'generated', script[1], script_platform, results)
+                        
+                        # 新規追加：入力フォームをクリア
+                        st.session_state[f"show_result_form_{script_id}"] = False
+                        st.session_state[f"result_saved_{script_id}"] = True
+                        clear_form_inputs()
+                        st.rerun(scope="fragment")
+                    except Exception as e:
+                        st.error(f"❌ 配信結果の保存中にエラーが発生しました: {str(e)}")
+
+@st.fragment
+def ng_word_item(ng_word):
+    """NGワード1件の表示と削除"""
+    word_id = ng_word[0]
+    word = ng_word[2]
+    word_type = ng_word[3]
+    reason = ng_word[4] if ng_word[4] else "理由なし"
+    created_at = ng_word[5]
+    regex_status = ng_word[7]
+    regex_note = ng_word[8]
+    
+    if st.session_state.get(f"deleted_ng_{word_id}"):
+        st.success(f"✅ NGワード「{word}」を削除しました！")
+        return
+    
+    status_mark = " ⚠️ 無効" if regex_status == 'rejected' else ""
+    with st.expander(f"🚫 {word} ({word_type}){status_mark}"):
+        st.write(f"**理由:** {reason}")
+        if regex_status == 'rejected':
+            st.error(f"⚠️ この正規表現は照合に使用されません: {regex_note}")
+        elif regex_status == 'ok':
+            st.caption("✅ 正規表現の検証済み")
+        st.caption(f"作成日: {created_at}")
+        
+        if st.button(f"🗑️ 削除", key=f"delete_ng_{word_id}"):
+            try:
+                db.delete_ng_word(word_id)
+                st.session_state[f"deleted_ng_{word_id}"] = True
+                st.rerun(scope="fragment")
+            except Exception as e:
+                st.error(f"❌ 削除中にエラーが発生しました: {str(e)}")
+
+@st.fragment
+def platform_item(platform_id):
+    """プラットフォーム1件の表示と編集・削除"""
+    platform = next((row for row in get_all_platforms() if row[0] == platform_id), None)
+    if platform is None:
+        st.success("✅ プラットフォームを削除しました！")
+        return
+    
+    platform_name = platform[1]
+    platform_code = platform[2]
+    description = platform[3]
+    is_active = platform[4]
+    
+    status = "✅ アクティブ" if is_active else "❌ 非アクティブ"
+    
+    with st.expander(f"📱 {platform_name} ({status})"):
+        st.write(f"**コード:** {platform_code}")
+        if description:
+            st.write(f"**説明:** {description}")
+        
+        # 編集フォーム
+        with st.form(f"edit_platform_{platform_id}"):
+            edit_name = st.text_input("プラットフォーム名", value=platform_name, key=f"edit_name_{platform_id}")
+            edit_code = st.text_input("プラットフォームコード", value=platform_code, key=f"edit_code_{platform_id}")
+            edit_description = st.text_area("説明", value=description or "", key=f"edit_description_{platform_id}")
+            edit_active = st.checkbox("アクティブ", value=is_active, key=f"edit_active_{platform_id}")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.form_submit_button("💾 更新"):
+                    try:
+                        db.update_platform(platform_id, edit_name, edit_code, edit_description, edit_active)
+                        st.rerun(scope="fragment")
+                    except Exception as e:
+                        st.error(f"❌ 更新中にエラーが発生しました: {str(e)}")
+            
+            with col2:
+                if st.form_submit_button("🗑️ 削除"):
+                    try:
+                        db.delete_platform(platform_id)
+                        st.rerun(scope="fragment")
+                    except Exception as e:
+                        st.error(f"❌ 削除中にエラーが発生しました: {str(e)}")
+
 # サイドバーナビゲーション
 st.sidebar.title("🎬 ショート動画台本ツール")
 st.sidebar.markdown("---")
 
 # 商材カテゴリー選択（全ページ共通）
-categories = db.get_product_categories()
+categories = get_product_categories()
 category_options = [""] + [f"{cat[0]}: {cat[1]}" for cat in categories]
 selected_category = st.sidebar.selectbox("📂 商材カテゴリー", category_options)
 
@@ -110,31 +400,22 @@ if page == "🏠 ホーム":
     # 統計情報
     col1, col2, col3, col4 = st.columns(4)
     
+    # 件数はトリガーで更新している table_counters から1回で読み込む
+    home_counts = db.get_dashboard_stats()['counts']
+    
     with col1:
-        effective_count = len(db.get_effective_scripts())
-        st.metric("効果的台本数", f"{effective_count}件")
+        st.metric("効果的台本数", f"{home_counts['effective']}件")
     
     with col2:
-        category_count = len(db.get_product_categories())
-        st.metric("商材カテゴリー", f"{category_count}件")
+        st.metric("商材カテゴリー", f"{home_counts['categories']}件")
     
     with col3:
         # 生成された台本数
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM generated_scripts")
-        generated_count = cursor.fetchone()[0]
-        conn.close()
-        st.metric("生成済み台本", f"{generated_count}件")
+        st.metric("生成済み台本", f"{home_counts['generated']}件")
     
     with col4:
         # 配信結果数
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM campaign_results")
-        result_count = cursor.fetchone()[0]
-        conn.close()
-        st.metric("配信結果", f"{result_count}件")
+        st.metric("配信結果", f"{home_counts['results']}件")
     
     # 学習統計情報
     st.markdown("---")
@@ -175,15 +456,23 @@ elif page == "✨ 台本生成":
         st.stop()
     
     # NGワード警告表示
-    ng_words = db.get_ng_words(category_id)
+    ng_words = get_ng_words(category_id)
     if ng_words:
         st.info(f"🚫 このカテゴリーには {len(ng_words)} 個のNGワードが設定されています。台本生成時に自動的に除外されます。")
-    
+
+    # レスポンス解析の状況（直近7日）
+    parse_stats = openai_service.get_parse_failure_stats(days=7)
+    if parse_stats['total']:
+        st.caption(f"🧩 直近7日のJSON解析: {parse_stats['total']}件 / 修復 {parse_stats['repair_rate']:.0%} / 続き生成 {parse_stats['continuation_rate']:.0%} / 失敗 {parse_stats['failure_rate']:.0%}")
+
     # セッションステートの初期化
     if 'generated_scripts' not in st.session_state:
         st.session_state.generated_scripts = []
     if 'saved_scripts' not in st.session_state:
         st.session_state.saved_scripts = set()
+    if 'rate_limit_user' not in st.session_state:
+        # APIのレート制御で、セッションごとに順番を公平に回すためのID
+        st.session_state.rate_limit_user = uuid.uuid4().hex
     
     # 台本生成フォーム（プラットフォーム選択を動的に変更）
     with st.form("script_generation_form"):
@@ -200,7 +489,8 @@ elif page == "✨ 台本生成":
         with col2:
             generation_count = st.slider("🔢 生成数", 1, 5, 3)
             use_effective_scripts = st.checkbox("📚 効果的台本を参考にする", value=True)
-            
+            use_streaming = st.checkbox("⚡ 生成中の台本を逐次表示する", value=True)
+
             # 学習データの活用状況を表示
             patterns = db.get_learning_patterns(category_id, platform)
             if patterns:
@@ -221,16 +511,47 @@ elif page == "✨ 台本生成":
             try:
                 scripts = []
                 for i in range(generation_count):
-                    script_data = openai_service.generate_script(
-                        category=category_name,
-                        target_audience=target_audience,
-                        platform=platform,
-                        script_length=script_length,
-                        reference_scripts=effective_scripts,
-                        category_id=category_id
-                    )
+                    if use_streaming:
+                        # フィールドが完成するたびにNGワード除去済みのテキストを表示
+                        field_labels = {
+                            'title': '📋 タイトル',
+                            'hook': '🎣 フック',
+                            'main_content': '💬 メインコンテンツ',
+                            'call_to_action': '📢 CTA'
+                        }
+                        stream_area = st.empty()
+                        with stream_area.container():
+                            st.markdown(f"**⚡ 生成中の台本 {i + 1}**")
+                            placeholders = {field: st.empty() for field in field_labels}
+
+                        for event in openai_service.generate_script_stream(
+                            category=category_name,
+                            target_audience=target_audience,
+                            platform=platform,
+                            script_length=script_length,
+                            reference_scripts=effective_scripts,
+                            category_id=category_id,
+                            user_id=st.session_state.rate_limit_user
+                        ):
+                            if event['type'] == 'field':
+                                placeholders[event['field']].markdown(f"**{field_labels[event['field']]}:**\n{event['value']}")
+                            elif event['type'] == 'complete':
+                                script_data = event['script']
+
+                        # 生成完了後は下の一覧で表示する
+                        stream_area.empty()
+                    else:
+                        script_data = openai_service.generate_script(
+                            category=category_name,
+                            target_audience=target_audience,
+                            platform=platform,
+                            script_length=script_length,
+                            reference_scripts=effective_scripts,
+                            category_id=category_id,
+                            user_id=st.session_state.rate_limit_user
+                        )
                     scripts.append(script_data)
-                
+
                 # 生成された台本をセッションステートに保存
                 st.session_state.generated_scripts = scripts
                 st.session_state.saved_scripts = set()  # 保存状態をリセット
@@ -249,38 +570,36 @@ elif page == "✨ 台本生成":
         st.markdown("---")
         st.subheader("📝 生成された台本")
         
+        # まとめて保存（1トランザクションで保存し、再実行も1回だけ）
+        unsaved = [i for i in range(1, len(st.session_state.generated_scripts) + 1)
+                   if i not in st.session_state.saved_scripts]
+        if unsaved:
+            col1, col2 = st.columns(2)
+            with col1:
+                save_all = st.button(f"💾 すべて保存（{len(unsaved)}件）", key="save_all_scripts", use_container_width=True)
+            with col2:
+                # 選択はフラグメント内で変わるため、件数はボタンを押した時点で数える
+                save_selected = st.button("💾 選択した台本を保存", key="save_selected_scripts", use_container_width=True)
+            
+            targets = []
+            if save_all:
+                targets = unsaved
+            elif save_selected:
+                targets = [i for i in unsaved if st.session_state.get(f"select_script_{i}")]
+                if not targets:
+                    st.warning("⚠️ 保存する台本を選択してください")
+            if targets:
+                try:
+                    db.save_generated_scripts(
+                        category_id, [st.session_state.generated_scripts[i - 1] for i in targets], platform, '統合AI生成'
+                    )
+                    st.session_state.saved_scripts.update(targets)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ 保存中にエラーが発生しました: {str(e)}")
+        
         for i, script in enumerate(st.session_state.generated_scripts, 1):
-            with st.expander(f"📝 生成台本 {i}: {script.get('title', 'タイトル未設定')}"):
-                st.markdown(f"**🎣 フック:**\n{script.get('hook', '')}")
-                st.markdown(f"**💬 メインコンテンツ:**\n{script.get('main_content', '')}")
-                st.markdown(f"**📢 CTA:**\n{script.get('call_to_action', '')}")
-                
-                # 保存状態の確認
-                if i in st.session_state.saved_scripts:
-                    st.success(f"✅ 台本{i}は既に保存済みです")
-                else:
-                    # 台本保存ボタン
-                    if st.button(f"💾 台本{i}を保存", key=f"save_{i}"):
-                        try:
-                            conn = db.get_connection()
-                            cursor = conn.cursor()
-                            cursor.execute('''
-                                INSERT INTO generated_scripts 
-                                (category_id, title, hook, main_content, call_to_action, script_content, platform, generation_source)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                            ''', (category_id, script.get('title', ''), script.get('hook', ''), 
-                                  script.get('main_content', ''), script.get('call_to_action', ''),
-                                  script.get('script_content', ''), platform, '統合AI生成'))
-                            conn.commit()
-                            conn.close()
-                            
-                            # 保存状態を更新
-                            st.session_state.saved_scripts.add(i)
-                            st.success(f"✅ 台本{i}を保存しました！")
-                            st.rerun()
-                            
-                        except Exception as e:
-                            st.error(f"❌ 保存中にエラーが発生しました: {str(e)}")
+            generated_script_item(i, script, category_id, platform)
 
 elif page == "📚 台本ライブラリ":
     st.title("📚 台本ライブラリ")
@@ -321,66 +640,20 @@ elif page == "📚 台本ライブラリ":
         
         try:
             effective_scripts = db.get_effective_scripts(category_id)
+            
+            # NGワード違反での絞り込み
+            effective_violations = {}
+            for _, violation_script_id, word, field, _ in db.get_compliance_violations(category_id, 'effective'):
+                effective_violations.setdefault(violation_script_id, []).append(f"{word}（{field}）")
+            effective_filter = st.selectbox("🛡️ NGワードチェック", ["すべて", "違反あり", "違反なし"], key="effective_compliance_filter")
+            if effective_filter == "違反あり":
+                effective_scripts = [script for script in effective_scripts if script[0] in effective_violations]
+            elif effective_filter == "違反なし":
+                effective_scripts = [script for script in effective_scripts if script[0] not in effective_violations]
+            
             if effective_scripts:
                 for script in effective_scripts:
-                    # データ構造を安全に取得
-                    script_id = script[0] if len(script) > 0 else "不明"
-                    script_title = script[2] if len(script) > 2 else "タイトル不明"
-                    script_hook = script[3] if len(script) > 3 else ""
-                    script_main = script[4] if len(script) > 4 else ""
-                    script_cta = script[5] if len(script) > 5 else ""
-                    script_platform = script[7] if len(script) > 7 else "プラットフォーム不明"
-                    script_reason = script[8] if len(script) > 8 else ""
-                    script_created = script[9] if len(script) > 9 else "作成日不明"
-                    script_category = script[11] if len(script) > 11 else "カテゴリー不明"
-                    
-                    with st.expander(f"📝 {script_title} ({script_platform} - {script_category})"):
-                        if script_hook:
-                            st.markdown(f"**🎣 フック:**\n{script_hook}")
-                        if script_main:
-                            st.markdown(f"**💬 メインコンテンツ:**\n{script_main}")
-                        if script_cta:
-                            st.markdown(f"**📢 CTA:**\n{script_cta}")
-                        if script_reason:
-                            st.markdown(f"**✨ 効果的な理由:**\n{script_reason}")
-                        st.caption(f"作成日: {script_created}")
-                        
-                        # 新規追加：編集ボタン
-                        if st.button(f"✏️ 編集", key=f"edit_effective_{script_id}"):
-                            st.session_state[f"edit_effective_{script_id}"] = True
-                            st.rerun()
-                        
-                        # 新規追加：編集フォーム
-                        if st.session_state.get(f"edit_effective_{script_id}", False):
-                            with st.form(f"edit_effective_form_{script_id}"):
-                                st.subheader(f"✏️ 台本編集: {script_title}")
-                                
-                                edit_title = st.text_input("📋 台本タイトル", value=script_title, key=f"edit_title_{script_id}")
-                                platform_options = get_platform_options()
-                                platform_index = 0
-                                if script_platform in platform_options:
-                                    platform_index = platform_options.index(script_platform)
-                                edit_platform = st.selectbox("📱 プラットフォーム", platform_options, index=platform_index, key=f"edit_platform_{script_id}")
-                                edit_hook = st.text_area("🎣 フック", value=script_hook, key=f"edit_hook_{script_id}")
-                                edit_main = st.text_area("💬 メインコンテンツ", value=script_main, key=f"edit_main_{script_id}")
-                                edit_cta = st.text_area("📢 CTA", value=script_cta, key=f"edit_cta_{script_id}")
-                                edit_reason = st.text_area("✨ 効果的な理由", value=script_reason, key=f"edit_reason_{script_id}")
-                                
-                                col1, col2 = st.columns(2)
-                                with col1:
-                                    if st.form_submit_button("💾 更新"):
-                                        try:
-                                            db.update_effective_script(script_id, edit_title, edit_hook, edit_main, edit_cta, edit_platform, edit_reason)
-                                            st.success("✅ 効果的台本を更新しました！")
-                                            st.session_state[f"edit_effective_{script_id}"] = False
-                                            st.rerun()
-                                        except Exception as e:
-                                            st.error(f"❌ 更新中にエラーが発生しました: {str(e)}")
-                                
-                                with col2:
-                                    if st.form_submit_button("❌ キャンセル"):
-                                        st.session_state[f"edit_effective_{script_id}"] = False
-                                        st.rerun()
+                    effective_script_item(script, effective_violations.get(script[0], []))
             else:
                 st.info("📝 効果的台本がまだ登録されていません")
         except Exception as e:
@@ -391,105 +664,21 @@ elif page == "📚 台本ライブラリ":
         
         try:
             # 生成済み台本の表示
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            if category_id:
-                cursor.execute('''
-                    SELECT gs.*, pc.category_name 
-                    FROM generated_scripts gs
-                    JOIN product_categories pc ON gs.category_id = pc.id
-                    WHERE gs.category_id = ?
-                    ORDER BY gs.created_at DESC
-                ''', (category_id,))
-            else:
-                cursor.execute('''
-                    SELECT gs.*, pc.category_name 
-                    FROM generated_scripts gs
-                    JOIN product_categories pc ON gs.category_id = pc.id
-                    ORDER BY gs.created_at DESC
-                ''')
+            generated_scripts = db.get_generated_scripts(category_id)
             
-            generated_scripts = cursor.fetchall()
-            conn.close()
+            # NGワード違反での絞り込み
+            generated_violations = {}
+            for _, violation_script_id, word, field, _ in db.get_compliance_violations(category_id, 'generated'):
+                generated_violations.setdefault(violation_script_id, []).append(f"{word}（{field}）")
+            generated_filter = st.selectbox("🛡️ NGワードチェック", ["すべて", "違反あり", "違反なし"], key="generated_compliance_filter")
+            if generated_filter == "違反あり":
+                generated_scripts = [script for script in generated_scripts if script[0] in generated_violations]
+            elif generated_filter == "違反なし":
+                generated_scripts = [script for script in generated_scripts if script[0] not in generated_violations]
             
             if generated_scripts:
                 for script in generated_scripts:
-                    # データ構造を安全に取得
-                    script_id = script[0] if len(script) > 0 else "不明"
-                    script_title = script[2] if len(script) > 2 else "タイトル不明"
-                    script_hook = script[3] if len(script) > 3 else ""
-                    script_main = script[4] if len(script) > 4 else ""
-                    script_cta = script[5] if len(script) > 5 else ""
-                    script_platform = script[7] if len(script) > 7 else "プラットフォーム不明"
-                    script_created = script[9] if len(script) > 9 else "作成日不明"
-                    script_category = script[10] if len(script) > 10 else "カテゴリー不明"
-                    
-                    with st.expander(f"🤖 {script_title} ({script_platform} - {script_category})"):
-                        if script_hook:
-                            st.markdown(f"**🎣 フック:**\n{script_hook}")
-                        if script_main:
-                            st.markdown(f"**💬 メインコンテンツ:**\n{script_main}")
-                        if script_cta:
-                            st.markdown(f"**📢 CTA:**\n{script_cta}")
-                        st.caption(f"作成日: {script_created}")
-                        
-                        # 配信結果入力ボタン
-                        if st.button(f"📊 配信結果を入力", key=f"result_{script_id}"):
-                            st.session_state[f"show_result_form_{script_id}"] = True
-                        
-                        # 配信結果入力フォーム
-                        if st.session_state.get(f"show_result_form_{script_id}", False):
-                            with st.form(f"result_form_{script_id}"):
-                                st.write("📊 配信結果を入力してください")
-                                
-                                col1, col2 = st.columns(2)
-                                with col1:
-                                    ctr = st.number_input("CTR (%)", min_value=0.0, step=0.01, key=f"ctr_{script_id}")
-                                    cpc = st.number_input("CPC (円)", min_value=0.0, step=1.0, key=f"cpc_{script_id}")
-                                    mcvr = st.number_input("mCVR (%)", min_value=0.0, step=0.01, key=f"mcvr_{script_id}")
-                                
-                                with col2:
-                                    mcpa = st.number_input("mCPA (円)", min_value=0.0, step=1.0, key=f"mcpa_{script_id}")
-                                    cvr = st.number_input("CVR (%)", min_value=0.0, step=0.01, key=f"cvr_{script_id}")
-                                    cpa = st.number_input("CPA (円)", min_value=0.0, step=1.0, key=f"cpa_{script_id}")
-                                
-                                spend_amount = st.number_input("消化金額 (円)", min_value=0.0, step=1000.0, key=f"spend_{script_id}")
-                                impressions = st.number_input("インプレッション数", min_value=0, step=1000, key=f"imp_{script_id}")
-                                clicks = st.number_input("クリック数", min_value=0, step=100, key=f"click_{script_id}")
-                                conversions = st.number_input("コンバージョン数", min_value=0, step=10, key=f"conv_{script_id}")
-                                
-                                col3, col4 = st.columns(2)
-                                with col3:
-                                    start_date = st.date_input("配信開始日", key=f"start_{script_id}")
-                                with col4:
-                                    end_date = st.date_input("配信終了日", key=f"end_{script_id}")
-                                
-                                if st.form_submit_button("📊 配信結果を保存"):
-                                    try:
-                                        results = {
-                                            'ctr': ctr,
-                                            'cpc': cpc,
-                                            'mcvr': mcvr,
-                                            'mcpa': mcpa,
-                                            'cvr': cvr,
-                                            'cpa': cpa,
-                                            'spend_amount': spend_amount,
-                                            'impressions': impressions,
-                                            'clicks': clicks,
-                                            'conversions': conversions,
-                                            'start_date': start_date,
-                                            'end_date': end_date
-                                        }
-                                        
-                                        db.add_campaign_result(script_id, 'generated', script[1], script_platform, results)
-                                        st.success("✅ 配信結果を保存しました！学習データが更新されました。")
-                                        
-                                        # 新規追加：入力フォームをクリア
-                                        st.session_state[f"show_result_form_{script_id}"] = False
-                                        clear_form_inputs()
-                                        st.rerun()
-                                    except Exception as e:
-                                        st.error(f"❌ 配信結果の保存中にエラーが発生しました: {str(e)}")
+                    library_generated_script_item(script, generated_violations.get(script[0], []))
             else:
                 st.info("🤖 生成済み台本がまだありません")
         except Exception as e:
@@ -506,7 +695,7 @@ elif page == "📊 成果管理":
     
     with col1:
         # カテゴリーフィルター
-        categories = db.get_product_categories()
+        categories = get_product_categories()
         category_filter_options = ["全て"] + [f"{cat[0]}: {cat[1]}" for cat in categories]
         selected_category_filter = st.selectbox("📂 カテゴリーフィルター", category_filter_options)
         
@@ -529,92 +718,58 @@ elif page == "📊 成果管理":
     # 配信結果一覧（フィルタリング機能付き）
     st.subheader("📈 配信結果一覧")
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    # SQLクエリを動的に構築
-    query = '''
-        SELECT cr.*, pc.category_name,
-               CASE 
-                   WHEN cr.script_type = 'effective' THEN es.title
-                   WHEN cr.script_type = 'generated' THEN gs.title
-                   ELSE 'タイトル不明'
-               END as script_title
-        FROM campaign_results cr
-        JOIN product_categories pc ON cr.category_id = pc.id
-        LEFT JOIN effective_scripts es ON cr.script_id = es.id AND cr.script_type = 'effective'
-        LEFT JOIN generated_scripts gs ON cr.script_id = gs.id AND cr.script_type = 'generated'
-        WHERE 1=1
-    '''
-    
-    params = []
-    
-    # フィルター条件を追加
-    if filter_category_id:
-        query += ' AND cr.category_id = ?'
-        params.append(filter_category_id)
-    
-    if platform_filter:
-        query += ' AND cr.platform = ?'
-        params.append(platform_filter)
-    
-    if performance_filter == "良好のみ":
-        query += ' AND cr.is_good_performance = 1'
-    elif performance_filter == "要改善のみ":
-        query += ' AND cr.is_good_performance = 0'
+    # 絞り込みは列指向キャッシュ上で行う（登録済みカテゴリーの結果のみ）
+    category_names = {cat[0]: cat[1] for cat in categories}
+    performance = {"良好のみ": 'good', "要改善のみ": 'poor'}.get(performance_filter)
+    results = get_analytics_cache().query(
+        db, 'filter_results', filter_results,
+        filter_category_id, platform_filter, performance, tuple(category_names)
+    )
     
-    query += ' ORDER BY cr.created_at DESC'
-    
-    cursor.execute(query, params)
-    results = cursor.fetchall()
-    conn.close()
-    
-    if results:
+    if len(results):
         # 結果の統計情報を表示
-        total_results = len(results)
-        good_results = sum(1 for r in results if r[17])  # is_good_performance
-        good_rate = (good_results / total_results * 100) if total_results > 0 else 0
+        summary = result_summary(results)
         
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("総結果数", f"{total_results}件")
+            st.metric("総結果数", f"{summary['total']}件")
         with col2:
-            st.metric("良好な結果", f"{good_results}件")
+            st.metric("良好な結果", f"{summary['good']}件")
         with col3:
-            st.metric("良好率", f"{good_rate:.1f}%")
+            st.metric("良好率", f"{summary['good_rate']:.1f}%")
         
         st.markdown("---")
         
         # 結果詳細を表示
-        for result in results:
-            is_good = "✅ 良好" if result[17] else "❌ 要改善"
-            performance_score = f"{result[18]:.2f}"
+        for result in results.itertuples(index=False):
+            is_good = "✅ 良好" if pd.notna(result.is_good_performance) and result.is_good_performance else "❌ 要改善"
+            performance_score = f"{result.performance_score:.2f}"
             
-            with st.expander(f"{is_good} {result[20]} ({result[4]} - {result[19]}) - スコア: {performance_score}"):
+            with st.expander(f"{is_good} {result.script_title} ({result.platform} - {category_names.get(result.category_id)}) - スコア: {performance_score}"):
                 col1, col2, col3 = st.columns(3)
                 
                 with col1:
-                    st.metric("CTR", f"{result[5]:.2f}%")
-                    st.metric("CPC", f"¥{result[6]:.0f}")
+                    st.metric("CTR", f"{result.ctr:.2f}%")
+                    st.metric("CPC", f"¥{result.cpc:.0f}")
                 
                 with col2:
-                    st.metric("mCVR", f"{result[7]:.2f}%")
-                    st.metric("mCPA", f"¥{result[8]:.0f}")
+                    st.metric("mCVR", f"{result.mcvr:.2f}%")
+                    st.metric("mCPA", f"¥{result.mcpa:.0f}")
                 
                 with col3:
-                    st.metric("CVR", f"{result[9]:.2f}%")
-                    st.metric("CPA", f"¥{result[10]:.0f}")
+                    st.metric("CVR", f"{result.cvr:.2f}%")
+                    st.metric("CPA", f"¥{result.cpa:.0f}")
                 
                 col4, col5 = st.columns(2)
                 with col4:
-                    st.metric("消化金額", f"¥{result[11]:,.0f}")
-                    st.metric("インプレッション", f"{result[12]:,}")
+                    st.metric("消化金額", f"¥{result.spend_amount:,.0f}")
+                    st.metric("インプレッション", f"{result.impressions:,}")
                 
                 with col5:
-                    st.metric("クリック数", f"{result[13]:,}")
-                    st.metric("コンバージョン数", f"{result[14]:,}")
+                    st.metric("クリック数", f"{result.clicks:,}")
+                    st.metric("コンバージョン数", f"{result.conversions:,}")
                 
-                st.caption(f"配信期間: {result[15]} - {result[16]}")
+                st.caption(f"配信期間: {result.campaign_period_start} - {result.campaign_period_end}")
     else:
         st.info("📊 フィルター条件に合致する配信結果がありません")
         
@@ -632,31 +787,16 @@ elif page == "📈 レポート":
     # 基本統計
     st.subheader("📊 基本統計")
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    # 効果的台本数
-    cursor.execute('SELECT COUNT(*) FROM effective_scripts WHERE category_id = ?', (category_id,))
-    effective_count = cursor.fetchone()[0]
-
-    # 生成済み台本数
-    cursor.execute('SELECT COUNT(*) FROM generated_scripts WHERE category_id = ?', (category_id,))
-    generated_count = cursor.fetchone()[0]
-    
-    # 配信結果数
-    cursor.execute('SELECT COUNT(*) FROM campaign_results WHERE category_id = ?', (category_id,))
-    result_count = cursor.fetchone()[0]
+    # 効果的台本数・生成済み台本数（カテゴリー別の件数）
+    category_counts = db.get_dashboard_stats()['by_category']
+    effective_count = category_counts['effective_scripts'].get(category_id, 0)
+    generated_count = category_counts['generated_scripts'].get(category_id, 0)
     
-    # 良好な結果の割合
-    cursor.execute('''
-        SELECT COUNT(*) as good_count,
-               (SELECT COUNT(*) FROM campaign_results WHERE category_id = ?) as total_count
-        FROM campaign_results 
-        WHERE category_id = ? AND is_good_performance = 1
-    ''', (category_id, category_id))
-    
-    good_result = cursor.fetchone()
-    good_rate = (good_result[0] / good_result[1] * 100) if good_result[1] > 0 else 0
+    # 配信結果数・良好な結果の割合（列指向キャッシュで集計）
+    analytics = get_analytics_cache()
+    result_stats = analytics.query(db, 'result_summary', result_summary, category_id)
+    result_count = result_stats['total']
+    good_rate = result_stats['good_rate']
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -687,6 +827,22 @@ elif page == "📈 レポート":
             if patterns:
                 for pattern_type, content, score, frequency in patterns[:10]:
                     st.write(f"- {pattern_type}: {content} (スコア: {score:.2f}, 回数: {frequency})")
+                
+                # パターンを含む台本の一覧
+                drilldown_index = st.selectbox(
+                    "🔍 パターンを含む台本を表示",
+                    [None] + list(range(len(patterns[:10]))),
+                    format_func=lambda i: "選択してください" if i is None else f"{patterns[i][0]}: {patterns[i][1]}",
+                    key="pattern_drilldown"
+                )
+                if drilldown_index is not None:
+                    pattern_type, content = patterns[drilldown_index][0], patterns[drilldown_index][1]
+                    matched_scripts = db.find_scripts_by_pattern(pattern_type, content, category_id)
+                    for script_type, script_id, title, script_platform, occurrence in matched_scripts:
+                        label = "📝 効果的" if script_type == 'effective' else "🤖 生成"
+                        st.write(f"- {label} #{script_id} {title} ({script_platform}) ×{occurrence}")
+                    if not matched_scripts:
+                        st.info("このパターンを含む台本は見つかりませんでした")
             else:
                 st.info("効果的な学習パターンがまだありません")
     else:
@@ -695,28 +851,13 @@ elif page == "📈 レポート":
     # パフォーマンス推移
     st.subheader("📈 パフォーマンス推移")
     
-    cursor.execute('''
-        SELECT DATE(created_at) as date, 
-               AVG(performance_score) as avg_score,
-               COUNT(*) as count
-        FROM campaign_results 
-        WHERE category_id = ?
-        GROUP BY DATE(created_at)
-        ORDER BY date
-    ''', (category_id,))
-    
-    performance_data = cursor.fetchall()
+    df = analytics.query(db, 'daily_performance', daily_performance, category_id)
     
-    if performance_data:
-        df = pd.DataFrame(performance_data, columns=['日付', '平均スコア', '件数'])
-        df['日付'] = pd.to_datetime(df['日付'])
-        
+    if len(df):
         st.line_chart(df.set_index('日付')['平均スコア'])
         st.dataframe(df)
     else:
         st.info("📈 パフォーマンスデータがまだありません")
-    
-    conn.close()
 
 elif page == "⚙️ 設定":
     st.title("⚙️ 設定")
@@ -771,7 +912,7 @@ elif page == "⚙️ 設定":
         # 既存カテゴリー一覧（既存コードをそのまま移動）
         st.subheader("📋 既存カテゴリー一覧")
         
-        categories = db.get_product_categories()
+        categories = get_product_categories()
         if categories:
             for category in categories:
                 with st.expander(f"📂 {category[1]} (ID: {category[0]})"):
@@ -796,7 +937,7 @@ elif page == "⚙️ 設定":
         st.subheader("🎯 目標値設定・編集")
         
         # カテゴリー選択（サイドバー以外でも選択可能）
-        categories = db.get_product_categories()
+        categories = get_product_categories()
         if categories:
             # カテゴリー選択ボックス
             category_options_local = [f"{cat[0]}: {cat[1]}" for cat in categories]
@@ -842,7 +983,63 @@ elif page == "⚙️ 設定":
                             st.rerun()
         else:
             st.info("📂 まずカテゴリーを作成してください")
-    
+        
+        # 学習パターンの再構築
+        st.markdown("---")
+        st.subheader("🔄 学習パターンの再構築")
+        st.caption("目標値やパターン抽出ルールを変更した後、配信結果の全履歴から学習パターンを作り直します。")
+        if st.button("🔄 学習パターンを再構築", key="rebuild_learning_patterns"):
+            try:
+                with st.spinner("🤖 配信結果の全履歴から学習パターンを再構築中..."):
+                    summary = rebuild_learning_patterns(db, rescore=True)
+                st.success(f"✅ 配信結果 {summary['results']}件から学習パターン {summary['patterns']}件を再構築しました！")
+            except Exception as e:
+                st.error(f"❌ 再構築中にエラーが発生しました: {str(e)}")
+        
+        # 頻出フレーズの抽出
+        st.subheader("🔍 頻出フレーズの抽出")
+        st.caption("高スコアの台本に多く現れるフレーズを抽出し、学習パターン（phrase）として反映します。")
+        if st.button("🔍 頻出フレーズを抽出", key="mine_phrases"):
+            try:
+                with st.spinner("🤖 台本ライブラリから頻出フレーズを抽出中..."):
+                    summary = mine_phrases(db)
+                st.success(f"✅ 頻出フレーズ {len(summary['phrases'])}件を学習パターンに反映しました！")
+                if summary['phrases']:
+                    st.write("、".join(summary['phrases'][:20]))
+            except Exception as e:
+                st.error(f"❌ フレーズ抽出中にエラーが発生しました: {str(e)}")
+
+        # 読み込みキャッシュの状況（このプロセス）
+        st.subheader("📦 読み込みキャッシュ")
+        cache_stats = db.cache.stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("ヒット率", f"{cache_stats['hit_rate']:.1f}%")
+        with col2:
+            st.metric("共有ストアからのヒット", f"{cache_stats['shared_hits']}回")
+        with col3:
+            st.metric("共有ストア", cache_stats['shared'] or "なし（プロセス内のみ）")
+
+        # APIのレート制御の状況（全セッション・全プロセス共有）
+        st.subheader("🚦 APIのレート制御")
+        rate_stats = openai_service.rate_limiter.stats()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            requests_bucket = rate_stats['buckets']['requests']
+            st.metric("リクエスト枠", f"{requests_bucket['available']:.0f} / {requests_bucket['capacity']:.0f}",
+                      f"上限 {requests_bucket['limit_per_minute']:.0f}/分", delta_color="off")
+        with col2:
+            tokens_bucket = rate_stats['buckets']['tokens']
+            st.metric("トークン枠", f"{tokens_bucket['available']:,.0f} / {tokens_bucket['capacity']:,.0f}",
+                      f"上限 {tokens_bucket['limit_per_minute']:,.0f}/分", delta_color="off")
+        with col3:
+            st.metric("待ち", f"{rate_stats['waiting']}件（{rate_stats['waiting_users']}人）",
+                      f"平均 {rate_stats['average_wait']:.2f}秒", delta_color="off")
+        with col4:
+            st.metric("レート制限（429）", f"{rate_stats['rate_limited']}回")
+        if rate_stats['blocked_seconds']:
+            st.warning(f"⚠️ レート制限のため、あと{rate_stats['blocked_seconds']:.0f}秒は新しいリクエストを待たせています")
+
     with tab3:
         # 新規追加：NGワード管理機能
         st.subheader("🚫 NGワード管理")
@@ -877,7 +1074,8 @@ elif page == "⚙️ 設定":
                         if st.form_submit_button("🚫 NGワードを追加"):
                             if ng_word:
                                 try:
-                                    word_id = db.add_ng_word(ng_category_id, ng_word, ng_word_type, ng_reason)
+                                    with st.spinner("🛡️ 保存済み台本を新しいNGワードで再チェック中..."):
+                                        word_id = db.add_ng_word(ng_category_id, ng_word, ng_word_type, ng_reason)
                                     if word_id:
                                         st.success(f"✅ NGワード「{ng_word}」を追加しました！")
                                         
@@ -894,26 +1092,28 @@ elif page == "⚙️ 設定":
                 # 既存NGワード一覧
                 st.subheader(f"📋 {ng_category_name} の登録済みNGワード")
                 
-                ng_words = db.get_ng_words(ng_category_id)
+                # 保存済み台本のチェック状況
+                compliance_summary = db.get_compliance_summary(ng_category_id)
+                st.caption(f"🛡️ 保存済み台本 {compliance_summary['scripts']}件中、NGワード違反 {compliance_summary['violating']}件"
+                           f"（未チェック {compliance_summary['unchecked']}件）")
+                if compliance_summary['unchecked'] and st.button("🔄 未チェックの台本を再チェック", key="rescan_compliance"):
+                    with st.spinner("🛡️ 保存済み台本を再チェック中..."):
+                        db.rescan_compliance(ng_category_id)
+                    st.rerun()
+                
+                # 検証前に登録された正規表現NGワードを検証
+                if any(word[3] == 'regex' and word[7] is None for word in get_ng_words(ng_category_id)):
+                    with st.spinner("🔍 正規表現のNGワードを検証中..."):
+                        db.audit_regex_ng_words(ng_category_id)
+                
+                ng_words = get_ng_words(ng_category_id)
                 if ng_words:
+                    rejected_words = [word for word in ng_words if word[7] == 'rejected']
+                    if rejected_words:
+                        st.error(f"⚠️ 危険な正規表現のNGワードが {len(rejected_words)} 件あります。照合には使用されません。削除して登録し直してください。")
+                    
                     for ng_word in ng_words:
-                        word_id = ng_word[0]
-                        word = ng_word[2]
-                        word_type = ng_word[3]
-                        reason = ng_word[4] if ng_word[4] else "理由なし"
-                        created_at = ng_word[5]
-                        
-                        with st.expander(f"🚫 {word} ({word_type})"):
-                            st.write(f"**理由:** {reason}")
-                            st.caption(f"作成日: {created_at}")
-                            
-                            if st.button(f"🗑️ 削除", key=f"delete_ng_{word_id}"):
-                                try:
-                                    db.delete_ng_word(word_id)
-                                    st.success(f"✅ NGワード「{word}」を削除しました！")
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"❌ 削除中にエラーが発生しました: {str(e)}")
+                        ng_word_item(ng_word)
                 else:
                     st.info("🚫 NGワードがまだ登録されていません")
                 
@@ -963,85 +1163,22 @@ elif page == "⚙️ 設定":
         # 既存プラットフォーム管理
         st.subheader("📋 既存プラットフォーム管理")
 
-        all_platforms = db.get_all_platforms()
+        all_platforms = get_all_platforms()
         
         if all_platforms:
             for platform in all_platforms:
-                platform_id = platform[0]
-                platform_name = platform[1]
-                platform_code = platform[2]
-                description = platform[3]
-                is_active = platform[4]
-                
-                status = "✅ アクティブ" if is_active else "❌ 非アクティブ"
-                
-                with st.expander(f"📱 {platform_name} ({status})"):
-                    st.write(f"**コード:** {platform_code}")
-                    if description:
-                        st.write(f"**説明:** {description}")
-                    
-                    # 編集フォーム
-                    with st.form(f"edit_platform_{platform_id}"):
-                        edit_name = st.text_input("プラットフォーム名", value=platform_name, key=f"edit_name_{platform_id}")
-                        edit_code = st.text_input("プラットフォームコード", value=platform_code, key=f"edit_code_{platform_id}")
-                        edit_description = st.text_area("説明", value=description or "", key=f"edit_description_{platform_id}")
-                        edit_active = st.checkbox("アクティブ", value=is_active, key=f"edit_active_{platform_id}")
-                        
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            if st.form_submit_button("💾 更新"):
-                                try:
-                                    db.update_platform(platform_id, edit_name, edit_code, edit_description, edit_active)
-                                    st.success("✅ プラットフォームを更新しました！")
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"❌ 更新中にエラーが発生しました: {str(e)}")
-                        
-                        with col2:
-                            if st.form_submit_button("🗑️ 削除"):
-                                try:
-                                    db.delete_platform(platform_id)
-                                    st.success("✅ プラットフォームを削除しました！")
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"❌ 削除中にエラーが発生しました: {str(e)}")
+                platform_item(platform[0])
         else:
             st.info("📱 プラットフォームがまだ登録されていません")
         
         # プラットフォーム使用状況
         st.subheader("📊 プラットフォーム使用状況")
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # 効果的台本でのプラットフォーム使用状況
-        cursor.execute('''
-            SELECT platform, COUNT(*) as count 
-            FROM effective_scripts 
-            GROUP BY platform 
-            ORDER BY count DESC
-        ''')
-        effective_platform_stats = cursor.fetchall()
-        
-        # 生成済み台本でのプラットフォーム使用状況
-        cursor.execute('''
-            SELECT platform, COUNT(*) as count 
-            FROM generated_scripts 
-            GROUP BY platform 
-            ORDER BY count DESC
-        ''')
-        generated_platform_stats = cursor.fetchall()
-        
-        # 配信結果でのプラットフォーム使用状況
-        cursor.execute('''
-            SELECT platform, COUNT(*) as count 
-            FROM campaign_results 
-            GROUP BY platform 
-            ORDER BY count DESC
-        ''')
-        campaign_platform_stats = cursor.fetchall()
-        
-        conn.close()
+        # プラットフォーム使用状況（効果的台本・生成済み台本・配信結果）
+        platform_counts = db.get_dashboard_stats()['by_platform']
+        effective_platform_stats = platform_counts['effective_scripts']
+        generated_platform_stats = platform_counts['generated_scripts']
+        campaign_platform_stats = platform_counts['campaign_results']
         
         if effective_platform_stats or generated_platform_stats or campaign_platform_stats:
             col1, col2, col3 = st.columns(3)
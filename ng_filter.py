@@ -0,0 +1,243 @@
+"""
+NGワードの照合（完全一致・部分一致・正規表現）
+
+台本生成時のNGワード除去、NGワードチェック、保存済み台本の再チェックで共通して使います。
+正規表現のNGワードは登録時に検証し、破滅的なバックトラッキングを起こすパターンを拒否します。
+照合には re2（線形時間）または regex モジュール（タイムアウトつき）を優先して使い、
+どちらもない場合は検証を通過したパターンだけを標準の re で照合します。
+"""
+import functools
+import re
+import subprocess
+import sys
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python 3.10以前
+    import sre_parse
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+try:
+    import regex
+except ImportError:
+    regex = None
+
+REPLACEMENT = '[規制対象]'
+MAX_PATTERN_LENGTH = 200
+MATCH_TIMEOUT = 0.2  # regex モジュール使用時の1回の照合の上限（秒）
+BENCHMARK_LENGTH = 3000  # 攻撃的な入力の文字数
+BENCHMARK_TIMEOUT = 2.0  # 検証用プロセスの上限（秒）
+
+# 攻撃的な入力でパターンを実行する検証用スクリプト（別プロセスで実行し、時間切れなら強制終了）
+_BENCHMARK_SCRIPT = '''
+import re, sys
+pattern = re.compile(sys.argv[1])
+for text in sys.stdin.read().split("\\x00\\x01"):
+    pattern.search(text)
+    pattern.sub("_", text)
+'''
+
+_UNBOUNDED = 2  # この回数以上を許す量指定子を「繰り返し」とみなす
+
+# 文字クラスの代表文字（攻撃的な入力の作成用）
+_CATEGORY_SAMPLES = {
+    sre_parse.CATEGORY_DIGIT: '1', sre_parse.CATEGORY_NOT_DIGIT: 'a',
+    sre_parse.CATEGORY_SPACE: ' ', sre_parse.CATEGORY_NOT_SPACE: 'a',
+    sre_parse.CATEGORY_WORD: 'a', sre_parse.CATEGORY_NOT_WORD: ' ',
+}
+
+
+def _walk(items):
+    """構文木のノードを順に返す"""
+    for op, av in items:
+        yield op, av
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+            yield from _walk(av[2])
+        elif op == sre_parse.SUBPATTERN:
+            yield from _walk(av[-1])
+        elif op == sre_parse.BRANCH:
+            for branch in av[1]:
+                yield from _walk(branch)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            yield from _walk(av[1])
+        elif op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+            yield from _walk(av)
+
+
+def _first_chars(items):
+    """パターンの先頭にくる文字の集合（文字クラス等で特定できない場合はNone）"""
+    for op, av in items:
+        if op == sre_parse.LITERAL:
+            return {av}
+        if op == sre_parse.SUBPATTERN:
+            return _first_chars(av[-1])
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] > 0:
+            return _first_chars(av[2])
+        if op == sre_parse.AT:
+            continue
+        return None
+    return set()
+
+
+def _overlapping_branches(branches):
+    """先頭文字が重なる選択肢があるか（特定できない場合は重なるとみなす）"""
+    seen = set()
+    for branch in branches:
+        chars = _first_chars(branch)
+        if chars is None or seen & chars:
+            return True
+        seen |= chars
+    return False
+
+
+def static_check(pattern):
+    """構文から危険なパターンを検出し、理由を返す（問題なければNone）"""
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return f"パターンが長すぎます（{MAX_PATTERN_LENGTH}文字まで）"
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as e:
+        return f"正規表現の構文エラー: {e}"
+
+    for op, av in _walk(list(parsed)):
+        if op == sre_parse.GROUPREF:
+            return "後方参照は使用できません"
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[1] >= _UNBOUNDED:
+            for inner_op, inner_av in _walk(list(av[2])):
+                if inner_op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and inner_av[1] >= _UNBOUNDED:
+                    return "繰り返しの中に繰り返しがあります（例: (a+)+）"
+                if inner_op == sre_parse.BRANCH and _overlapping_branches(inner_av[1]):
+                    return "繰り返しの中に重なり合う選択肢があります（例: (a|ab)*）"
+    return None
+
+
+def _adversarial_inputs(pattern):
+    """パターンに現れる文字を長く繰り返した入力（末尾は一致しない文字）"""
+    chars = set()
+    for op, av in _walk(list(sre_parse.parse(pattern))):
+        if op == sre_parse.LITERAL:
+            chars.add(chr(av))
+        elif op == sre_parse.IN:
+            for item_op, item_av in av:
+                if item_op == sre_parse.LITERAL:
+                    chars.add(chr(item_av))
+                elif item_op == sre_parse.RANGE:
+                    chars.add(chr(item_av[0]))
+                elif item_op == sre_parse.CATEGORY:
+                    chars.add(_CATEGORY_SAMPLES.get(item_av, 'a'))
+        elif op == sre_parse.ANY:
+            chars.add('a')
+    chars = sorted(chars or {'a'})
+
+    tail = '\n　!'
+    inputs = [char * BENCHMARK_LENGTH + tail for char in chars]
+    mixed = ''.join(chars)
+    inputs.append(mixed * (BENCHMARK_LENGTH // len(mixed) + 1) + tail)
+    return inputs
+
+
+def benchmark_pattern(pattern):
+    """攻撃的な入力で別プロセスで実行し、時間内に終わらなければ理由を返す"""
+    try:
+        subprocess.run(
+            [sys.executable, '-c', _BENCHMARK_SCRIPT, pattern],
+            input='\x00\x01'.join(_adversarial_inputs(pattern)),
+            text=True, encoding='utf-8', capture_output=True,
+            timeout=BENCHMARK_TIMEOUT, check=True
+        )
+    except subprocess.TimeoutExpired:
+        return f"攻撃的な入力で{BENCHMARK_TIMEOUT:.0f}秒以内に照合が終わりません"
+    except subprocess.CalledProcessError as e:
+        return f"照合テストに失敗しました: {e.stderr.strip().splitlines()[-1] if e.stderr.strip() else e}"
+    return None
+
+
+def validate_regex(pattern):
+    """正規表現のNGワードを検証（危険なパターンは ValueError）"""
+    reason = static_check(pattern) or benchmark_pattern(pattern)
+    if reason:
+        raise ValueError(f"正規表現「{pattern}」は使用できません: {reason}")
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_pattern(pattern):
+    """
+    照合用にコンパイル（re2 → regex → re の順）
+    構文チェックで危険と判定されたパターンはNone（照合しない）
+    """
+    reason = static_check(pattern)
+    if reason:
+        print(f"⚠️ 正規表現のNGワード「{pattern}」は照合しません: {reason}")
+        return None
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except Exception:
+            pass  # re2 が対応していない構文（先読みなど）は次の方法で照合
+    if regex is not None:
+        try:
+            return regex.compile(pattern)
+        except Exception:
+            pass
+    return re.compile(pattern)
+
+
+def _run(compiled, method, *args):
+    """regex モジュールの場合はタイムアウトつきで実行"""
+    if regex is not None and isinstance(compiled, regex.Pattern):
+        try:
+            return getattr(compiled, method)(*args, timeout=MATCH_TIMEOUT)
+        except TimeoutError:
+            print(f"⚠️ 正規表現のNGワードの照合が時間切れになりました: {compiled.pattern}")
+            return None
+    return getattr(compiled, method)(*args)
+
+
+def regex_search(pattern, text):
+    """正規表現のNGワードがテキストに含まれるか"""
+    compiled = compile_pattern(pattern)
+    return compiled is not None and _run(compiled, 'search', text) is not None
+
+
+def regex_sub(pattern, text):
+    """正規表現のNGワードを置換（照合できない場合は元のテキスト）"""
+    compiled = compile_pattern(pattern)
+    if compiled is None:
+        return text
+    result = _run(compiled, 'sub', REPLACEMENT, text)
+    return text if result is None else result
+
+
+def match_ng_word(text, word, word_type):
+    """テキストがNGワードに該当するか"""
+    if word_type == 'exact':
+        return word in text
+    if word_type == 'partial':
+        return word.lower() in text.lower()
+    if word_type == 'regex':
+        return regex_search(word, text)
+    return False
+
+
+def clean_text(text, ng_words):
+    """1つのテキストからNGワードを除去し、（クリーン後テキスト, 違反ワード）を返す"""
+    violations = []
+    cleaned_text = text
+
+    for word, word_type, *_ in ng_words:
+        if not match_ng_word(cleaned_text, word, word_type):
+            continue
+        violations.append(word)
+        if word_type == 'exact':
+            cleaned_text = cleaned_text.replace(word, REPLACEMENT)
+        elif word_type == 'partial':
+            # 大文字小文字を考慮した置換
+            cleaned_text = re.sub(re.escape(word), REPLACEMENT, cleaned_text, flags=re.IGNORECASE)
+        elif word_type == 'regex':
+            cleaned_text = regex_sub(word, cleaned_text)
+
+    return cleaned_text, violations
@@ -3,17 +3,115 @@ import os
 from datetime import datetime
 import json
 import sqlite3
+import time
 from dotenv import load_dotenv
-import re
-from collections import Counter
+from json_repair import repair_json, SCRIPT_JSON_SCHEMA
+from text_features import frequent_phrases, load_feature_extractor
+from ng_filter import clean_text
+from learning_decay import HALF_LIVES_SETTING, normalize_rows, parse_half_lives
+from database import read_data_versions
+from shared_cache import get_shared_cache
+from storage import SQLiteStorage
+from write_queue import get_write_queue
+from script_text import render_template
+from rate_limiter import estimate_tokens, get_rate_limiter, rate_limit_path
 
 load_dotenv()
 
+# Structured Outputs 用のレスポンス形式
+SCRIPT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "ad_script", "strict": True, "schema": SCRIPT_JSON_SCHEMA}
+}
+
+# 解析結果に必須のフィールド
+REQUIRED_SCRIPT_FIELDS = ['title', 'hook', 'main_content', 'call_to_action']
+
+# ストリーミング時に逐次表示するフィールド
+STREAMED_FIELDS = ('title', 'hook', 'main_content', 'call_to_action')
+
+# 生成レスポンスを共有キャッシュに保持する秒数（0なら保持しない）
+GENERATION_CACHE_TTL_ENV = 'GENERATION_CACHE_TTL'
+
+# 429・一時的なエラーを共有のレート制御で待って再試行する回数
+RATE_LIMIT_RETRIES = 3
+
+
+class StreamingJSONFieldParser:
+    """ストリーミング中のJSONテキストから、完成したトップレベルの文字列フィールドを逐次取り出す"""
+    
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.expect = None  # 'key' / 'colon' / 'value' / 'comma'
+        self.current_key = None
+        self.fields = {}
+    
+    def feed(self, chunk):
+        """チャンクを追加し、新たに完成した (フィールド名, 値) のリストを返す"""
+        self.buffer += chunk
+        completed = []
+        
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        literal = self.buffer[self.string_start:self.pos + 1]
+                        try:
+                            value = json.loads(literal)
+                        except ValueError:
+                            value = literal[1:-1]
+                        
+                        if self.expect == 'key':
+                            self.current_key = value
+                            self.expect = 'colon'
+                        elif self.expect == 'value':
+                            self.fields[self.current_key] = value
+                            completed.append((self.current_key, value))
+                            self.expect = 'comma'
+            elif ch == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif ch in '{[':
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect = 'key' if ch == '{' else None
+            elif ch in '}]':
+                self.depth = max(self.depth - 1, 0)
+            elif self.depth == 1:
+                if ch == ':' and self.expect == 'colon':
+                    self.expect = 'value'
+                elif ch == ',':
+                    self.expect = 'key'
+            
+            self.pos += 1
+        
+        return completed
+
+
 class OpenAIIntegration:
     def __init__(self, db_path='ad_script_database.db'):
         self.db_path = db_path
+        self.storage = SQLiteStorage(db_path)
+        self.cache = get_shared_cache()
+        self.cache_namespace = os.path.abspath(db_path)
+        self.generation_cache_ttl = float(os.getenv(GENERATION_CACHE_TTL_ENV) or 0)
         self.api_key = os.getenv('OPENAI_API_KEY')
         self.client = None
+        self._feature_extractor = None
+        # 全セッション・全プロセスで共有するAPIのレート制御
+        self.rate_limiter = get_rate_limiter(rate_limit_path(db_path))
         self.init_openai()
     
     def init_openai(self):
@@ -23,15 +121,43 @@ class OpenAIIntegration:
             return False
         
         try:
-            self.client = openai.OpenAI(api_key=self.api_key)
+            # 再試行はレート制御（_create_completion）で行い、クライアント自身では再試行しない
+            self.client = openai.OpenAI(api_key=self.api_key, max_retries=0)
             print("✅ OpenAI APIクライアントが正常に初期化されました")
             return True
         except Exception as e:
             print(f"❌ OpenAI APIクライアントの初期化に失敗しました: {str(e)}")
             return False
     
-    def get_learning_data(self, category_id, platform):
-        """学習データを取得（強化学習機能）"""
+    def _cached_read(self, name, args, tables, category_id, load, ttl=None):
+        """読み込み結果を共有キャッシュから取得（tables の変更バージョンが変わると読み込み直す）"""
+        conn = self.storage.connect()
+        try:
+            versions = read_data_versions(conn.cursor(), category_id, tables)
+        except sqlite3.Error:
+            return load()  # バージョン管理のないデータベースではキャッシュしない
+        finally:
+            conn.close()
+        return self.cache.get_or_compute(f'{self.cache_namespace}:{name}', args,
+                                         tuple(versions.values()), load, ttl)
+    
+    def get_learning_data(self, category_id, platform, half_life=None):
+        """
+        学習データを取得（強化学習機能）
+        half_life（日）を指定すると時間減衰スコアで評価する
+        """
+        # 減衰スコアの件数は現在時刻まで減衰させるため、一定時間で読み込み直す
+        return self._cached_read(
+            'learning_data', (category_id, platform, half_life),
+            ('learning_patterns', 'learning_pattern_decay', 'system_settings'), category_id,
+            lambda: self._load_learning_data(category_id, platform, half_life), ttl=300
+        )
+    
+    def _load_learning_data(self, category_id, platform, half_life=None):
+        """学習データをデータベースから読み込む"""
+        if half_life is not None:
+            return self._get_decayed_learning_data(category_id, platform, half_life)
+        
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -70,6 +196,50 @@ class OpenAIIntegration:
         finally:
             conn.close()
     
+    def _get_decayed_learning_data(self, category_id, platform, half_life):
+        """時間減衰スコアで学習データを取得"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('SELECT setting_value FROM system_settings WHERE setting_key = ?', (HALF_LIVES_SETTING,))
+            row = cursor.fetchone()
+            half_lives = parse_half_lives(row[0] if row else None)
+            if half_life not in half_lives:
+                raise ValueError(f"半減期 {half_life}日 の減衰スコアは保持していません（設定: {', '.join(map(str, half_lives))}）")
+            
+            cursor.execute('''
+                SELECT pattern_type, pattern_content, decayed_score, decayed_weight, last_update
+                FROM learning_pattern_decay
+                WHERE half_life_days = ? AND category_id = ? AND platform = ? AND decayed_score > 0
+                ORDER BY decayed_score DESC
+                LIMIT 20
+            ''', (half_life, category_id, platform))
+            positive_patterns = normalize_rows(cursor.fetchall(), half_life)
+            
+            cursor.execute('''
+                SELECT pattern_type, pattern_content, decayed_score, decayed_weight, last_update
+                FROM learning_pattern_decay
+                WHERE half_life_days = ? AND category_id = ? AND platform = ? AND decayed_score < 0
+                ORDER BY decayed_score ASC
+                LIMIT 10
+            ''', (half_life, category_id, platform))
+            negative_patterns = normalize_rows(cursor.fetchall(), half_life)
+            
+            return {
+                'positive_patterns': positive_patterns,
+                'negative_patterns': negative_patterns
+            }
+        
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"❌ 学習データの取得に失敗しました: {str(e)}")
+            return {'positive_patterns': [], 'negative_patterns': []}
+        
+        finally:
+            conn.close()
+    
     def analyze_effective_scripts(self, reference_scripts):
         """効果的台本を分析して共通パターンを抽出"""
         if not reference_scripts:
@@ -97,47 +267,33 @@ class OpenAIIntegration:
             if len(script) > 5 and script[5]:
                 all_ctas.append(script[5])
         
-        all_text = ' '.join(all_hooks + all_mains + all_ctas)
+        # 全台本のフック・本文・CTAをまとめて1回で走査
+        features = self.feature_extractor.extract(' '.join(all_hooks), ' '.join(all_mains), ' '.join(all_ctas))
+        keywords = features['keywords']
         
         # 数値パターンの抽出
-        numbers = re.findall(r'\d+[,\d]*[円％%万億千百十]', all_text)
-        analysis['numerical_patterns'] = list(set(numbers))
+        analysis['numerical_patterns'] = list(set(features['money_numbers']))
         
         # 権威性パターンの抽出
-        authority_keywords = ['プロデュース', 'ハーバード', '大学', '研究', '博士', '医師', '専門家', '認定', '承認', '特許']
-        for keyword in authority_keywords:
-            if keyword in all_text:
-                analysis['authority_patterns'].append(keyword)
+        analysis['authority_patterns'] = keywords.get('authority', [])
         
         # 緊急性パターンの抽出
-        urgency_keywords = ['今なら', '限定', '今だけ', '期間限定', '数量限定', '今すぐ', '1度しか', '残り', '最後']
-        for keyword in urgency_keywords:
-            if keyword in all_text:
-                analysis['urgency_patterns'].append(keyword)
+        analysis['urgency_patterns'] = keywords.get('urgency', [])
         
         # フック開始パターンの抽出
-        hook_starters = []
-        for hook in all_hooks:
-            starter = hook[:10] if len(hook) > 10 else hook
-            hook_starters.append(starter)
-        analysis['hook_starters'] = hook_starters
+        analysis['hook_starters'] = [hook[:10] for hook in all_hooks]
         
         # CTAパターンの抽出
-        cta_patterns = []
-        for cta in all_ctas:
-            if 'チェック' in cta:
-                cta_patterns.append('チェック')
-            if '試して' in cta:
-                cta_patterns.append('試して')
-            if '無料' in cta:
-                cta_patterns.append('無料')
-        analysis['cta_patterns'] = list(set(cta_patterns))
-        
-        # 頻出キーワードの抽出
-        words = re.findall(r'[一-龯ぁ-ゔァ-ヴー]+', all_text)
-        word_counts = Counter(words)
-        analysis['frequent_keywords'] = [word for word, count in word_counts.most_common(15) 
-                                       if len(word) > 1 and count > 1]
+        analysis['cta_patterns'] = keywords.get('cta_marker', [])
+        
+        # 頻出キーワードの抽出（複数の台本に共通するフレーズ）
+        script_texts = [
+            f"{script[3] if len(script) > 3 and script[3] else ''} "
+            f"{script[4] if len(script) > 4 and script[4] else ''} "
+            f"{script[5] if len(script) > 5 and script[5] else ''}"
+            for script in reference_scripts
+        ]
+        analysis['frequent_keywords'] = frequent_phrases(script_texts, limit=15)
         
         return analysis
     
@@ -265,126 +421,337 @@ CTA: {script_cta}
         
         return prompt
     
-    def generate_script(self, category, target_audience, platform, script_length, reference_scripts=None, category_id=None):
+    def _get_ng_words(self, category_id):
+        """カテゴリーのNGワード（word, word_type, reason）を取得"""
+        if not category_id:
+            return []
+        return self._cached_read('ng_words', (category_id,), ('ng_words',), category_id, lambda: self.storage.fetch_all('''
+            SELECT word, word_type, reason FROM ng_words
+            WHERE category_id = ? AND COALESCE(regex_status, 'ok') != 'rejected'
+        ''', (category_id,)))
+    
+    def _build_generation_messages(self, category, target_audience, platform, script_length,
+                                   reference_scripts=None, category_id=None, ng_words=None):
+        """台本生成用のメッセージを作成（統合プロンプト + NGワード指示）"""
+        # 統合プロンプトを作成
+        prompt = self.create_integrated_prompt(
+            category, target_audience, platform, 
+            script_length, reference_scripts, category_id
+        )
+        
+        # 要件1対応：自動生成台本にのみNGワード指示を追加
+        ng_words_instruction = ""
+        if ng_words:
+            ng_words_instruction = f"""
+                    
+【重要：レギュレーション（使用禁止ワード）】
+以下の言葉は法的・レギュレーション上の理由により使用を禁止されています。
+台本作成時は絶対に使用しないでください：
+
+禁止ワード:
+{chr(10).join([f"- {word} {f'（理由：{reason}）' if reason else ''}" for word, word_type, reason in ng_words])}
+
+これらの言葉を使用せずに、効果的で魅力的な台本を作成してください。
+"""
+        
+        # プロンプトにNGワード指示を追加
+        prompt += ng_words_instruction
+        
+        return [
+            {"role": "system", "content": "あなたは効果的な広告台本作成の専門家です。レギュレーション遵守を最優先に、実際の配信結果データと専門家の分析を統合して、最高品質の台本を作成することが得意です。データドリブンなアプローチで、実証された成功パターンを活用してください。"},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _create_completion(self, user_id=None, **params):
+        """
+        共有のレート制御で実行枠を確保してからChat Completions APIを呼び出し、(レスポンス, 確保したトークン数) を返す
+        応答ヘッダーの上限・残りをレート制御に反映し、429・一時的なエラーは待ってから再試行する
+        """
+        reserved = estimate_tokens(params['messages'], params.get('max_tokens', 0), params.get('model', 'gpt-4o-mini'))
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self.rate_limiter.acquire(user_id, reserved)
+            try:
+                raw = self.client.chat.completions.with_raw_response.create(**params)
+            except openai.RateLimitError as e:
+                # 利用枠（クレジット）の不足は待っても解消しない
+                if getattr(e, 'code', None) == 'insufficient_quota' or attempt == RATE_LIMIT_RETRIES:
+                    raise
+                self.rate_limiter.record_rate_limited(e.response.headers)
+                print(f"⚠️ APIのレート制限に達したため、待ってから再試行します（{attempt + 1}/{RATE_LIMIT_RETRIES}）")
+                continue
+            except (openai.APIConnectionError, openai.InternalServerError):
+                # 処理されなかったリクエストの分は戻す
+                self.rate_limiter.settle(reserved, 0)
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+            self.rate_limiter.record_response(raw.headers)
+            return raw.parse(), reserved
+    
+    def _request_continuation(self, messages, partial_text, user_id=None):
+        """途中で切れたレスポンスの続きだけを生成（修復できない場合のみ使用）"""
+        response, reserved = self._create_completion(
+            user_id,
+            model="gpt-4o-mini",
+            messages=messages + [
+                {"role": "assistant", "content": partial_text},
+                {"role": "user", "content": "直前の出力は文字数上限で途中終了しました。JSONの続きだけを、途切れた文字の直後から重複なしで出力してください。"}
+            ],
+            temperature=0,
+            max_tokens=800
+        )
+        self.rate_limiter.settle(reserved, response.usage.total_tokens)
+        
+        self.log_api_usage(
+            request_type='json_continuation',
+            tokens_used=response.usage.total_tokens,
+            cost_jpy=self.calculate_cost(response.usage.total_tokens)
+        )
+        
+        return response.choices[0].message.content or ""
+    
+    def _parse_script_response(self, response_text, category, messages=None, finish_reason=None,
+                               request_type='integrated_script_generation', user_id=None):
+        """レスポンスのJSONを解析（ローカル修復 → 必要時のみ続き生成）し、不足フィールドを補完"""
+        script_data = None
+        outcome = 'failed'
+        
+        try:
+            script_data, outcome = repair_json(response_text)
+            if not isinstance(script_data, dict) or not all(script_data.get(field) for field in REQUIRED_SCRIPT_FIELDS):
+                raise ValueError("必須フィールドが不足しています")
+        except ValueError:
+            script_data = None
+            # max_tokensで途切れた場合のみ、続きを生成して再解析
+            if messages is not None and finish_reason == 'length':
+                try:
+                    continued_text = response_text + self._request_continuation(messages, response_text, user_id)
+                    script_data, _ = repair_json(continued_text)
+                    outcome = 'continued'
+                    response_text = continued_text
+                except Exception as e:
+                    print(f"⚠️ 続きの生成による修復に失敗しました: {str(e)}")
+                    script_data = None
+                    outcome = 'failed'
+            else:
+                outcome = 'failed'
+        
+        self.log_parse_outcome(request_type, outcome)
+        
+        if not isinstance(script_data, dict):
+            # フォールバック処理
+            script_data = {
+                "title": f"{category}の統合分析台本",
+                "hook": "効果実証済みの強力なフック",
+                "main_content": "配信結果とエキスパート分析を統合したメインコンテンツ",
+                "call_to_action": "高コンバージョンが実証されたCTA",
+                "script_content": response_text
+            }
+        
+        # 必要なフィールドの確認
+        for field in REQUIRED_SCRIPT_FIELDS:
+            if field not in script_data:
+                script_data[field] = f"統合分析による{field}"
+        
+        # script_contentの作成
+        if not script_data.get('script_content'):
+            script_data['script_content'] = render_template('labeled', script_data['hook'], script_data['main_content'],
+                                                            script_data['call_to_action'])
+        
+        return script_data
+    
+    def _generation_cache_key(self, messages):
+        """生成リクエスト（モデル・パラメータ・メッセージ）のキャッシュキー"""
+        return self.cache.make_key('generation', ('gpt-4o-mini', 0.7, 1200, json.dumps(messages, ensure_ascii=False, sort_keys=True)))
+    
+    def _get_cached_generation(self, messages):
+        """同じリクエストの生成レスポンス (response_text, finish_reason) があれば返す"""
+        if not self.generation_cache_ttl:
+            return None
+        found, value = self.cache.get(self._generation_cache_key(messages), 'gpt-4o-mini')
+        return value if found else None
+    
+    def _store_generation(self, messages, response_text, finish_reason):
+        # 途中で打ち切られたレスポンスは保持しない（再利用時に続きの生成が必要になるため）
+        if self.generation_cache_ttl and finish_reason == 'stop':
+            self.cache.set(self._generation_cache_key(messages), 'gpt-4o-mini',
+                           (response_text, finish_reason), self.generation_cache_ttl)
+    
+    def generate_script(self, category, target_audience, platform, script_length, reference_scripts=None, category_id=None,
+                        user_id=None):
         """
         統合版台本生成（効果的台本 + 強化学習、トーン削除、NGワードチェック）
         要件1対応：自動生成台本のみNGワードチェック適用
+        user_id: レート制御で順番を公平に回す単位（セッション・バッチなど）
         """
         if not self.client:
             raise Exception("OpenAI APIクライアントが初期化されていません")
         
         try:
-            # 統合プロンプトを作成
-            prompt = self.create_integrated_prompt(
-                category, target_audience, platform, 
-                script_length, reference_scripts, category_id
+            ng_words = self._get_ng_words(category_id)
+            messages = self._build_generation_messages(
+                category, target_audience, platform, script_length,
+                reference_scripts, category_id, ng_words
+            )
+            
+            cached = self._get_cached_generation(messages)
+            if cached:
+                # 同じリクエストの生成結果（他のプロセスの結果を含む）を再利用
+                response_text, finish_reason = cached
+                total_tokens = 0
+            else:
+                # OpenAI APIで台本生成
+                response, reserved = self._create_completion(
+                    user_id,
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1200,
+                    response_format=SCRIPT_RESPONSE_FORMAT
+                )
+                response_text = response.choices[0].message.content or ""
+                finish_reason = response.choices[0].finish_reason
+                total_tokens = response.usage.total_tokens
+                self.rate_limiter.settle(reserved, total_tokens)
+            
+            # レスポンスを解析
+            script_data = self._parse_script_response(
+                response_text, category, messages, finish_reason, user_id=user_id
             )
+            if not cached:
+                self._store_generation(messages, response_text, finish_reason)
             
-            # 要件1対応：自動生成台本にのみNGワード指示を追加
-            ng_words_instruction = ""
+            # 要件1対応：自動生成台本のみNGワードチェック・クリーン
             if category_id:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('SELECT word, reason FROM ng_words WHERE category_id = ?', (category_id,))
-                ng_words = cursor.fetchall()
-                conn.close()
-                
-                if ng_words:
-                    ng_words_instruction = f"""
-                    
-【重要：レギュレーション（使用禁止ワード）】
-以下の言葉は法的・レギュレーション上の理由により使用を禁止されています。
-台本作成時は絶対に使用しないでください：
-
-禁止ワード:
-{chr(10).join([f"- {word} {f'（理由：{reason}）' if reason else ''}" for word, reason in ng_words])}
-
-これらの言葉を使用せずに、効果的で魅力的な台本を作成してください。
-"""
+                cleaned_script, violations = self.check_and_clean_script(script_data, category_id, ng_words)
+                if violations:
+                    print(f"⚠️ NGワードを検出・除去しました: {violations}")
+                    script_data = cleaned_script
             
-            # プロンプトにNGワード指示を追加
-            prompt += ng_words_instruction
-            
-            # OpenAI APIで台本生成
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "あなたは効果的な広告台本作成の専門家です。レギュレーション遵守を最優先に、実際の配信結果データと専門家の分析を統合して、最高品質の台本を作成することが得意です。データドリブンなアプローチで、実証された成功パターンを活用してください。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1200
+            # API使用ログを記録
+            if not cached:
+                self.log_api_usage(
+                    request_type='integrated_script_generation',
+                    tokens_used=total_tokens,
+                    cost_jpy=self.calculate_cost(total_tokens)
+                )
+            
+            return script_data
+            
+        except Exception as e:
+            print(f"❌ 統合台本生成中にエラーが発生しました: {str(e)}")
+            raise e
+    
+    def generate_script_stream(self, category, target_audience, platform, script_length, reference_scripts=None, category_id=None,
+                               user_id=None):
+        """
+        ストリーミング版台本生成
+        フィールドが完成するたびにNGワードをクリーンして
+        {'type': 'field', 'field': ..., 'value': ...} を返し、
+        最後に {'type': 'complete', 'script': ...} を返すジェネレーター
+        user_id: レート制御で順番を公平に回す単位（セッション・バッチなど）
+        """
+        if not self.client:
+            raise Exception("OpenAI APIクライアントが初期化されていません")
+        
+        try:
+            ng_words = self._get_ng_words(category_id)
+            messages = self._build_generation_messages(
+                category, target_audience, platform, script_length,
+                reference_scripts, category_id, ng_words
             )
             
-            # レスポンスを解析
-            response_text = response.choices[0].message.content
+            cached = self._get_cached_generation(messages)
+            if cached:
+                # 同じリクエストの生成結果（他のプロセスの結果を含む）を再利用
+                response_text, finish_reason = cached
+                total_tokens = 0
+                for field, value in StreamingJSONFieldParser().feed(response_text):
+                    if field not in STREAMED_FIELDS or not isinstance(value, str):
+                        continue
+                    if ng_words:
+                        value, _ = self._clean_text(value, ng_words)
+                    yield {'type': 'field', 'field': field, 'value': value}
+            else:
+                stream, reserved = self._create_completion(
+                    user_id,
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1200,
+                    response_format=SCRIPT_RESPONSE_FORMAT,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
             
-            # JSONの抽出と解析
-            try:
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}') + 1
+                parser = StreamingJSONFieldParser()
+                response_text = ""
+                total_tokens = 0
+                finish_reason = None
+            
+                for chunk in stream:
+                    # include_usage指定時、最後のチャンクはchoicesが空でusageのみ
+                    if chunk.usage:
+                        total_tokens = chunk.usage.total_tokens
+                    if not chunk.choices:
+                        continue
                 
-                if start_idx != -1 and end_idx != -1:
-                    json_str = response_text[start_idx:end_idx]
-                    script_data = json.loads(json_str)
-                else:
-                    raise json.JSONDecodeError("JSON形式が見つかりません", response_text, 0)
+                    if chunk.choices[0].finish_reason:
+                        finish_reason = chunk.choices[0].finish_reason
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
                 
-            except json.JSONDecodeError:
-                # フォールバック処理
-                script_data = {
-                    "title": f"{category}の統合分析台本",
-                    "hook": "効果実証済みの強力なフック",
-                    "main_content": "配信結果とエキスパート分析を統合したメインコンテンツ",
-                    "call_to_action": "高コンバージョンが実証されたCTA",
-                    "script_content": response_text
-                }
-            
-            # 必要なフィールドの確認
-            required_fields = ['title', 'hook', 'main_content', 'call_to_action']
-            for field in required_fields:
-                if field not in script_data:
-                    script_data[field] = f"統合分析による{field}"
-            
-            # script_contentの作成
-            if not script_data.get('script_content'):
-                script_data['script_content'] = f"""🎣 フック: {script_data['hook']}
-
-💬 メインコンテンツ: {script_data['main_content']}
-
-📢 CTA: {script_data['call_to_action']}"""
+                    response_text += delta
+                    for field, value in parser.feed(delta):
+                        if field not in STREAMED_FIELDS or not isinstance(value, str):
+                            continue
+                        if ng_words:
+                            value, _ = self._clean_text(value, ng_words)
+                        yield {'type': 'field', 'field': field, 'value': value}
+                self.rate_limiter.settle(reserved, total_tokens)
             
-            # 要件1対応：自動生成台本のみNGワードチェック・クリーン
+            script_data = self._parse_script_response(
+                response_text, category, messages, finish_reason,
+                request_type='integrated_script_generation_stream', user_id=user_id
+            )
+            if not cached:
+                self._store_generation(messages, response_text, finish_reason)
+            
+            # 完成後に全フィールドを改めてチェック（title / script_content を含む）
             if category_id:
-                cleaned_script, violations = self.check_and_clean_script(script_data, category_id)
+                cleaned_script, violations = self.check_and_clean_script(script_data, category_id, ng_words)
                 if violations:
                     print(f"⚠️ NGワードを検出・除去しました: {violations}")
                     script_data = cleaned_script
             
             # API使用ログを記録
-            self.log_api_usage(
-                request_type='integrated_script_generation',
-                tokens_used=response.usage.total_tokens,
-                cost_jpy=self.calculate_cost(response.usage.total_tokens)
-            )
+            if not cached:
+                self.log_api_usage(
+                    request_type='integrated_script_generation_stream',
+                    tokens_used=total_tokens,
+                    cost_jpy=self.calculate_cost(total_tokens)
+                )
             
-            return script_data
+            yield {'type': 'complete', 'script': script_data}
             
         except Exception as e:
-            print(f"❌ 統合台本生成中にエラーが発生しました: {str(e)}")
+            print(f"❌ ストリーミング台本生成中にエラーが発生しました: {str(e)}")
             raise e
     
-    def check_and_clean_script(self, script_data, category_id):
+    def _clean_text(self, text, ng_words):
+        """1つのテキストからNGワードを除去し、（クリーン後テキスト, 違反ワード）を返す"""
+        return clean_text(text, ng_words)
+    
+    def check_and_clean_script(self, script_data, category_id, ng_words=None):
         """生成された台本のNGワードをチェック・除去"""
         if not category_id:
             return script_data, []
         
         # データベースからNGワードを取得
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT word, word_type FROM ng_words WHERE category_id = ?', (category_id,))
-        ng_words = cursor.fetchall()
-        conn.close()
+        if ng_words is None:
+            ng_words = self._get_ng_words(category_id)
         
         if not ng_words:
             return script_data, []
@@ -395,26 +762,8 @@ CTA: {script_cta}
         # 各フィールドをチェック・クリーン
         for field in ['title', 'hook', 'main_content', 'call_to_action', 'script_content']:
             if field in cleaned_script and cleaned_script[field]:
-                original_text = cleaned_script[field]
-                cleaned_text = original_text
-                
-                for word, word_type in ng_words:
-                    if word_type == 'exact':
-                        if word in cleaned_text:
-                            violations.append(word)
-                            cleaned_text = cleaned_text.replace(word, '[規制対象]')
-                    elif word_type == 'partial':
-                        if word.lower() in cleaned_text.lower():
-                            violations.append(word)
-                            # 大文字小文字を考慮した置換
-                            import re
-                            cleaned_text = re.sub(re.escape(word), '[規制対象]', cleaned_text, flags=re.IGNORECASE)
-                    elif word_type == 'regex':
-                        import re
-                        if re.search(word, cleaned_text):
-                            violations.append(word)
-                            cleaned_text = re.sub(word, '[規制対象]', cleaned_text)
-                
+                cleaned_text, field_violations = self._clean_text(cleaned_script[field], ng_words)
+                violations.extend(field_violations)
                 cleaned_script[field] = cleaned_text
         
         return cleaned_script, violations
@@ -426,30 +775,64 @@ CTA: {script_cta}
         cost_per_1k_tokens = 0.045
         return (tokens / 1000) * cost_per_1k_tokens
     
+    def _log_async(self, sql, params, error_message):
+        """ログを書き込みキューに追加（完了は待たず、失敗した場合だけ表示）"""
+        def report(future):
+            if future.exception() is not None:
+                print(f"❌ {error_message}: {str(future.exception())}")
+        
+        try:
+            get_write_queue(self.db_path).execute(sql, params).add_done_callback(report)
+        except Exception as e:
+            print(f"❌ {error_message}: {str(e)}")
+    
     def log_api_usage(self, request_type, tokens_used, cost_jpy):
         """API使用ログを記録"""
+        self._log_async('''
+            INSERT INTO api_usage_log (date, request_type, tokens_used, cost_jpy, created_at)
+            VALUES (DATE('now'), ?, ?, ?, DATETIME('now'))
+        ''', (request_type, tokens_used, cost_jpy), "API使用ログの記録に失敗しました")
+    
+    def log_parse_outcome(self, request_type, outcome):
+        """レスポンスJSONの解析結果を記録（ok / repaired / truncated / continued / failed）"""
+        self._log_async('''
+            INSERT INTO json_parse_log (date, request_type, outcome, created_at)
+            VALUES (DATE('now'), ?, ?, DATETIME('now'))
+        ''', (request_type, outcome), "解析結果の記録に失敗しました")
+    
+    def get_parse_failure_stats(self, days=7):
+        """直近のJSON解析結果の内訳と失敗率を取得"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                INSERT INTO api_usage_log (date, request_type, tokens_used, cost_jpy, created_at)
-                VALUES (DATE('now'), ?, ?, ?, DATETIME('now'))
-            ''', (request_type, tokens_used, cost_jpy))
+                SELECT outcome, COUNT(*)
+                FROM json_parse_log
+                WHERE date >= DATE('now', ?)
+                GROUP BY outcome
+            ''', (f'-{int(days)} days',))
             
-            conn.commit()
+            counts = dict(cursor.fetchall())
             conn.close()
             
+            total = sum(counts.values())
+            return {
+                'total': total,
+                'counts': counts,
+                'repair_rate': (counts.get('repaired', 0) + counts.get('truncated', 0)) / total if total else 0.0,
+                'continuation_rate': counts.get('continued', 0) / total if total else 0.0,
+                'failure_rate': counts.get('failed', 0) / total if total else 0.0
+            }
+            
         except Exception as e:
-            print(f"❌ API使用ログの記録に失敗しました: {str(e)}")
+            print(f"❌ 解析結果の取得に失敗しました: {str(e)}")
+            return {'total': 0, 'counts': {}, 'repair_rate': 0.0, 'continuation_rate': 0.0, 'failure_rate': 0.0}
     
     def get_daily_usage(self):
         """当日のAPI使用量を取得"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
+            result = self.storage.fetch_one('''
                 SELECT COUNT(*) as request_count, 
                        SUM(tokens_used) as total_tokens,
                        SUM(cost_jpy) as total_cost
@@ -457,9 +840,6 @@ CTA: {script_cta}
                 WHERE date = DATE('now')
             ''')
             
-            result = cursor.fetchone()
-            conn.close()
-            
             return {
                 'request_count': result[0] or 0,
                 'total_tokens': result[1] or 0,
@@ -486,6 +866,13 @@ CTA: {script_cta}
         
         return True, "制限内です"
     
+    @property
+    def feature_extractor(self):
+        """特徴抽出器（初回利用時にデータベースの辞書から作成）"""
+        if self._feature_extractor is None:
+            self._feature_extractor = load_feature_extractor(self.db_path)
+        return self._feature_extractor
+    
     def analyze_generated_script(self, script_data):
         """生成された台本の品質を分析"""
         analysis = {
@@ -497,45 +884,25 @@ CTA: {script_cta}
             'overall_score': 0
         }
         
-        script_text = f"{script_data.get('hook', '')} {script_data.get('main_content', '')} {script_data.get('call_to_action', '')}"
-        
-        # 数値の有無
-        if re.search(r'\d+[,\d]*[円％%万億千百十]', script_text):
-            analysis['has_numbers'] = True
-        
-        # 緊急性の有無
-        urgency_words = ['今なら', '限定', '今だけ', '今すぐ', '期間限定']
-        if any(word in script_text for word in urgency_words):
-            analysis['has_urgency'] = True
+        hook = script_data.get('hook', '')
+        cta = script_data.get('call_to_action', '')
+        features = self.feature_extractor.extract(hook, script_data.get('main_content', ''), cta)
+        keywords = features['keywords']
         
-        # 権威性の有無
-        authority_words = ['プロデュース', '認定', '研究', '専門家', '効果']
-        if any(word in script_text for word in authority_words):
-            analysis['has_authority'] = True
+        # 数値・緊急性・権威性の有無
+        analysis['has_numbers'] = bool(features['money_numbers'])
+        analysis['has_urgency'] = bool(keywords.get('quality_urgency'))
+        analysis['has_authority'] = bool(keywords.get('quality_authority'))
         
-        # フック強度（簡単な評価）
-        hook = script_data.get('hook', '')
+        # フック強度（数字で始まる +2、疑問文・感嘆符は辞書の加点）
         if hook:
-            hook_score = 0
-            if re.match(r'^\d+', hook):  # 数字で始まる
-                hook_score += 2
-            if '？' in hook or '?' in hook:  # 疑問文
-                hook_score += 1
-            if '！' in hook or '!' in hook:  # 感嘆符
-                hook_score += 1
+            hook_score = 2 if features['hook_starts_with_number'] else 0
+            hook_score += self.feature_extractor.score(features, 'hook_structure')
             analysis['hook_strength'] = hook_score
         
         # CTA強度
-        cta = script_data.get('call_to_action', '')
         if cta:
-            cta_score = 0
-            if '今すぐ' in cta:
-                cta_score += 2
-            if '無料' in cta:
-                cta_score += 1
-            if 'チェック' in cta:
-                cta_score += 1
-            analysis['cta_strength'] = cta_score
+            analysis['cta_strength'] = self.feature_extractor.score(features, 'quality_cta')
         
         # 総合スコア
         overall_score = 0
@@ -0,0 +1,180 @@
+"""
+成功台本からの頻出フレーズ抽出ジョブ
+
+配信結果のある台本をカテゴリーごとに読み込み、スコアの高い台本に偏って現れる
+文字n-gram（フレーズ）を見つけて特徴辞書（learning_phrase）に登録します。
+登録したフレーズは _extract_patterns で 'phrase' パターンとして抽出され、
+学習パターンの再構築で learning_patterns に反映されます。
+
+1. 高スコア台本のn-gramを上限つきの近似カウンタで数え、候補を絞る
+2. 候補だけを正確に数え、高スコア・低スコア台本の出現率を比較（対数オッズ）
+3. 同じ台本にしか現れない短いフレーズ（長いフレーズの一部）を除く
+
+使用例:
+    python phrase_mining.py --db-path ad_script_database.db
+"""
+import argparse
+import heapq
+import math
+import sys
+import time
+from collections import Counter
+
+from database import DatabaseManager
+from learning_rebuild import rebuild_learning_patterns
+from text_features import HIRAGANA_ONLY_PATTERN, phrase_ngrams, prune_redundant_phrases
+
+PHRASE_GROUP = 'learning_phrase'
+
+# 台本ごとの平均スコア（配信結果のある台本のみ）
+SCRIPT_QUERY = '''
+    SELECT s.hook, s.main_content, s.call_to_action, r.avg_score
+    FROM (
+        SELECT script_type, script_id, AVG(performance_score) AS avg_score
+        FROM campaign_results
+        WHERE performance_score IS NOT NULL
+        GROUP BY script_type, script_id
+    ) r
+    JOIN {table} s ON s.id = r.script_id
+    WHERE r.script_type {type_condition} AND s.category_id = ?
+'''
+
+SCRIPT_SOURCES = [
+    ('effective_scripts', "= 'effective'"),
+    ('generated_scripts', "!= 'effective'"),
+]
+
+
+class HeavyHitterCounter:
+    """
+    出現回数の多い要素だけを保持する近似カウンタ（保持件数の上限つき）
+    上限の2倍を超えたら上位 capacity 件の最小回数以下を切り捨て、その回数を誤差の上限として記録する
+    """
+
+    def __init__(self, capacity=50000):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.error = 0  # 切り捨てによる数え漏れの上限
+
+    def update(self, items):
+        self.counts.update(items)
+        if len(self.counts) > self.capacity * 2:
+            self._prune()
+
+    def _prune(self):
+        threshold = heapq.nlargest(self.capacity, self.counts.values())[-1]
+        self.error = max(self.error, threshold)
+        self.counts = Counter({item: count for item, count in self.counts.items() if count > threshold})
+
+    def candidates(self, min_count, limit):
+        """出現回数が min_count に届く可能性のある要素（多い順に最大 limit 件）"""
+        threshold = min_count - self.error
+        return [item for item, count in self.counts.most_common(limit) if count >= threshold]
+
+
+def log_odds_z(high_count, high_total, low_count, low_total, prior=0.5):
+    """高スコア台本と低スコア台本での出現率の差（平滑化した対数オッズ比のz値）"""
+    a, b = high_count + prior, high_total - high_count + prior
+    c, d = low_count + prior, low_total - low_count + prior
+    return (math.log(a / b) - math.log(c / d)) / math.sqrt(1 / a + 1 / b + 1 / c + 1 / d)
+
+
+def _iter_category_scripts(db, category_id, batch_size=1000):
+    """カテゴリーの台本を (テキスト, 平均スコア) で少しずつ読み込む"""
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        for table, type_condition in SCRIPT_SOURCES:
+            cursor.execute(SCRIPT_QUERY.format(table=table, type_condition=type_condition), (category_id,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for hook, main_content, cta, avg_score in rows:
+                    yield f"{hook or ''} {main_content or ''} {cta or ''}", avg_score
+    finally:
+        conn.close()
+
+
+def mine_category_phrases(db, category_id, high_score=1.0, min_support=3, min_z=1.0,
+                          min_n=2, max_n=8, capacity=50000, max_candidates=5000):
+    """
+    1カテゴリーの頻出フレーズを抽出
+    戻り値: {フレーズ: (高スコア台本数, 低スコア台本数, z値)}
+    """
+    # 1回目: 高スコア台本のn-gramを近似カウントして候補を絞る
+    counter = HeavyHitterCounter(capacity)
+    high_total = low_total = 0
+    for text, score in _iter_category_scripts(db, category_id):
+        if score >= high_score:
+            counter.update(phrase_ngrams(text, min_n, max_n))
+            high_total += 1
+        else:
+            low_total += 1
+
+    candidates = {
+        phrase for phrase in counter.candidates(min_support, max_candidates)
+        if not HIRAGANA_ONLY_PATTERN.match(phrase)
+    }
+    if not candidates:
+        return {}
+
+    # 2回目: 候補だけを正確に数える
+    high_counts = Counter()
+    low_counts = Counter()
+    for text, score in _iter_category_scripts(db, category_id):
+        found = phrase_ngrams(text, min_n, max_n).intersection(candidates)
+        (high_counts if score >= high_score else low_counts).update(found)
+
+    stats = {}
+    for phrase, high_count in high_counts.items():
+        if high_count < min_support:
+            continue
+        z = log_odds_z(high_count, high_total, low_counts[phrase], low_total)
+        if z >= min_z:
+            stats[phrase] = (high_count, low_counts[phrase], z)
+
+    return {phrase: stats[phrase] for phrase in prune_redundant_phrases(stats)}
+
+
+def mine_phrases(db, max_phrases=200, rebuild=True, **options):
+    """全カテゴリーの頻出フレーズを抽出して特徴辞書に登録し、学習パターンに反映"""
+    started = time.perf_counter()
+
+    best = {}  # フレーズ -> 最も高いz値
+    for category in db.get_product_categories():
+        for phrase, (_, _, z) in mine_category_phrases(db, category[0], **options).items():
+            best[phrase] = max(z, best.get(phrase, z))
+
+    phrases = sorted(best, key=best.get, reverse=True)[:max_phrases]
+    db.replace_feature_group(PHRASE_GROUP, phrases)
+
+    if rebuild:
+        rebuild_learning_patterns(db)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ 頻出フレーズを抽出しました: {len(phrases)}件（{elapsed:.1f}秒）")
+    return {'phrases': phrases, 'seconds': elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='成功台本の頻出フレーズを抽出して学習パターンに反映します')
+    parser.add_argument('--db-path', default='ad_script_database.db', help='データベースファイル')
+    parser.add_argument('--high-score', type=float, default=1.0, help='高スコア台本とみなす平均スコア')
+    parser.add_argument('--min-support', type=int, default=3, help='高スコア台本での最小出現台本数')
+    parser.add_argument('--min-z', type=float, default=1.0, help='高スコア台本への偏りの最小値（z値）')
+    parser.add_argument('--max-n', type=int, default=8, help='フレーズの最大文字数')
+    parser.add_argument('--max-phrases', type=int, default=200, help='登録するフレーズの最大件数')
+    parser.add_argument('--capacity', type=int, default=50000, help='近似カウンタの保持件数')
+    parser.add_argument('--no-rebuild', action='store_true', help='学習パターンの再構築を行わない')
+    args = parser.parse_args(argv)
+
+    db = DatabaseManager(args.db_path)
+    mine_phrases(db, max_phrases=args.max_phrases, rebuild=not args.no_rebuild,
+                 high_score=args.high_score, min_support=args.min_support, min_z=args.min_z,
+                 max_n=args.max_n, capacity=args.capacity)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
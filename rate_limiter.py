@@ -0,0 +1,515 @@
+"""
+OpenAI APIのレート制御（セッション・プロセス間で共有）
+
+同時に使う利用者がそれぞれAPIを呼ぶと、集中したときにRPM/TPMの上限を超えて429になり、
+空いている時間には枠が余ります。このモジュールは共有のSQLiteファイルでリクエスト数・トークン数の
+トークンバケットを管理し、すべての OpenAIIntegration（別プロセス・別レプリカを含む）が同じ枠から実行枠を受け取ります。
+
+- バケット: 1分あたりの上限 × HEADROOM を容量とし、上限の速さで補充する（上限のすぐ下で使い切る）
+- トークン数: 入力の見積もり + max_tokens で確保し、応答後に実際の使用量との差を戻す
+- 公平性: 待っているリクエストは、最後に実行枠を受け取ったのが古い利用者から順に通す（利用者ごとのラウンドロビン）
+- 適応: 応答ヘッダー（x-ratelimit-*）で上限と残りを合わせ、429では retry-after に従って全体を止める
+  （連続した429では待ち時間を倍にする）
+
+設定は環境変数で行います（ヘッダーで分かった上限が優先されます）。
+- RATE_LIMIT_RPM / RATE_LIMIT_TPM: 1分あたりのリクエスト数・トークン数の上限（既定 500 / 200000）
+- RATE_LIMIT_DB: 共有ファイルのパス（既定は「データベース名_ratelimit.db」）
+
+使用例:
+    python rate_limiter.py status
+    python rate_limiter.py simulate --rpm 600 --processes 4 --users 3 --seconds 20
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+RATE_LIMIT_RPM_ENV = 'RATE_LIMIT_RPM'
+RATE_LIMIT_TPM_ENV = 'RATE_LIMIT_TPM'
+RATE_LIMIT_DB_ENV = 'RATE_LIMIT_DB'
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200000
+HEADROOM = 0.9  # 上限のこの割合までに抑える（他の利用や見積もりの誤差の分を残す）
+DEFAULT_USER = 'default'
+STALE_WAITER_SECONDS = 30  # この時間更新のない待ち（終了したプロセス）は取り除く
+MAX_BACKOFF_SECONDS = 60
+BUCKETS = ('requests', 'tokens')
+
+
+class RateLimitTimeout(Exception):
+    """待ち時間の上限までに実行枠を確保できなかった"""
+
+
+def rate_limit_path(db_path):
+    """共有ファイルのパス（環境変数 RATE_LIMIT_DB、未設定ならデータベースの隣）"""
+    if os.getenv(RATE_LIMIT_DB_ENV):
+        return os.getenv(RATE_LIMIT_DB_ENV)
+    base, ext = os.path.splitext(db_path)
+    return f'{base}_ratelimit{ext or ".db"}'
+
+
+def parse_duration(value):
+    """ヘッダーの期間（'1s', '6m0s', '20ms', '0.5'）を秒に変換（読めなければNone）"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    if not parts:
+        return None
+    unit_seconds = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(number) * unit_seconds[unit] for number, unit in parts)
+
+
+def estimate_tokens(messages, max_tokens=0, model='gpt-4o-mini'):
+    """
+    リクエストのトークン数の見積もり（入力 + max_tokens）
+    OpenAIも受け付け時に max_tokens を上限の計算に含めるため、応答後に実際の使用量で精算する
+    """
+    text = ''.join(str(message.get('content') or '') for message in messages)
+    prompt_tokens = None
+    if tiktoken is not None:
+        try:
+            prompt_tokens = len(tiktoken.encoding_for_model(model).encode(text))
+        except KeyError:
+            pass
+    if prompt_tokens is None:
+        # 英数字は4文字で1トークン程度、日本語は1文字1トークン弱として多めに見積もる
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        prompt_tokens = ascii_chars / 4 + (len(text) - ascii_chars)
+    return int(math.ceil(prompt_tokens)) + 4 * len(messages) + (max_tokens or 0)
+
+
+class RateLimiter:
+    """共有SQLiteファイルのトークンバケット（リクエスト数・トークン数）"""
+
+    def __init__(self, path, rpm=None, tpm=None, headroom=HEADROOM):
+        self.path = path
+        self.headroom = headroom
+        rpm = rpm or float(os.getenv(RATE_LIMIT_RPM_ENV) or DEFAULT_RPM)
+        tpm = tpm or float(os.getenv(RATE_LIMIT_TPM_ENV) or DEFAULT_TPM)
+
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    name TEXT PRIMARY KEY, -- 'requests', 'tokens'
+                    limit_per_minute REAL NOT NULL,
+                    level REAL NOT NULL, -- 現在使える量
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_waiters (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_key TEXT NOT NULL,
+                    tokens REAL NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    heartbeat REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_users (
+                    user_key TEXT PRIMARY KEY,
+                    last_granted REAL,
+                    granted INTEGER DEFAULT 0
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_status (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    blocked_until REAL DEFAULT 0, -- 429の後、この時刻まで新しい実行枠を出さない
+                    consecutive_limited INTEGER DEFAULT 0,
+                    granted INTEGER DEFAULT 0,
+                    rate_limited INTEGER DEFAULT 0,
+                    wait_seconds REAL DEFAULT 0
+                )
+            ''')
+            now = time.time()
+            conn.executemany('''
+                INSERT OR IGNORE INTO rate_buckets (name, limit_per_minute, level, updated_at) VALUES (?, ?, ?, ?)
+            ''', [(name, limit, limit * headroom, now) for name, limit in zip(BUCKETS, (rpm, tpm))])
+            conn.execute('INSERT OR IGNORE INTO rate_status (id) VALUES (1)')
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _refill(self, conn, now):
+        """バケットを現在時刻まで補充し、{名前: (上限/分, 容量, 量)} を返す"""
+        buckets = {}
+        for name, limit, level, updated_at in conn.execute(
+                'SELECT name, limit_per_minute, level, updated_at FROM rate_buckets').fetchall():
+            capacity = limit * self.headroom
+            level = min(capacity, level + max(0.0, now - updated_at) * capacity / 60)
+            buckets[name] = (limit, capacity, level)
+        conn.executemany('UPDATE rate_buckets SET level = ?, updated_at = ? WHERE name = ?',
+                         [(level, now, name) for name, (_, _, level) in buckets.items()])
+        return buckets
+
+    def acquire(self, user_key=None, tokens=0, timeout=300):
+        """
+        実行枠（リクエスト1件 + tokens トークン）を確保するまで待ち、待った秒数を返す
+        待っている間は、最後に実行枠を受け取ったのが古い利用者から順に通す
+        """
+        user_key = user_key or DEFAULT_USER
+        enqueued_at = time.time()
+        conn = self._connect()
+        waiter_id = None
+        try:
+            waiter_id = conn.execute('''
+                INSERT INTO rate_waiters (user_key, tokens, enqueued_at, heartbeat) VALUES (?, ?, ?, ?)
+            ''', (user_key, tokens, enqueued_at, enqueued_at)).lastrowid
+
+            while True:
+                now = time.time()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute('DELETE FROM rate_waiters WHERE heartbeat < ?', (now - STALE_WAITER_SECONDS,))
+                    conn.execute('UPDATE rate_waiters SET heartbeat = ? WHERE id = ?', (now, waiter_id))
+                    head = conn.execute('''
+                        SELECT w.id FROM rate_waiters w LEFT JOIN rate_users u ON u.user_key = w.user_key
+                        ORDER BY IFNULL(u.last_granted, 0), w.id LIMIT 1
+                    ''').fetchone()
+                    wait = None
+                    if head and head[0] == waiter_id:
+                        wait = self._grant_or_wait(conn, now, waiter_id, user_key, tokens, now - enqueued_at)
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+
+                if wait == 0:
+                    waiter_id = None
+                    return now - enqueued_at
+                if now - enqueued_at > timeout:
+                    raise RateLimitTimeout(f"{timeout}秒待ってもAPIの実行枠を確保できませんでした")
+                # 先頭なら補充まで（最大1秒ごとに確認）、そうでなければ短い間隔で順番を確認する
+                time.sleep(min(wait, 1.0) if wait else random.uniform(0.02, 0.08))
+        finally:
+            if waiter_id is not None:
+                conn.execute('DELETE FROM rate_waiters WHERE id = ?', (waiter_id,))
+            conn.close()
+
+    def _grant_or_wait(self, conn, now, waiter_id, user_key, tokens, waited):
+        """先頭の待ちに実行枠を出せれば出して0、出せなければ待つ秒数を返す（トランザクション内で呼ぶ）"""
+        blocked_until = conn.execute('SELECT blocked_until FROM rate_status WHERE id = 1').fetchone()[0]
+        if blocked_until > now:
+            return blocked_until - now
+
+        buckets = self._refill(conn, now)
+        # 容量より大きいリクエストは、バケットが満杯になれば通す
+        needs = {'requests': 1.0, 'tokens': min(float(tokens), buckets['tokens'][1])}
+        wait = 0.0
+        for name, need in needs.items():
+            _, capacity, level = buckets[name]
+            if level < need:
+                wait = max(wait, (need - level) / (capacity / 60))
+        if wait > 0:
+            return wait
+
+        conn.executemany('UPDATE rate_buckets SET level = level - ? WHERE name = ?',
+                         [(need, name) for name, need in needs.items()])
+        conn.execute('DELETE FROM rate_waiters WHERE id = ?', (waiter_id,))
+        conn.execute('''
+            INSERT INTO rate_users (user_key, last_granted, granted) VALUES (?, ?, 1)
+            ON CONFLICT(user_key) DO UPDATE SET last_granted = excluded.last_granted, granted = granted + 1
+        ''', (user_key, now))
+        conn.execute('UPDATE rate_status SET granted = granted + 1, wait_seconds = wait_seconds + ? WHERE id = 1',
+                     (waited,))
+        return 0
+
+    def settle(self, reserved_tokens, used_tokens):
+        """確保したトークン数と実際の使用量の差をバケットに戻す（多く使った場合は差し引く）"""
+        difference = reserved_tokens - (used_tokens or 0)
+        if not difference:
+            return
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self._refill(conn, time.time())
+            conn.execute('''
+                UPDATE rate_buckets SET level = MIN(limit_per_minute * ?, level + ?) WHERE name = 'tokens'
+            ''', (self.headroom, difference))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def record_response(self, headers):
+        """成功した応答のヘッダーで上限・残りを合わせる"""
+        self._apply_headers(headers, limited=False)
+
+    def record_rate_limited(self, headers):
+        """429の応答: retry-after（なければリセットまで）だけ全体を止め、連続した場合は倍にする"""
+        self._apply_headers(headers, limited=True)
+
+    def _apply_headers(self, headers, limited):
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            buckets = self._refill(conn, now)
+            for name in BUCKETS:
+                try:
+                    limit = float(headers[f'x-ratelimit-limit-{name}'])
+                except (KeyError, TypeError, ValueError):
+                    limit = buckets[name][0]
+                level = min(buckets[name][2], limit * self.headroom)
+                try:
+                    # サーバー側の残りにも HEADROOM の割合で余裕を残す
+                    remaining = float(headers[f'x-ratelimit-remaining-{name}'])
+                    level = min(level, remaining * self.headroom)
+                except (KeyError, TypeError, ValueError):
+                    pass
+                conn.execute('UPDATE rate_buckets SET limit_per_minute = ?, level = ? WHERE name = ?',
+                             (limit, level, name))
+
+            if limited:
+                consecutive = conn.execute('SELECT consecutive_limited FROM rate_status WHERE id = 1').fetchone()[0]
+                delay = None
+                if headers.get('retry-after-ms'):
+                    delay = parse_duration(headers['retry-after-ms'])
+                    delay = delay / 1000 if delay is not None else None
+                if delay is None:
+                    delay = parse_duration(headers.get('retry-after'))
+                if delay is None:
+                    resets = [parse_duration(headers.get(f'x-ratelimit-reset-{name}')) for name in BUCKETS]
+                    delay = max([reset for reset in resets if reset is not None], default=1.0)
+                delay = min(MAX_BACKOFF_SECONDS, max(delay, 0.1) * (2 ** consecutive))
+                conn.execute('''
+                    UPDATE rate_status SET blocked_until = MAX(blocked_until, ?),
+                        consecutive_limited = consecutive_limited + 1, rate_limited = rate_limited + 1
+                    WHERE id = 1
+                ''', (now + delay,))
+            else:
+                conn.execute('UPDATE rate_status SET consecutive_limited = 0 WHERE id = 1')
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def stats(self):
+        """バケット・待ち・実行枠の状況"""
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            buckets = self._refill(conn, now)
+            conn.execute('COMMIT')
+            status = conn.execute('''
+                SELECT blocked_until, consecutive_limited, granted, rate_limited, wait_seconds FROM rate_status WHERE id = 1
+            ''').fetchone()
+            waiting = conn.execute('SELECT COUNT(*), COUNT(DISTINCT user_key) FROM rate_waiters').fetchone()
+            users = conn.execute('SELECT user_key, granted FROM rate_users ORDER BY granted DESC').fetchall()
+        finally:
+            conn.close()
+        return {
+            'buckets': {name: {'limit_per_minute': limit, 'capacity': capacity, 'available': level}
+                        for name, (limit, capacity, level) in buckets.items()},
+            'blocked_seconds': max(0.0, status[0] - now),
+            'consecutive_limited': status[1],
+            'granted': status[2],
+            'rate_limited': status[3],
+            'average_wait': status[4] / status[2] if status[2] else 0.0,
+            'waiting': waiting[0],
+            'waiting_users': waiting[1],
+            'users': users,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(path):
+    """共有ファイルごとのレート制御（プロセス内で共有）"""
+    path = os.path.abspath(path)
+    with _limiters_lock:
+        if path not in _limiters:
+            _limiters[path] = RateLimiter(path)
+        return _limiters[path]
+
+
+class _SimulatedAPI:
+    """シミュレーション用のAPI（上限を超えると429とヘッダーを返す、1分あたりの上限のトークンバケット）"""
+
+    def __init__(self, path, rpm, tpm):
+        self.path = path
+        self.limits = {'requests': rpm, 'tokens': tpm}
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS server (name TEXT PRIMARY KEY, level REAL, updated_at REAL)')
+        conn.executemany('INSERT OR IGNORE INTO server VALUES (?, ?, ?)',
+                         [(name, limit, time.time()) for name, limit in self.limits.items()])
+        conn.close()
+
+    def call(self, tokens):
+        """(成功したか, ヘッダー) を返す"""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            levels = {}
+            for name, level, updated_at in conn.execute('SELECT name, level, updated_at FROM server').fetchall():
+                limit = self.limits[name]
+                levels[name] = min(limit, level + (now - updated_at) * limit / 60)
+            ok = levels['requests'] >= 1 and levels['tokens'] >= tokens
+            if ok:
+                levels['requests'] -= 1
+                levels['tokens'] -= tokens
+            conn.executemany('UPDATE server SET level = ?, updated_at = ? WHERE name = ?',
+                             [(level, now, name) for name, level in levels.items()])
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        headers = {}
+        for name, limit in self.limits.items():
+            headers[f'x-ratelimit-limit-{name}'] = str(int(limit))
+            headers[f'x-ratelimit-remaining-{name}'] = str(int(max(0, levels[name])))
+            headers[f'x-ratelimit-reset-{name}'] = f'{max(0.0, limit - levels[name]) / (limit / 60):.3f}s'
+        if not ok:
+            needed = max((1 - levels['requests']) / (self.limits['requests'] / 60),
+                         (tokens - levels['tokens']) / (self.limits['tokens'] / 60))
+            headers['retry-after-ms'] = str(int(max(needed, 0.0) * 1000) + 1)
+        return ok, headers
+
+
+def _simulate_process(limiter_path, api_path, rpm, tpm, users, seconds, results):
+    """1プロセス分の利用者（スレッド）が、時間いっぱいリクエストを出し続ける"""
+    limiter = RateLimiter(limiter_path, rpm=rpm * 2, tpm=tpm * 2)  # 設定は多めにし、ヘッダーで合わせる
+    api = _SimulatedAPI(api_path, rpm, tpm)
+    counts = {}
+    lock = threading.Lock()
+    started = time.time()
+    deadline = started + seconds
+
+    def user_loop(user_key):
+        rng = random.Random(user_key)
+        while time.time() < deadline:
+            reserved = rng.randint(200, 800)
+            try:
+                limiter.acquire(user_key, reserved, timeout=max(0.1, deadline - time.time()))
+            except RateLimitTimeout:
+                break
+            ok, headers = api.call(reserved)
+            time.sleep(0.02)  # 応答までの時間
+            # 最初の満杯のバケットを使い切った後（後半3/4）の件数で公平性を見る
+            key = (user_key, 'ok' if ok else '429', time.time() > started + seconds / 4)
+            with lock:
+                counts[key] = counts.get(key, 0) + 1
+            if ok:
+                limiter.record_response(headers)
+                limiter.settle(reserved, reserved)
+            else:
+                limiter.record_rate_limited(headers)
+
+    threads = [threading.Thread(target=user_loop, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(counts)
+
+
+def simulate(rpm=600, tpm=150000, processes=4, users=3, seconds=20):
+    """
+    複数プロセス・複数利用者から同時にリクエストを出し、429の件数・上限に対するスループット・利用者ごとの件数を返す
+    利用者のうち user-0 は全プロセスから（他の利用者の数倍）リクエストを出す
+    per_user は後半3/4の成功件数（公平なら利用者ごとにほぼ同じになる）
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter_path = os.path.join(tmp, 'ratelimit.db')
+        api_path = os.path.join(tmp, 'api.db')
+        RateLimiter(limiter_path, rpm=rpm * 2, tpm=tpm * 2)
+        _SimulatedAPI(api_path, rpm, tpm)
+
+        results = multiprocessing.Queue()
+        workers = []
+        for index in range(processes):
+            process_users = ['user-0'] + [f'user-{n}' for n in range(1, users) if n % processes == index % processes]
+            workers.append(multiprocessing.Process(
+                target=_simulate_process,
+                args=(limiter_path, api_path, rpm, tpm, process_users, seconds, results)))
+        for worker in workers:
+            worker.start()
+        counts = {}
+        for _ in workers:
+            for key, count in results.get().items():
+                counts[key] = counts.get(key, 0) + count
+        for worker in workers:
+            worker.join()
+
+    ok = sum(count for (_, status, _), count in counts.items() if status == 'ok')
+    limited = sum(count for (_, status, _), count in counts.items() if status == '429')
+    per_user = {}
+    for (user, status, steady), count in counts.items():
+        if status == 'ok' and steady:
+            per_user[user] = per_user.get(user, 0) + count
+    # 許容量: 最初の満杯のバケット + 補充分（リクエスト数・トークン数のうち厳しい方、1件平均500トークン）
+    allowed = min(rpm, tpm / 500) * (1 + seconds / 60)
+    return {
+        'ok': ok,
+        'rate_limited': limited,
+        'per_user': dict(sorted(per_user.items())),
+        'requests_per_minute': ok / seconds * 60,
+        'utilization': ok / allowed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='OpenAI APIの共有レート制御')
+    parser.add_argument('--db-path', default='ad_script_database.db', help='データベースファイル（共有ファイルの場所の基準）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='現在のバケット・待ちの状況を表示する')
+    simulate_parser = subparsers.add_parser('simulate', help='上限のあるAPIを模擬して動作を確認する')
+    simulate_parser.add_argument('--rpm', type=int, default=600)
+    simulate_parser.add_argument('--tpm', type=int, default=150000)
+    simulate_parser.add_argument('--processes', type=int, default=4)
+    simulate_parser.add_argument('--users', type=int, default=3)
+    simulate_parser.add_argument('--seconds', type=float, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        stats = get_rate_limiter(rate_limit_path(args.db_path)).stats()
+        for name, bucket in stats['buckets'].items():
+            print(f"- {name}: {bucket['available']:.0f} / {bucket['capacity']:.0f}（上限 {bucket['limit_per_minute']:.0f}/分）")
+        print(f"- 実行枠: {stats['granted']}件（平均待ち {stats['average_wait']:.2f}秒）、429: {stats['rate_limited']}件")
+        print(f"- 待ち: {stats['waiting']}件（{stats['waiting_users']}人）")
+        if stats['blocked_seconds']:
+            print(f"⚠️ 429のため、あと{stats['blocked_seconds']:.1f}秒は新しいリクエストを止めています")
+        return 0
+
+    print(f"🔁 {args.processes}プロセス・{args.users}人で{args.seconds:.0f}秒間リクエストを出します"
+          f"（上限 {args.rpm}RPM / {args.tpm}TPM）")
+    report = simulate(args.rpm, args.tpm, args.processes, args.users, args.seconds)
+    print(f"📊 成功 {report['ok']}件（{report['requests_per_minute']:.0f}件/分、"
+          f"許容量に対して{report['utilization'] * 100:.0f}%）、429: {report['rate_limited']}件")
+    print(f"   利用者ごと（後半3/4）: {report['per_user']}")
+    if report['rate_limited']:
+        print("❌ 429が発生しました")
+        return 1
+    print("✅ 429なしで上限の近くまで使えました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,447 @@
+"""
+増え続けるテーブルの保持期間・集計・領域の回収
+
+api_usage_log・campaign_results・generated_scripts は追加されるだけで減らないため、
+ページの読み込みとファイルサイズが少しずつ悪化します。このジョブは system_settings の保持期間に従って
+
+- API使用ログ: 保持期間を過ぎた行を日別集計（api_usage_daily）にまとめて削除する
+- 配信結果: 保持期間を過ぎた行を日別集計（campaign_results_daily）に加えたうえで、アーカイブ用データベースに移す
+  （学習パターンには登録時に反映済み。learning_rebuild.py はアーカイブの配信結果も含めて再構築する）
+- 生成済み台本: 保持期間を過ぎ、配信結果のない台本をアーカイブ用データベースに移す（既定は無効）
+- 空きページ: auto_vacuum = INCREMENTAL のデータベースで incremental_vacuum を実行して領域を返す
+
+の順に処理し、回収した領域と主な読み込みの所要時間の変化を表示します。
+移動は少しずつ（--batch-size 件ごとのトランザクション）行うため、アプリの書き込みを長く止めません。
+
+使用例:
+    python retention.py --db-path ad_script_database.db
+    python retention.py --every 24
+    python retention.py --set retention_usage_days=60 --show
+    python retention.py --enable-auto-vacuum   # 既存のデータベースを切り替える（VACUUMを1回実行）
+"""
+import argparse
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from script_text import prune_bodies
+
+# 保持期間の設定（system_settings のキー: (既定値, 説明)）。日数は0で無効
+RETENTION_SETTINGS = {
+    'retention_usage_days': ('90', 'API使用ログを日別集計にまとめるまでの日数（0で無効）'),
+    'retention_results_days': ('730', '配信結果をアーカイブに移すまでの日数（0で無効）'),
+    'retention_generated_days': ('0', '配信結果のない生成済み台本をアーカイブに移すまでの日数（0で無効）'),
+    'retention_archive_path': ('', 'アーカイブ用データベースのパス（空欄なら「データベース名_archive.db」）'),
+    'retention_vacuum_pages': ('5000', '1回の実行で incremental_vacuum により返す空きページ数の上限（0で無制限）'),
+}
+
+# 整理の前後で所要時間を比べる読み込み（ページで使っている問い合わせ）
+REPORT_QUERIES = {
+    '当日のAPI使用量': '''
+        SELECT COUNT(*), SUM(tokens_used), SUM(cost_jpy) FROM api_usage_log WHERE date = DATE('now')
+    ''',
+    '生成済み台本一覧': '''
+        SELECT gs.id, gs.title, gs.hook, gs.main_content, gs.call_to_action, gs.platform, gs.created_at, pc.category_name
+        FROM generated_scripts gs JOIN product_categories pc ON gs.category_id = pc.id
+        ORDER BY gs.created_at DESC
+    ''',
+    '配信結果のプラットフォーム別件数': '''
+        SELECT platform, COUNT(*) AS count FROM campaign_results GROUP BY platform ORDER BY count DESC
+    ''',
+    '配信結果のカテゴリー別集計': '''
+        SELECT category_id, COUNT(*), AVG(performance_score), SUM(is_good_performance) FROM campaign_results
+        GROUP BY category_id
+    ''',
+}
+
+DEFAULT_BATCH_SIZE = 2000
+BUSY_TIMEOUT = 30
+
+
+def load_policy(cursor):
+    """保持期間の設定を読み込む（未設定・不正な値は既定値）"""
+    cursor.execute(f'''
+        SELECT setting_key, setting_value FROM system_settings
+        WHERE setting_key IN ({', '.join('?' * len(RETENTION_SETTINGS))})
+    ''', list(RETENTION_SETTINGS))
+    stored = dict(cursor.fetchall())
+    policy = {}
+    for key, (default, _) in RETENTION_SETTINGS.items():
+        value = stored.get(key)
+        if key == 'retention_archive_path':
+            policy[key] = (value or '').strip()
+            continue
+        try:
+            policy[key] = max(0, int(value))
+        except (TypeError, ValueError):
+            policy[key] = int(default)
+    return policy
+
+
+def archive_path_for(db_path, policy):
+    """アーカイブ用データベースのパス"""
+    if policy['retention_archive_path']:
+        return policy['retention_archive_path']
+    base, ext = os.path.splitext(db_path)
+    return f'{base}_archive{ext or ".db"}'
+
+
+def attach_archive(conn, db_path, create=False):
+    """
+    アーカイブ用データベースを archive として接続する
+    create=False でアーカイブがまだない場合は接続せず False を返す
+    """
+    path = archive_path_for(db_path, load_policy(conn.cursor()))
+    if not create and not os.path.exists(path):
+        return False
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    return True
+
+
+def _ensure_archive_table(cursor, table):
+    """アーカイブ側に同じ定義のテーブルを作成し、本体で増えたカラムを追加"""
+    cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    table_sql = cursor.fetchone()[0]
+    cursor.execute(re.sub(r'^CREATE TABLE\s+"?\w+"?', f'CREATE TABLE IF NOT EXISTS archive.{table}', table_sql))
+
+    cursor.execute(f'PRAGMA main.table_info({table})')
+    columns = [(row[1], row[2]) for row in cursor.fetchall()]
+    cursor.execute(f'PRAGMA archive.table_info({table})')
+    archived = {row[1] for row in cursor.fetchall()}
+    for column, column_type in columns:
+        if column not in archived:
+            cursor.execute(f'ALTER TABLE archive.{table} ADD COLUMN {column} {column_type}')
+    return [column for column, _ in columns]
+
+
+def _select_batch(cursor, query, params):
+    """移す行のIDを一時テーブル retention_batch に入れ、件数を返す"""
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS retention_batch (id INTEGER PRIMARY KEY)')
+    cursor.execute('DELETE FROM temp.retention_batch')
+    cursor.execute(f'INSERT INTO temp.retention_batch (id) {query}', params)
+    return cursor.rowcount
+
+
+def _in_batches(conn, batch_size, step):
+    """step(cursor, batch_size) が0を返すまで、1バッチずつ別のトランザクションで実行し、合計件数を返す"""
+    total = 0
+    while True:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            count = step(cursor, batch_size)
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        total += count
+        if count < batch_size:
+            return total
+
+
+def rollup_usage(conn, cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """cutoff（日付）より前のAPI使用ログを日別集計にまとめて削除し、まとめた行数を返す"""
+    def step(cursor, limit):
+        count = _select_batch(cursor, 'SELECT id FROM api_usage_log WHERE date < ? ORDER BY id LIMIT ?', (cutoff, limit))
+        cursor.execute('''
+            INSERT INTO api_usage_daily (date, request_type, request_count, tokens_used, cost_jpy)
+            SELECT date, IFNULL(request_type, ''), COUNT(*), IFNULL(SUM(tokens_used), 0), IFNULL(SUM(cost_jpy), 0)
+            FROM api_usage_log WHERE id IN (SELECT id FROM temp.retention_batch)
+            GROUP BY date, IFNULL(request_type, '')
+            ON CONFLICT(date, request_type) DO UPDATE SET
+                request_count = request_count + excluded.request_count,
+                tokens_used = tokens_used + excluded.tokens_used,
+                cost_jpy = cost_jpy + excluded.cost_jpy
+        ''')
+        cursor.execute('DELETE FROM api_usage_log WHERE id IN (SELECT id FROM temp.retention_batch)')
+        return count
+
+    return _in_batches(conn, batch_size, step)
+
+
+def archive_results(conn, cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """cutoff（日時）より前の配信結果を日別集計に加え、アーカイブに移して件数を返す"""
+    columns = _ensure_archive_table(conn.cursor(), 'campaign_results')
+    column_list = ', '.join(columns)
+
+    def step(cursor, limit):
+        count = _select_batch(cursor, '''
+            SELECT id FROM main.campaign_results WHERE created_at < ? ORDER BY id LIMIT ?
+        ''', (cutoff, limit))
+        # 集計のキーはNULLを0・空文字にそろえる（主キーではNULL同士が別の行になるため）
+        cursor.execute('''
+            INSERT INTO campaign_results_daily
+                (result_date, category_id, platform, script_type, result_count, good_count,
+                 spend_amount, impressions, clicks, conversions, score_sum)
+            SELECT DATE(created_at), IFNULL(category_id, 0), IFNULL(platform, ''), IFNULL(script_type, ''),
+                   COUNT(*), SUM(CASE WHEN is_good_performance THEN 1 ELSE 0 END),
+                   IFNULL(SUM(spend_amount), 0), IFNULL(SUM(impressions), 0), IFNULL(SUM(clicks), 0),
+                   IFNULL(SUM(conversions), 0), IFNULL(SUM(performance_score), 0)
+            FROM main.campaign_results WHERE id IN (SELECT id FROM temp.retention_batch)
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT(result_date, category_id, platform, script_type) DO UPDATE SET
+                result_count = result_count + excluded.result_count,
+                good_count = good_count + excluded.good_count,
+                spend_amount = spend_amount + excluded.spend_amount,
+                impressions = impressions + excluded.impressions,
+                clicks = clicks + excluded.clicks,
+                conversions = conversions + excluded.conversions,
+                score_sum = score_sum + excluded.score_sum
+        ''')
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO archive.campaign_results ({column_list})
+            SELECT {column_list} FROM main.campaign_results WHERE id IN (SELECT id FROM temp.retention_batch)
+        ''')
+        cursor.execute('DELETE FROM main.campaign_results WHERE id IN (SELECT id FROM temp.retention_batch)')
+        return count
+
+    return _in_batches(conn, batch_size, step)
+
+
+def archive_generated_scripts(conn, cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """cutoff（日時）より前で配信結果のない生成済み台本をアーカイブに移して件数を返す"""
+    columns = _ensure_archive_table(conn.cursor(), 'generated_scripts')
+    column_list = ', '.join(columns)
+    body_columns = ', '.join(_ensure_archive_table(conn.cursor(), 'script_bodies'))
+    _ensure_archive_table(conn.cursor(), 'campaign_results')
+
+    def step(cursor, limit):
+        # アーカイブ済みの配信結果がある台本も残す（学習パターンの再構築に台本パターンが必要なため）
+        count = _select_batch(cursor, '''
+            SELECT gs.id FROM main.generated_scripts gs
+            WHERE gs.created_at < ?
+              AND NOT EXISTS (SELECT 1 FROM main.campaign_results cr
+                              WHERE cr.script_type != 'effective' AND cr.script_id = gs.id)
+              AND NOT EXISTS (SELECT 1 FROM archive.campaign_results cr
+                              WHERE cr.script_type != 'effective' AND cr.script_id = gs.id)
+            ORDER BY gs.id LIMIT ?
+        ''', (cutoff, limit))
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO archive.generated_scripts ({column_list})
+            SELECT {column_list} FROM main.generated_scripts WHERE id IN (SELECT id FROM temp.retention_batch)
+        ''')
+        # 圧縮した本文（script_text.py）もアーカイブにコピーする
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO archive.script_bodies ({body_columns})
+            SELECT {body_columns} FROM main.script_bodies WHERE content_hash IN (
+                SELECT script_content_hash FROM main.generated_scripts WHERE id IN (SELECT id FROM temp.retention_batch)
+            )
+        ''')
+        # 台本から作った付随データも削除する（アーカイブから戻すときは保存し直す）
+        for table in ['script_patterns', 'compliance_index', 'compliance_violations']:
+            cursor.execute(f'''
+                DELETE FROM main.{table}
+                WHERE script_type = 'generated' AND script_id IN (SELECT id FROM temp.retention_batch)
+            ''')
+        cursor.execute('DELETE FROM main.generated_scripts WHERE id IN (SELECT id FROM temp.retention_batch)')
+        return count
+
+    moved = _in_batches(conn, batch_size, step)
+    if moved:
+        # どの台本からも参照されなくなった本文を本体から削除する
+        prune_bodies(conn.cursor())
+    return moved
+
+
+def space_stats(conn, db_path):
+    """ファイルサイズ・ページ数・空きページ数"""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    return {
+        'file_bytes': os.path.getsize(db_path),
+        'page_size': page_size,
+        'page_count': conn.execute('PRAGMA page_count').fetchone()[0],
+        'free_pages': conn.execute('PRAGMA freelist_count').fetchone()[0],
+        'auto_vacuum': conn.execute('PRAGMA auto_vacuum').fetchone()[0],
+    }
+
+
+def incremental_vacuum(conn, max_pages):
+    """空きページをファイルから返し、返したページ数を返す（auto_vacuum = INCREMENTAL のときのみ）"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return None
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    # 1ページごとに実行ステップが進むため、最後まで実行される executescript を使う
+    conn.executescript(f'PRAGMA incremental_vacuum({max_pages});' if max_pages else 'PRAGMA incremental_vacuum;')
+    return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def enable_auto_vacuum(db_path):
+    """
+    既存のデータベースを auto_vacuum = INCREMENTAL に切り替える
+    設定の変更にはVACUUM（データベース全体の書き直し）が必要なため、利用の少ない時間に1回だけ実行する
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            print("✅ すでに auto_vacuum = INCREMENTAL です")
+            return False
+        started = time.perf_counter()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    print(f"✅ auto_vacuum = INCREMENTAL に切り替えました（{time.perf_counter() - started:.1f}秒）")
+    return True
+
+
+def time_queries(conn, repeats=5):
+    """REPORT_QUERIES の所要時間（ミリ秒、中央値）"""
+    timings = {}
+    for name, query in REPORT_QUERIES.items():
+        samples = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            conn.execute(query).fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[name] = statistics.median(samples)
+    return timings
+
+
+def run_retention(db_path, batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """保持期間に従って集計・アーカイブ・領域の回収を行い、レポートを返す"""
+    now = now or datetime.now(timezone.utc)  # created_at（CURRENT_TIMESTAMP）と同じUTCで比べる
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    try:
+        policy = load_policy(conn.cursor())
+        report = {'policy': policy, 'space_before': space_stats(conn, db_path), 'timings_before': time_queries(conn)}
+        started = time.perf_counter()
+
+        def cutoff(key, date_only=False):
+            days = policy[key]
+            if not days:
+                return None
+            moment = now - timedelta(days=days)
+            return moment.strftime('%Y-%m-%d') if date_only else moment.strftime('%Y-%m-%d %H:%M:%S')
+
+        usage_cutoff = cutoff('retention_usage_days', date_only=True)
+        report['usage_rolled_up'] = rollup_usage(conn, usage_cutoff, batch_size) if usage_cutoff else 0
+
+        results_cutoff = cutoff('retention_results_days')
+        generated_cutoff = cutoff('retention_generated_days')
+        report['results_archived'] = report['generated_archived'] = 0
+        if results_cutoff or generated_cutoff:
+            archive_path = archive_path_for(db_path, policy)
+            report['archive_path'] = archive_path
+            attach_archive(conn, db_path, create=True)
+            try:
+                if results_cutoff:
+                    report['results_archived'] = archive_results(conn, results_cutoff, batch_size)
+                if generated_cutoff:
+                    report['generated_archived'] = archive_generated_scripts(conn, generated_cutoff, batch_size)
+            finally:
+                conn.execute('DETACH DATABASE archive')
+
+        report['vacuumed_pages'] = incremental_vacuum(conn, policy['retention_vacuum_pages'])
+        conn.execute('PRAGMA optimize')
+        report['seconds'] = time.perf_counter() - started
+        report['space_after'] = space_stats(conn, db_path)
+        report['timings_after'] = time_queries(conn)
+    finally:
+        conn.close()
+    return report
+
+
+def _megabytes(size):
+    return f'{size / 1024 / 1024:.2f}MB'
+
+
+def print_report(report):
+    """回収した領域と読み込み時間の変化を表示"""
+    before, after = report['space_before'], report['space_after']
+    print(f"✅ 保持期間の整理が完了しました（{report['seconds']:.1f}秒）")
+    print(f"- API使用ログ: 日別集計にまとめた行 {report['usage_rolled_up']}件")
+    print(f"- 配信結果: アーカイブに移した行 {report['results_archived']}件")
+    print(f"- 生成済み台本: アーカイブに移した台本 {report['generated_archived']}件")
+    if report.get('archive_path'):
+        print(f"- アーカイブ: {report['archive_path']}")
+
+    print("\n📦 領域")
+    print(f"- ファイルサイズ: {_megabytes(before['file_bytes'])} → {_megabytes(after['file_bytes'])}"
+          f"（回収 {_megabytes(before['file_bytes'] - after['file_bytes'])}）")
+    print(f"- 空きページ: {before['free_pages']} → {after['free_pages']}"
+          f"（{_megabytes(after['free_pages'] * after['page_size'])} が未回収）")
+    if report['vacuumed_pages'] is None:
+        print("⚠️ auto_vacuum が INCREMENTAL ではないため、空きページはファイルに残っています"
+              "（python retention.py --enable-auto-vacuum で切り替えられます）")
+    else:
+        print(f"- incremental_vacuum で返したページ: {report['vacuumed_pages']}")
+
+    print("\n⏱️ 読み込みの所要時間（中央値）")
+    for name, before_ms in report['timings_before'].items():
+        after_ms = report['timings_after'][name]
+        change = (after_ms - before_ms) / before_ms * 100 if before_ms else 0.0
+        print(f"- {name}: {before_ms:.2f}ms → {after_ms:.2f}ms（{change:+.0f}%）")
+
+
+def set_policy(db_path, assignments):
+    """KEY=VALUE の一覧で保持期間の設定を変更"""
+    rows = []
+    for assignment in assignments:
+        key, _, value = assignment.partition('=')
+        key = key.strip()
+        if key not in RETENTION_SETTINGS:
+            raise ValueError(f"不明な設定です: {key}（{', '.join(RETENTION_SETTINGS)}）")
+        rows.append((key, value.strip(), RETENTION_SETTINGS[key][1]))
+
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    try:
+        conn.executemany('''
+            INSERT INTO system_settings (setting_key, setting_value, description) VALUES (?, ?, ?)
+            ON CONFLICT(setting_key) DO UPDATE SET setting_value = excluded.setting_value, updated_at = CURRENT_TIMESTAMP
+        ''', rows)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ 保持期間の設定を更新しました: {len(rows)}件")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='増え続けるテーブルの集計・アーカイブと領域の回収')
+    parser.add_argument('--db-path', default='ad_script_database.db', help='データベースファイル')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='1トランザクションで移す行数')
+    parser.add_argument('--every', type=float, help='指定した時間ごとに整理を繰り返す')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help='保持期間の設定を変更する')
+    parser.add_argument('--show', action='store_true', help='現在の保持期間の設定を表示して終了する')
+    parser.add_argument('--enable-auto-vacuum', action='store_true',
+                        help='auto_vacuum = INCREMENTAL に切り替える（VACUUMを実行）')
+    args = parser.parse_args(argv)
+
+    from database import DatabaseManager
+
+    # テーブル・設定の既定値を作成しておく
+    DatabaseManager(args.db_path, use_write_queue=False)
+    try:
+        if args.set:
+            set_policy(args.db_path, args.set)
+        if args.show:
+            conn = sqlite3.connect(args.db_path)
+            try:
+                policy = load_policy(conn.cursor())
+            finally:
+                conn.close()
+            for key, value in policy.items():
+                print(f"- {key} = {value}（{RETENTION_SETTINGS[key][1]}）")
+            print(f"- アーカイブ: {archive_path_for(args.db_path, policy)}")
+            return 0
+        if args.set:
+            return 0
+        if args.enable_auto_vacuum:
+            enable_auto_vacuum(args.db_path)
+
+        while True:
+            started = time.monotonic()
+            print_report(run_retention(args.db_path, args.batch_size))
+            if not args.every:
+                return 0
+            time.sleep(max(0.0, args.every * 3600 - (time.monotonic() - started)))
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"❌ 保持期間の整理に失敗しました: {str(e)}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+配信結果の一括スコアリング
+
+DatabaseManager._evaluate_performance / _calculate_performance_score と
+同じ判定・スコアを、pandas / NumPy でまとめて計算します。
+"""
+import numpy as np
+import pandas as pd
+
+# (結果カラム, 目標値カラム, targetsタプルの位置, 低い方が良いか)
+METRICS = [
+    ('ctr', 'target_ctr', 2, False),
+    ('cpc', 'target_cpc', 3, True),
+    ('mcvr', 'target_mcvr', 4, False),
+    ('mcpa', 'target_mcpa', 5, True),
+    ('cvr', 'target_cvr', 6, False),
+    ('cpa', 'target_cpa', 7, True),
+]
+
+TARGET_COLUMNS = [target_column for _, target_column, _, _ in METRICS]
+
+
+def _safe_float(value):
+    """float()に変換できない値はNoneにする（スカラー版と同じ変換規則）"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _to_numeric(series):
+    """
+    結果カラムを数値配列に変換
+    戻り値: (値, 有効フラグ) 有効フラグはスカラー版で比較・計算が行われる値かどうか
+    """
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        values = series.to_numpy(dtype='float64')
+        # 空白（NULL）と0は対象外
+        valid = ~np.isnan(values) & (values != 0)
+        return values, valid
+
+    # 文字列などが混在する場合は要素ごとに変換（'0' は 0 と違い対象になる）
+    raw = series.to_numpy(dtype=object)
+    missing = np.array([value is None or value == '' or value == 0 for value in raw], dtype=bool)
+    converted = [_safe_float(value) for value in raw]
+    convertible = np.array([value is not None for value in converted], dtype=bool)
+    values = np.array([value if value is not None else np.nan for value in converted], dtype='float64')
+    return values, ~missing & convertible
+
+
+def _targets_matrix(results, targets):
+    """行ごとの目標値（6列）を作成"""
+    n = len(results)
+    if isinstance(targets, pd.DataFrame):
+        aligned = targets.reindex(results['category_id'].to_numpy())
+        matrix = aligned[TARGET_COLUMNS].to_numpy(dtype='float64')
+    else:
+        row = [targets[position] for _, _, position, _ in METRICS]
+        matrix = np.tile(np.array(row, dtype='float64'), (n, 1))
+    # 目標値がない（NULL）場合は未設定として扱う
+    return np.nan_to_num(matrix, nan=0.0)
+
+
+def score_results(results, targets):
+    """
+    配信結果をまとめて評価
+    results: ctr, cpc, mcvr, mcpa, cvr, cpa カラムを持つDataFrame
+    targets: product_categories の1行（タプル）、または category_id をインデックスとし
+             target_* カラムを持つDataFrame（この場合 results に category_id が必要）
+    戻り値: is_good_performance, performance_score カラムを持つDataFrame（results と同じインデックス）
+    """
+    n = len(results)
+    target_matrix = _targets_matrix(results, targets)
+
+    good_count = np.zeros(n, dtype='int64')
+    score_sum = np.zeros(n, dtype='float64')
+    score_count = np.zeros(n, dtype='int64')
+
+    for i, (column, _, _, is_lower_better) in enumerate(METRICS):
+        values, valid = _to_numeric(results[column])
+        target = target_matrix[:, i]
+        has_target = target > 0
+
+        # 良し悪し判定
+        with np.errstate(invalid='ignore'):
+            if is_lower_better:
+                met = values <= target
+            else:
+                met = values >= target
+        good_count += (valid & has_target & met).astype('int64')
+
+        # スコア（最大2倍まで）
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if is_lower_better:
+                positive = valid & (values > 0)
+                ratio = np.where(positive, target / np.where(positive, values, 1.0), 0.0)
+            else:
+                ratio = np.where(valid, values / np.where(has_target, target, 1.0), 0.0)
+        score = np.where(valid, np.minimum(ratio, 2.0), 0.0)
+
+        # スカラー版と同じ順序で加算して丸め誤差も一致させる
+        score_sum = np.where(has_target, score_sum + score, score_sum)
+        score_count += has_target.astype('int64')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        performance_score = np.where(score_count > 0, score_sum / np.maximum(score_count, 1), 0.0)
+
+    return pd.DataFrame({
+        'is_good_performance': good_count / len(METRICS) >= 0.5,  # 50%以上で良い判定
+        'performance_score': performance_score
+    }, index=results.index)
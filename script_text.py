@@ -0,0 +1,240 @@
+"""
+台本本文（script_content）の保存形式
+
+script_content の多くはフック・メイン・CTAを決まった書式で並べただけのため、同じ文章を2回保存しています。
+保存時に次の形式を選び、script_content_codec に記録します（読み込み時に元の本文へ戻す）。
+
+- template:<書式名>: フック・メイン・CTAから作り直せる本文。本文は保存しない
+- zlib: 作り直せない本文をzlibで圧縮し、内容のハッシュ（script_content_hash）をキーに script_bodies に保存する
+  （同じ本文は1回だけ保存される）
+- NULL: 短い本文・圧縮しても小さくならない本文は、これまでどおり script_content にそのまま保存する
+
+既存のデータベースは `python script_text.py` で書き換え（最後にVACUUMを1回実行）、サイズと読み込み速度の変化を表示します。
+zstd は追加の依存関係になり、別の環境でデータベースを読めなくなるおそれがあるため使いません。
+
+使用例:
+    python script_text.py --db-path ad_script_database.db
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import statistics
+import sys
+import time
+import zlib
+
+# フック・メイン・CTAから作り直せる本文の書式（書式名: テンプレート）
+TEMPLATES = {
+    'sections': '【フック】\n{hook}\n\n【メイン】\n{main_content}\n\n【CTA】\n{call_to_action}',  # 効果的台本
+    'labeled': '🎣 フック: {hook}\n\n💬 メインコンテンツ: {main_content}\n\n📢 CTA: {call_to_action}',  # 生成結果の補完
+    'joined': '{hook}\n{main_content}\n{call_to_action}',
+}
+
+COMPRESS_MIN_BYTES = 256  # これより短い本文は圧縮しない
+COMPRESS_LEVEL = 9
+SCRIPT_TABLES = ['effective_scripts', 'generated_scripts']
+
+
+def render_template(name, hook, main_content, call_to_action):
+    """書式 name で本文を作成"""
+    return TEMPLATES[name].format(hook=hook or '', main_content=main_content or '', call_to_action=call_to_action or '')
+
+
+def encode_script_content(content, hook, main_content, call_to_action):
+    """
+    保存する形式を選ぶ
+    戻り値: (script_content に保存する値, 形式, ハッシュ, script_bodies に保存する圧縮済み本文)
+    """
+    if not content:
+        return content, None, None, None
+    for name in TEMPLATES:
+        if content == render_template(name, hook, main_content, call_to_action):
+            return None, f'template:{name}', None, None
+
+    raw = content.encode('utf-8')
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        body = zlib.compress(raw, COMPRESS_LEVEL)
+        if len(body) < len(raw):
+            return None, 'zlib', hashlib.sha1(raw).hexdigest(), body
+    return content, None, None, None
+
+
+def decode_script_content(stored, codec, body, hook, main_content, call_to_action):
+    """保存した形式から本文を戻す（body は script_bodies の圧縮済み本文）"""
+    if codec is None:
+        return stored
+    if codec.startswith('template:'):
+        return render_template(codec[len('template:'):], hook, main_content, call_to_action)
+    if codec == 'zlib':
+        if body is None:
+            raise ValueError("台本本文が script_bodies に見つかりません")
+        return zlib.decompress(body).decode('utf-8')
+    raise ValueError(f"不明な本文の形式です: {codec}")
+
+
+def save_bodies(cursor, rows):
+    """圧縮済み本文 (ハッシュ, 圧縮済み本文, 元のバイト数) を保存（同じハッシュは1回だけ）"""
+    cursor.executemany('''
+        INSERT OR IGNORE INTO script_bodies (content_hash, codec, body, raw_bytes) VALUES (?, 'zlib', ?, ?)
+    ''', rows)
+
+
+def prune_bodies(cursor):
+    """どの台本からも参照されていない本文を削除し、件数を返す"""
+    cursor.execute(f'''
+        DELETE FROM script_bodies WHERE content_hash NOT IN (
+            {' UNION '.join(f'SELECT script_content_hash FROM {table} WHERE script_content_hash IS NOT NULL'
+                            for table in SCRIPT_TABLES)}
+        )
+    ''')
+    return cursor.rowcount
+
+
+def _rewrite_table(conn, table, batch_size):
+    """table の未変換の本文を書き換え、形式ごとの件数を返す"""
+    counts = {}
+    last_id = 0
+    while True:
+        rows = conn.execute(f'''
+            SELECT id, script_content, hook, main_content, call_to_action FROM {table}
+            WHERE script_content_codec IS NULL AND id > ? ORDER BY id LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            return counts
+        last_id = rows[-1][0]
+
+        updates, bodies = [], []
+        for script_id, content, hook, main_content, call_to_action in rows:
+            stored, codec, digest, body = encode_script_content(content, hook, main_content, call_to_action)
+            counts[codec or 'plain'] = counts.get(codec or 'plain', 0) + 1
+            if codec is None:
+                continue
+            updates.append((stored, codec, digest, script_id))
+            if body is not None:
+                bodies.append((digest, body, len(content.encode('utf-8'))))
+
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            save_bodies(cursor, bodies)
+            cursor.executemany(f'''
+                UPDATE {table} SET script_content = ?, script_content_codec = ?, script_content_hash = ? WHERE id = ?
+            ''', updates)
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+
+
+def storage_bytes(conn):
+    """本文の保存に使っているバイト数（script_content + script_bodies）"""
+    total = sum(conn.execute(f'SELECT IFNULL(SUM(LENGTH(CAST(script_content AS BLOB))), 0) FROM {table}').fetchone()[0]
+                for table in SCRIPT_TABLES)
+    return total + conn.execute('SELECT IFNULL(SUM(LENGTH(body)), 0) FROM script_bodies').fetchone()[0]
+
+
+def scan_timings(conn, repeats=5):
+    """全件読み込みの所要時間（ミリ秒、中央値）: 集計のみ / 本文まで戻す読み込み"""
+    def measure(run):
+        samples = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def read_contents():
+        for table in SCRIPT_TABLES:
+            for row in conn.execute(f'''
+                SELECT t.script_content, t.script_content_codec, sb.body, t.hook, t.main_content, t.call_to_action
+                FROM {table} t LEFT JOIN script_bodies sb ON sb.content_hash = t.script_content_hash
+            '''):
+                decode_script_content(*row)
+
+    return {
+        'プラットフォーム別件数（全件走査）': measure(lambda: [
+            conn.execute(f'SELECT platform, COUNT(*) FROM {table} GROUP BY platform').fetchall()
+            for table in SCRIPT_TABLES
+        ]),
+        '本文を含む全件読み込み': measure(read_contents),
+    }
+
+
+def migrate(db_path, batch_size=1000, vacuum=True):
+    """
+    既存の台本本文を新しい形式に書き換え、レポートを返す
+    行が短くなっても半端に空いたページはファイルに残るため、vacuum=True なら最後にVACUUMでまとめて詰める
+    """
+    from retention import incremental_vacuum, space_stats
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        report = {
+            'bytes_before': storage_bytes(conn),
+            'space_before': space_stats(conn, db_path),
+            'timings_before': scan_timings(conn),
+        }
+        started = time.perf_counter()
+        report['counts'] = {table: _rewrite_table(conn, table, batch_size) for table in SCRIPT_TABLES}
+        report['pruned_bodies'] = prune_bodies(conn.cursor())
+        report['vacuumed'] = vacuum
+        if vacuum:
+            conn.execute('VACUUM')
+        else:
+            report['vacuumed_pages'] = incremental_vacuum(conn, 0)
+        report['seconds'] = time.perf_counter() - started
+        report['bytes_after'] = storage_bytes(conn)
+        report['space_after'] = space_stats(conn, db_path)
+        report['timings_after'] = scan_timings(conn)
+    finally:
+        conn.close()
+    return report
+
+
+def print_report(report):
+    before, after = report['bytes_before'], report['bytes_after']
+    print(f"✅ 台本本文の保存形式を書き換えました（{report['seconds']:.1f}秒）")
+    for table, counts in report['counts'].items():
+        summary = '、'.join(f'{codec} {count}件' for codec, count in sorted(counts.items())) or '変更なし'
+        print(f"- {table}: {summary}")
+    if report['pruned_bodies']:
+        print(f"- 参照されていない本文を削除: {report['pruned_bodies']}件")
+
+    print("\n📦 サイズ")
+    print(f"- 本文のバイト数: {before / 1024:.1f}KB → {after / 1024:.1f}KB"
+          f"（{(before - after) / before * 100 if before else 0:.0f}%削減）")
+    print(f"- ファイルサイズ: {report['space_before']['file_bytes'] / 1024 / 1024:.2f}MB"
+          f" → {report['space_after']['file_bytes'] / 1024 / 1024:.2f}MB")
+    if not report['vacuumed']:
+        print("⚠️ VACUUMを実行していないため、空いた領域の一部はファイルに残っています")
+
+    print("\n⏱️ 読み込みの所要時間（中央値）")
+    for name, before_ms in report['timings_before'].items():
+        after_ms = report['timings_after'][name]
+        change = (after_ms - before_ms) / before_ms * 100 if before_ms else 0.0
+        print(f"- {name}: {before_ms:.2f}ms → {after_ms:.2f}ms（{change:+.0f}%）")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='台本本文を重複なし・圧縮の形式に書き換えます')
+    parser.add_argument('--db-path', default='ad_script_database.db', help='データベースファイル')
+    parser.add_argument('--batch-size', type=int, default=1000, help='1トランザクションで書き換える件数')
+    parser.add_argument('--no-vacuum', action='store_true',
+                        help='最後のVACUUM（データベース全体の書き直し）を行わない')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ データベースが見つかりません: {args.db_path}")
+        return 1
+
+    from database import DatabaseManager
+
+    # 保存形式のカラム・テーブルを追加しておく
+    DatabaseManager(args.db_path, use_write_queue=False)
+    print_report(migrate(args.db_path, args.batch_size, vacuum=not args.no_vacuum))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+プロセス間で共有する読み込みキャッシュ
+
+st.cache_data / st.cache_resource はプロセスごとのため、複数台のアプリ（レプリカ）では
+それぞれが同じデータを読み込み直します。このキャッシュはプロセス内のLRU（1段目）と
+共有ストア（2段目）の2段構成で、別のプロセスが読み込んだ結果も使えるようにします。
+
+共有ストアは環境変数 SHARED_CACHE_URL で指定します（未設定ならプロセス内のLRUのみ）。
+- sqlite:///パス または ファイルパス: 共有ボリューム上のSQLiteファイル
+- redis://...: Redis互換のストア（redis パッケージが必要）
+- memory://: プロセス内の辞書（テスト・確認用の代替）
+
+値はデータのバージョン（data_versions）と一緒に保存し、読み込み時のバージョンと
+一致しない場合はミスとして読み込み直します（明示的な削除は不要）。
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+SHARED_CACHE_URL_ENV = 'SHARED_CACHE_URL'
+
+
+class LocalLRU:
+    """プロセス内のLRU（件数上限つき）"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # キー -> (バージョン, 値, 有効期限)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] is not None and entry[2] < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, version, value, expires_at=None):
+        with self.lock:
+            self.entries[key] = (version, value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class MemoryTier:
+    """共有ストアの代替（プロセス内の辞書、テスト・確認用）"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self.entries[key]
+                return None
+            return payload
+
+    def set(self, key, payload, ttl=None):
+        with self.lock:
+            self.entries[key] = (payload, time.time() + ttl if ttl else None)
+
+
+class SQLiteTier:
+    """共有ボリューム上のSQLiteファイル"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                cache_key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                expires_at REAL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+        self.writes = 0
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT payload, expires_at FROM cache_entries WHERE cache_key = ?', (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, key, payload, ttl=None):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO cache_entries (cache_key, payload, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET payload = excluded.payload, expires_at = excluded.expires_at
+            ''', (key, sqlite3.Binary(payload), time.time() + ttl if ttl else None))
+            self.writes += 1
+            if self.writes % 500 == 0:
+                # 期限切れの値をときどき削除する
+                conn.execute('DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at < ?', (time.time(),))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class RedisTier:
+    """Redis互換のストア"""
+
+    name = 'redis'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("Redis を共有キャッシュに使用するには redis をインストールしてください（pip install redis）")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, payload, ttl=None):
+        self.client.set(key, payload, ex=int(ttl) if ttl else None)
+
+
+def create_cache_tier(url):
+    """接続先から共有ストアを作成（url が空ならNone）"""
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemoryTier()
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisTier(url)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SQLiteTier(url)
+
+
+class SharedCache:
+    """プロセス内のLRU + 共有ストアの2段キャッシュ（バージョンで無効化）"""
+
+    def __init__(self, shared=None, local_entries=512, namespace='ad_script'):
+        self.local = LocalLRU(local_entries)
+        self.shared = shared
+        self.namespace = namespace
+        self.metrics = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'stale': 0, 'errors': 0}
+
+    def make_key(self, name, args=()):
+        """キャッシュのキー（引数は repr のハッシュ）"""
+        digest = hashlib.sha1(repr(args).encode('utf-8')).hexdigest()
+        return f'{self.namespace}:{name}:{digest}'
+
+    def get(self, key, version):
+        """(見つかったか, 値) を返す。保存時とバージョンが違えばミス"""
+        entry = self.local.get(key)
+        if entry is not None:
+            if entry[0] == version:
+                self.metrics['local_hits'] += 1
+                return True, entry[1]
+            self.metrics['stale'] += 1
+
+        if self.shared is not None:
+            try:
+                payload = self.shared.get(key)
+            except Exception as e:
+                self._shared_error('読み込み', e)
+                payload = None
+            if payload is not None:
+                stored_version, value, expires_at = pickle.loads(payload)
+                if stored_version == version:
+                    self.local.set(key, version, value, expires_at)
+                    self.metrics['shared_hits'] += 1
+                    return True, value
+                self.metrics['stale'] += 1
+
+        self.metrics['misses'] += 1
+        return False, None
+
+    def set(self, key, version, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self.local.set(key, version, value, expires_at)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, pickle.dumps((version, value, expires_at), pickle.HIGHEST_PROTOCOL), ttl)
+            except Exception as e:
+                self._shared_error('書き込み', e)
+
+    def get_or_compute(self, name, args, version, compute, ttl=None):
+        """キャッシュにあれば返し、なければ compute() の結果を保存して返す"""
+        key = self.make_key(name, args)
+        found, value = self.get(key, version)
+        if found:
+            return value
+        value = compute()
+        self.set(key, version, value, ttl)
+        return value
+
+    def _shared_error(self, action, error):
+        # 共有ストアに接続できない間もプロセス内のLRUで動作を続ける
+        self.metrics['errors'] += 1
+        if self.metrics['errors'] == 1:
+            print(f"⚠️ 共有キャッシュの{action}に失敗しました（プロセス内キャッシュのみで続行します）: {str(error)}")
+
+    def stats(self):
+        hits = self.metrics['local_hits'] + self.metrics['shared_hits']
+        total = hits + self.metrics['misses']
+        return {
+            **self.metrics,
+            'hit_rate': hits / total * 100 if total else 0.0,
+            'local_entries': len(self.local.entries),
+            'shared': self.shared.name if self.shared is not None else None,
+        }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """プロセス内で共有するキャッシュ（共有ストアは環境変数 SHARED_CACHE_URL）"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            try:
+                shared = create_cache_tier(os.getenv(SHARED_CACHE_URL_ENV))
+            except Exception as e:
+                print(f"⚠️ 共有キャッシュを初期化できませんでした（プロセス内キャッシュのみ使用します）: {str(e)}")
+                shared = None
+            _shared_cache = SharedCache(shared)
+        return _shared_cache
+
+
+if __name__ == "__main__":
+    # 簡易チェック: 2つのプロセスを想定し、共有ストア経由のヒットとバージョンによる無効化を確認
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for tier in (MemoryTier(), SQLiteTier(os.path.join(tmp, 'shared_cache.db'))):
+            first, second = SharedCache(tier), SharedCache(tier)
+            calls = []
+
+            def load(label):
+                calls.append(label)
+                return [('商材', label)]
+
+            assert first.get_or_compute('categories', (), (1,), lambda: load('v1')) == [('商材', 'v1')]
+            assert second.get_or_compute('categories', (), (1,), lambda: load('v1')) == [('商材', 'v1')]
+            assert second.get_or_compute('categories', (), (1,), lambda: load('v1')) == [('商材', 'v1')]
+            assert second.get_or_compute('categories', (), (2,), lambda: load('v2')) == [('商材', 'v2')]
+            assert first.get_or_compute('categories', (), (2,), lambda: load('v2')) == [('商材', 'v2')]
+            assert calls == ['v1', 'v2'], calls
+            assert second.stats()['shared_hits'] == 1 and second.stats()['local_hits'] == 1
+            print(f"✅ 共有キャッシュ（{tier.name}）のチェックが完了しました: {second.stats()}")
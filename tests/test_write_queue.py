@@ -0,0 +1,78 @@
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from database import DatabaseManager
+from write_queue import get_write_queue
+
+fork = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='fork が使えない環境')
+
+
+def _create_table(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, source TEXT)')
+    conn.commit()
+    conn.close()
+
+
+def _count(db_path, source):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM events WHERE source = ?', (source,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _write_in_child(db_path, results):
+    try:
+        get_write_queue(db_path).execute("INSERT INTO events (source) VALUES ('child')").result(timeout=5)
+        # 完了を待たない書き込みも、子プロセスの終了時に反映される
+        get_write_queue(db_path).execute("INSERT INTO events (source) VALUES ('child-async')")
+        results.put('ok')
+    except Exception as e:
+        results.put(repr(e))
+
+
+@fork
+def test_forked_worker_writes_through_queue(tmp_path):
+    db_path = str(tmp_path / 'queue.db')
+    _create_table(db_path)
+    # fork 前に親でライタースレッドを起動しておく
+    get_write_queue(db_path).execute("INSERT INTO events (source) VALUES ('parent')").result(timeout=5)
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=_write_in_child, args=(db_path, results))
+    process.start()
+    process.join(30)
+
+    assert results.get(timeout=5) == 'ok'
+    assert process.exitcode == 0
+    assert _count(db_path, 'child') == 1
+    assert _count(db_path, 'child-async') == 1
+    # 親のキューも引き続き使える
+    get_write_queue(db_path).execute("INSERT INTO events (source) VALUES ('parent')").result(timeout=5)
+    assert _count(db_path, 'parent') == 2
+
+
+def _log_in_pool_worker(db_path):
+    db = DatabaseManager(db_path)
+    return db._write(lambda cursor: cursor.execute(
+        "INSERT INTO api_usage_log (date, request_type, tokens_used, cost_jpy) VALUES ('2026-01-01', 'test', 1, 0)"
+    ).lastrowid)
+
+
+@fork
+def test_database_manager_created_before_fork(tmp_path):
+    from concurrent.futures import ProcessPoolExecutor
+
+    db_path = str(tmp_path / 'app.db')
+    DatabaseManager(db_path)  # batch_generate と同じく、fork 前に親で書き込みキューを作る
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('fork')) as executor:
+        row_ids = list(executor.map(_log_in_pool_worker, [db_path] * 4, timeout=30))
+
+    assert len(set(row_ids)) == 4
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM api_usage_log WHERE request_type = 'test'").fetchone()[0] == 4
+    conn.close()
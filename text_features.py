@@ -0,0 +1,221 @@
+"""
+台本テキストの特徴抽出エンジン
+
+数値・権威性・緊急性・構造・CTAの特徴を1回の走査でまとめて抽出します。
+キーワード辞書はデータベースの feature_dictionary テーブルに保存され、
+全キーワードをトライ木にしたコンパイル済み正規表現（キーワードオートマトン）で照合します。
+"""
+import re
+import sqlite3
+from collections import Counter
+
+# 数値パターン（学習用は期間・時間の単位まで含める）
+NUMBER_PATTERN = re.compile(r'\d+[,\d]*[円％%万億千百十日時間秒分]')
+MONEY_UNITS = set('円％%万億千百十')
+LEADING_DIGIT_PATTERN = re.compile(r'\d')
+WORD_PATTERN = re.compile(r'[一-龯ぁ-ゔァ-ヴー]+')
+# ひらがなだけのフレーズ（「します」「ています」など）は頻出フレーズから除く
+HIRAGANA_ONLY_PATTERN = re.compile(r'^[ぁ-ゔー]+$')
+
+# 初期辞書: (feature_group, keyword, label, scope, weight)
+# scope は照合範囲（'all': 台本全体 / 'hook': フックのみ / 'cta': CTAのみ）
+# weight はラベルごとの加点（品質スコアの計算に使用）
+DEFAULT_FEATURE_DICTIONARY = (
+    # 学習パターン用キーワード（DatabaseManager._extract_patterns）
+    [('learning_keyword', keyword, keyword, 'all', 1) for keyword in [
+        '限定', '今なら', '今だけ', '無料', '特別', '初回', '送料無料', '返金保証',
+        'プロデュース', '認定', '承認', '研究', '効果', '実証', '業界', '最安値']]
+    + [('hook_structure', '？', 'question_hook', 'hook', 1),
+       ('hook_structure', '?', 'question_hook', 'hook', 1),
+       ('hook_structure', '！', 'exclamation_hook', 'hook', 1),
+       ('hook_structure', '!', 'exclamation_hook', 'hook', 1)]
+    + [('learning_cta', '今すぐ', 'immediate_action', 'cta', 1),
+       ('learning_cta', 'チェック', 'check_action', 'cta', 1),
+       ('learning_cta', '試し', 'trial_action', 'cta', 1)]
+    # 効果的台本の分析用（OpenAIIntegration.analyze_effective_scripts）
+    + [('authority', keyword, keyword, 'all', 1) for keyword in [
+        'プロデュース', 'ハーバード', '大学', '研究', '博士', '医師', '専門家', '認定', '承認', '特許']]
+    + [('urgency', keyword, keyword, 'all', 1) for keyword in [
+        '今なら', '限定', '今だけ', '期間限定', '数量限定', '今すぐ', '1度しか', '残り', '最後']]
+    + [('cta_marker', keyword, keyword, 'cta', 1) for keyword in ['チェック', '試して', '無料']]
+    # 生成台本の品質分析用（OpenAIIntegration.analyze_generated_script）
+    + [('quality_urgency', keyword, keyword, 'all', 1) for keyword in ['今なら', '限定', '今だけ', '今すぐ', '期間限定']]
+    + [('quality_authority', keyword, keyword, 'all', 1) for keyword in ['プロデュース', '認定', '研究', '専門家', '効果']]
+    + [('quality_cta', '今すぐ', '今すぐ', 'cta', 2),
+       ('quality_cta', '無料', '無料', 'cta', 1),
+       ('quality_cta', 'チェック', 'チェック', 'cta', 1)]
+)
+
+
+def _trie_pattern(keywords):
+    """キーワード集合をトライ木の形の正規表現に変換（先頭文字で即座に分岐できる）"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != '']
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class KeywordAutomaton:
+    """複数キーワードの出現を1回の走査で求める（重なり・包含も含めて検出）"""
+
+    def __init__(self, keywords):
+        self.keywords = sorted(set(keyword for keyword in keywords if keyword))
+        self.pattern = re.compile(_trie_pattern(self.keywords)) if self.keywords else None
+        # 同じ位置から始まる短いキーワード（例: 「試して」に対する「試し」）
+        keyword_set = set(self.keywords)
+        self.prefixes = {}
+        for keyword in self.keywords:
+            prefixes = [keyword[:i] for i in range(len(keyword) - 1, 0, -1) if keyword[:i] in keyword_set]
+            if prefixes:
+                self.prefixes[keyword] = prefixes
+
+    def find(self, text):
+        """テキストに含まれるキーワードの集合を返す"""
+        if not self.pattern or not text:
+            return set()
+        # 各開始位置の最長一致を順に探す（一致の途中から始まるキーワードも検出するため1文字ずつ進める）
+        found = set()
+        add = found.add
+        search = self.pattern.search
+        match = search(text)
+        while match:
+            add(match.group())
+            match = search(text, match.start() + 1)
+        for keyword in found.intersection(self.prefixes):
+            found.update(self.prefixes[keyword])
+        return found
+
+
+class TextFeatureExtractor:
+    """辞書に基づいて台本の特徴を抽出"""
+
+    SCOPES = ('all', 'hook', 'cta')
+
+    def __init__(self, dictionary=None):
+        self.dictionary = list(dictionary if dictionary is not None else DEFAULT_FEATURE_DICTIONARY)
+        self.entries = {scope: {} for scope in self.SCOPES}  # scope -> keyword -> [(order, group, label)]
+        self.weights = {}  # (group, label) -> weight
+        for order, (group, keyword, label, scope, weight) in enumerate(self.dictionary):
+            scope = scope if scope in self.entries else 'all'
+            self.entries[scope].setdefault(keyword, []).append((order, group, label))
+            self.weights.setdefault((group, label), weight)
+        # 照合範囲ごとのキーワードオートマトン
+        self.automata = {scope: KeywordAutomaton(entries.keys()) for scope, entries in self.entries.items()}
+
+    def extract(self, hook='', main_content='', cta=''):
+        """
+        台本1件の特徴を抽出
+        戻り値の keywords は {グループ: 辞書順のラベル一覧}
+        """
+        hook = hook or ''
+        main_content = main_content or ''
+        cta = cta or ''
+        all_text = f"{hook} {main_content} {cta}"
+        texts = {'all': all_text, 'hook': hook, 'cta': cta}
+
+        # キーワードの照合（照合範囲ごとに1回の走査）
+        hits = []
+        for scope, automaton in self.automata.items():
+            entries = self.entries[scope]
+            for keyword in automaton.find(texts[scope]):
+                hits.extend(entries[keyword])
+        hits.sort()
+
+        # グループごとに辞書順でラベルをまとめる
+        keywords = {}
+        for _, group, label in hits:
+            labels = keywords.setdefault(group, [])
+            if label not in labels:
+                labels.append(label)
+
+        numbers = NUMBER_PATTERN.findall(all_text)
+        return {
+            'numbers': numbers,
+            'money_numbers': [number for number in numbers if number[-1] in MONEY_UNITS],
+            'keywords': keywords,
+            'hook_starts_with_number': bool(LEADING_DIGIT_PATTERN.match(hook)),
+            'text': all_text
+        }
+
+    def score(self, features, feature_group):
+        """検出されたラベルの加点を合計"""
+        return sum(self.weights[(feature_group, label)] for label in features['keywords'].get(feature_group, []))
+
+    def extract_many(self, scripts):
+        """(hook, main_content, cta) の列から特徴を順に抽出"""
+        for hook, main_content, cta in scripts:
+            yield self.extract(hook, main_content, cta)
+
+
+def phrase_ngrams(text, min_n=2, max_n=8):
+    """かな・漢字の連続部分から文字n-gramの集合を作成"""
+    return {
+        run[i:i + n]
+        for run in WORD_PATTERN.findall(text)
+        for n in range(min_n, min(max_n, len(run)) + 1)
+        for i in range(len(run) - n + 1)
+    }
+
+
+def prune_redundant_phrases(stats, ratio=0.9):
+    """
+    長いフレーズの一部で、ほぼ同じ台本にしか現れないフレーズを除く
+    stats: {フレーズ: (出現台本数, ...)}
+    """
+    kept = []
+    for phrase in sorted(stats, key=len, reverse=True):
+        count = stats[phrase][0]
+        if any(phrase in longer and stats[longer][0] >= count * ratio for longer in kept):
+            continue
+        kept.append(phrase)
+    return kept
+
+
+def frequent_phrases(texts, limit=15, min_count=2, min_n=2, max_n=8):
+    """複数テキストに共通する頻出フレーズ（出現テキスト数の多い順、同数なら長い順）"""
+    counts = Counter()
+    for text in texts:
+        counts.update(phrase_ngrams(text, min_n, max_n))
+    stats = {
+        phrase: (count,) for phrase, count in counts.items()
+        if count >= min_count and not HIRAGANA_ONLY_PATTERN.match(phrase)
+    }
+    phrases = prune_redundant_phrases(stats)
+    phrases.sort(key=lambda phrase: (-stats[phrase][0], -len(phrase)))
+    return phrases[:limit]
+
+
+def load_feature_dictionary(db_path):
+    """データベースから特徴辞書を取得（テーブルがない場合は初期辞書）"""
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT feature_group, keyword, label, scope, weight
+                FROM feature_dictionary
+                WHERE is_active = 1
+                ORDER BY sort_order, id
+            ''')
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        rows = []
+    return rows or list(DEFAULT_FEATURE_DICTIONARY)
+
+
+def load_feature_extractor(db_path):
+    """データベースの辞書から特徴抽出器を作成"""
+    return TextFeatureExtractor(load_feature_dictionary(db_path))
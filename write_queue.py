@@ -0,0 +1,203 @@
+"""
+SQLite 書き込みの単一ライターキュー
+
+プロセス内の書き込みを1本のライタースレッドに集め、そのスレッドだけが書き込み用の接続を持ちます。
+キューにたまった書き込みは小さなトランザクションにまとめて実行し、呼び出し元には Future を返します。
+
+- 書き込みごとにセーブポイントを切るため、1件の失敗が同じトランザクションの他の書き込みに影響しない
+- 結果（戻り値・例外）はコミット後に Future に設定する（コミットに失敗した場合はまとめて例外）
+- 別プロセスとの競合は busy_timeout で待つ
+- fork した子プロセスではライタースレッドが引き継がれないため、子プロセスで最初に書き込むときに作り直す
+
+書き込み処理は func(cursor, *args) の形で渡します。func の中でコミット・ロールバックは行いません。
+"""
+import atexit
+import multiprocessing.util
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+BUSY_TIMEOUT_MS = 5000
+_STOP = object()
+
+
+class WriteQueue:
+    """1つのデータベースファイルへの書き込みを直列化するライタースレッド"""
+
+    def __init__(self, db_path, max_batch=64, max_wait=0.002):
+        self.db_path = db_path
+        self.max_batch = max_batch  # 1トランザクションにまとめる最大件数
+        self.max_wait = max_wait  # 後続の書き込みを待つ最大秒数
+        self.closed = False
+        self.stats = {'jobs': 0, 'batches': 0, 'failed': 0}
+        self._start_lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        _register_exit_flush()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        """fork した子プロセス側: 親の未処理の書き込みは親が実行するため捨て、ライタースレッドは次の書き込みで起動する"""
+        self._start_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, func, *args):
+        """書き込み処理 func(cursor, *args) をキューに追加し、Future を返す"""
+        if self.closed:
+            raise RuntimeError("書き込みキューは終了しています")
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._start()
+        if threading.current_thread() is self._thread:
+            # 書き込み処理の中から書き込みを追加すると、自分の完了を待ち続けてしまう
+            raise RuntimeError("書き込み処理の中から書き込みキューは使用できません（渡された cursor を使用してください）")
+        future = Future()
+        self._queue.put((future, func, args))
+        return future
+
+    def execute(self, sql, params=()):
+        """SQLを1文実行し、lastrowid を返す Future"""
+        return self.submit(lambda cursor: cursor.execute(sql, params).lastrowid)
+
+    def close(self, timeout=None):
+        """キューにある書き込みを終えてからライタースレッドを終了"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._thread is None or self._pid != os.getpid():
+            return  # このプロセスではまだ書き込んでいない
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _collect(self):
+        """最初の1件を待ち、続く書き込みを上限件数・上限時間までまとめる"""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)  # トランザクションを明示的に制御する
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        try:
+            while True:
+                batch, stop = self._collect()
+                if batch:
+                    self._run_batch(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _run_batch(self, conn, batch):
+        """まとめた書き込みを1トランザクションで実行"""
+        cursor = conn.cursor()
+        outcomes = []  # (future, 戻り値, 例外)
+        started = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for future, func, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue  # 実行前に取り消された
+                started.append(future)
+                cursor.execute('SAVEPOINT write_job')
+                try:
+                    result = func(cursor, *args)
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_job')
+                    cursor.execute('RELEASE write_job')
+                    outcomes.append((future, None, e))
+                else:
+                    cursor.execute('RELEASE write_job')
+                    outcomes.append((future, result, None))
+            cursor.execute('COMMIT')
+        except Exception as e:
+            # トランザクション自体が失敗した場合は、まとめた書き込みをすべて失敗にする
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            print(f"❌ 書き込みトランザクションに失敗しました: {str(e)}")
+            for future, _, _ in batch:
+                if future not in started and not future.set_running_or_notify_cancel():
+                    continue
+                future.set_exception(e)
+            self.stats['failed'] += len(batch)
+            return
+
+        self.stats['batches'] += 1
+        self.stats['jobs'] += len(outcomes)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                self.stats['failed'] += 1
+                future.set_exception(error)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+_exit_flush_pid = None
+
+
+def _register_exit_flush():
+    """
+    multiprocessing の子プロセスは atexit を実行せずに終了するため、終了処理（Finalize）にも登録して残りの書き込みを反映する
+    （fork 直後の登録は multiprocessing が消すため、ライタースレッドの起動時にプロセスごとに1回登録する）
+    """
+    global _exit_flush_pid
+    if _exit_flush_pid != os.getpid():
+        _exit_flush_pid = os.getpid()
+        multiprocessing.util.Finalize(None, close_all, exitpriority=10)
+
+
+def get_write_queue(db_path):
+    """データベースファイルごとに1つの書き込みキュー（プロセス内で共有）"""
+    key = os.path.abspath(db_path)
+    with _queues_lock:
+        # fork 後にキューを取得した場合も、submit でこのプロセスのライタースレッドが起動する
+        write_queue = _queues.get(key)
+        if write_queue is None or write_queue.closed:
+            write_queue = _queues[key] = WriteQueue(db_path)
+        return write_queue
+
+
+@atexit.register
+def close_all():
+    """終了時にキューに残っている書き込みを反映"""
+    with _queues_lock:
+        write_queues = list(_queues.values())
+        _queues.clear()
+    for write_queue in write_queues:
+        write_queue.close(timeout=10)
+
+
+def _after_fork_in_child():
+    global _queues_lock
+    # fork の時点で他のスレッドが持っていたロックは子プロセスでは解放されない
+    _queues_lock = threading.Lock()
+    for write_queue in _queues.values():
+        write_queue._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)